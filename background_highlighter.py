@@ -0,0 +1,167 @@
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtGui import QSyntaxHighlighter
+
+
+# Block state marking a block as queued; never produced by highlightBlock
+QUEUED_STATE = -2
+
+
+def visibleBlockRange(textEdit):
+    """First and last block of a QPlainTextEdit that are at least partly visible."""
+    height = textEdit.viewport().height()
+    offset = textEdit.contentOffset()
+    first = textEdit.firstVisibleBlock()
+    last = first
+    while last.next().isValid():
+        if textEdit.blockBoundingGeometry(last).translated(offset).bottom() >= height:
+            break
+        last = last.next()
+    return first, last
+
+
+class DeferrableHighlighter(QSyntaxHighlighter):
+    """
+    Base class for highlighters that can leave blocks to a background pass.
+
+    While `frontier` is set, only blocks before it (already highlighted in order)
+    and blocks in `forcedRange` (the visible ones) are highlighted.
+    Subclasses return early from highlightBlock when isDeferred() is true.
+    """
+
+    # Names of the rules counted by a RuleProfile, by rule number
+    RULE_NAMES = []
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.frontier = None
+        self.forcedRange = None
+
+    def setRuleProfile(self, profile):
+        """Time each rule into profile (a diagnostics.RuleProfile), or stop with None."""
+
+    def isDeferred(self):
+        if self.frontier is None:
+            return False
+
+        number = self.currentBlock().blockNumber()
+        if number >= self.frontier and (self.forcedRange is None or
+                                        not self.forcedRange[0] <= number <= self.forcedRange[1]):
+            return True
+
+        if self.currentBlockState() == QUEUED_STATE:
+            self.setCurrentBlockState(-1)
+        return False
+
+    def highlightRange(self, first, last):
+        """
+        Highlight blocks first..last inclusive in a single document edit.
+
+        Each block is marked QUEUED_STATE beforehand, so highlighting always
+        changes its state and Qt carries on to the next block. It stops at the
+        first block past the range, which isDeferred() leaves untouched.
+        """
+        block = first
+        while block.isValid() and block.blockNumber() <= last.blockNumber():
+            block.setUserState(QUEUED_STATE)
+            block = block.next()
+
+        self.forcedRange = (first.blockNumber(), last.blockNumber())
+        try:
+            self.rehighlightBlock(first)
+        finally:
+            self.forcedRange = None
+
+
+class BackgroundHighlightScheduler(QObject):
+    """
+    Highlights the visible blocks of a QPlainTextEdit first, then the rest of the
+    document in time-budgeted slices on the event loop.
+    """
+
+    def __init__(self, textEdit, slice_ms=8):
+        super().__init__(textEdit)
+        self.textEdit = textEdit
+        self.slice_ms = slice_ms
+        self.slice_blocks = 100  # Adjusted after every slice to fit slice_ms
+        self.highlighter = None
+        self.blockCount = 0
+
+        self.sliceTimer = QTimer(self)
+        self.sliceTimer.setInterval(0)
+        self.sliceTimer.timeout.connect(self.highlightSlice)
+
+        self.viewportTimer = QTimer(self)
+        self.viewportTimer.setSingleShot(True)
+        self.viewportTimer.setInterval(0)
+        self.viewportTimer.timeout.connect(self.highlightViewport)
+
+    def defer(self, highlighter):
+        """Put the highlighter in deferred mode; call before the text is inserted."""
+        self.stop()
+        self.highlighter = highlighter
+        highlighter.frontier = 0
+
+    def start(self):
+        if self.highlighter is None or self.sliceTimer.isActive():
+            return
+        self.textEdit.verticalScrollBar().valueChanged.connect(self.viewportTimer.start)
+        self.textEdit.document().contentsChange.connect(self.onContentsChange)
+        self.blockCount = self.textEdit.document().blockCount()
+        self.highlightViewport()
+        self.sliceTimer.start()
+
+    def stop(self):
+        if self.highlighter is None:
+            return
+        if self.sliceTimer.isActive():
+            self.sliceTimer.stop()
+            self.viewportTimer.stop()
+            self.textEdit.verticalScrollBar().valueChanged.disconnect(self.viewportTimer.start)
+            self.textEdit.document().contentsChange.disconnect(self.onContentsChange)
+        self.highlighter.frontier = None
+        self.highlighter = None
+
+    def isRunning(self):
+        return self.highlighter is not None
+
+    def onContentsChange(self, position, charsRemoved, charsAdded):
+        # Keep the frontier on the same text when lines are added or removed above it
+        document = self.textEdit.document()
+        delta = document.blockCount() - self.blockCount
+        self.blockCount = document.blockCount()
+        if document.findBlock(position).blockNumber() < self.highlighter.frontier:
+            self.highlighter.frontier = max(0, self.highlighter.frontier + delta)
+
+        # Edits past the frontier are not highlighted by Qt; refresh what is visible
+        self.viewportTimer.start()
+
+    def highlightViewport(self):
+        if self.highlighter is None:
+            return
+        first, last = visibleBlockRange(self.textEdit)
+        if last.blockNumber() < self.highlighter.frontier:
+            return
+        if first.blockNumber() < self.highlighter.frontier:
+            first = self.textEdit.document().findBlockByNumber(self.highlighter.frontier)
+        self.highlighter.highlightRange(first, last)
+
+    def highlightSlice(self):
+        highlighter = self.highlighter
+        document = self.textEdit.document()
+        first = document.findBlockByNumber(highlighter.frontier)
+        last = document.findBlockByNumber(min(highlighter.frontier + self.slice_blocks, document.blockCount()) - 1)
+
+        started = time.perf_counter()
+        highlighter.frontier = last.blockNumber() + 1
+        highlighter.highlightRange(first, last)
+        elapsed = time.perf_counter() - started
+
+        # Size the next slice so it fits the time budget
+        done = last.blockNumber() - first.blockNumber() + 1
+        rate = done / max(elapsed, 1e-4)
+        self.slice_blocks = max(10, int(rate * self.slice_ms / 1000))
+
+        if highlighter.frontier >= document.blockCount():
+            self.stop()
@@ -0,0 +1,332 @@
+"""
+Headless benchmarks for highlighting, loading, saving, typing, scrolling and
+terminal output.
+
+Runs under the Qt offscreen platform and writes the results to a JSON file:
+
+    python benchmarks.py --output bench.json
+    python benchmarks.py --output new.json --compare bench.json
+
+With --compare, every result that is worse than the baseline by more than
+--threshold is reported, and the exit status is 1. Differences in run time
+below --noise-ms are ignored, as millisecond timings vary from run to run.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QEventLoop, QT_VERSION_STR
+from PyQt5.QtGui import QTextDocument, QTextCursor
+from PyQt5.QtWidgets import QApplication
+
+from languages import highlighterClassFor
+from large_file_viewer import LargeFileViewer
+
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+# Characters typed, and scroll positions visited, per run of the interaction benchmarks
+KEYSTROKES = 50
+SCROLL_STEPS = 50
+# Run time differences below this many milliseconds are not reported as regressions
+DEFAULT_NOISE_MS = 5
+
+PYTHON_LINES = (
+    'import os',
+    '',
+    '@decorator',
+    'class Example(Base):',
+    '    """A docstring for the example class."""',
+    '',
+    '    def method(self, value=42, name="text"):',
+    "        # A comment with 'quotes' in it",
+    '        if value > 0x1F and name != \'\':',
+    '            return [item * 2.5 for item in range(value)]',
+    '        return self.other(value, key=None)',
+    '',
+)
+
+HTML_LINES = (
+    '<!DOCTYPE html>',
+    '<html lang="en">',
+    '<head><style>body { color: #333; margin: 0 auto; }</style></head>',
+    '<!-- a comment between elements -->',
+    '<body class="main" id="content">',
+    '  <p>Some <b>bold</b> text and a <a href="https://example.com">link</a>.</p>',
+    '  <script>function f(x) { return x + 1; } // call it</script>',
+    '</body>',
+    '</html>',
+)
+
+TEXT_LINES = (
+    'Lorem ipsum dolor sit amet, consectetur adipiscing elit.',
+    'Sed do eiusmod tempor incididunt ut labore et dolore magna aliqua.',
+    '',
+    'Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris.',
+)
+
+LANGUAGES = {
+    'python': ('.py', PYTHON_LINES),
+    'html': ('.html', HTML_LINES),
+    'text': ('.txt', TEXT_LINES),
+}
+
+
+def generateText(lines, count):
+    """count lines taken in turn from lines."""
+    repeats, rest = divmod(count, len(lines))
+    return '\n'.join(lines * repeats + lines[:rest]) + '\n'
+
+
+def waitUntil(condition, timeout=600):
+    """Run the event loop until condition() is true; raises TimeoutError after timeout seconds."""
+    app = QApplication.instance()
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError('benchmark did not finish in time')
+        app.processEvents(QEventLoop.AllEvents, 50)
+
+
+class BenchmarkSuite:
+    """Runs the benchmarks over generated inputs and collects the results."""
+
+    def __init__(self, sizes=DEFAULT_SIZES, repeat=3, log=None):
+        self.sizes = sizes
+        self.repeat = repeat
+        self.log = log or (lambda message: print(message, file=sys.stderr))
+        self.results = {}
+
+    def record(self, name, value, unit, better, seconds):
+        """Store a result; seconds is the run time it was computed from, for the noise floor."""
+        self.results[name] = {'value': value, 'unit': unit, 'better': better, 'ms': seconds * 1000}
+        self.log(f'{name:<32} {value:14.1f} {unit}')
+
+    def best(self, measure):
+        """Fastest of self.repeat runs of measure(), which returns seconds."""
+        return min(measure() for _ in range(self.repeat))
+
+    def run(self, directory):
+        self.benchmarkHighlighting()
+        self.benchmarkEditor(directory)
+        self.benchmarkInteraction()
+        self.benchmarkTerminal()
+        return self.results
+
+    def benchmarkHighlighting(self):
+        for language, (extension, lines) in LANGUAGES.items():
+            highlighter_class = highlighterClassFor('bench' + extension)
+            if highlighter_class is None:
+                continue
+            for size in self.sizes:
+                document = QTextDocument()
+                document.setPlainText(generateText(lines, size))
+                highlighter = highlighter_class(None)
+
+                def measure():
+                    started = time.perf_counter()
+                    highlighter.setDocument(document)
+                    highlighter.rehighlight()
+                    elapsed = time.perf_counter() - started
+                    highlighter.setDocument(None)
+                    return elapsed
+
+                seconds = self.best(measure)
+                self.record(f'highlight.{language}.{size}', document.blockCount() / seconds, 'blocks/s', 'higher',
+                            seconds)
+
+    def benchmarkEditor(self, directory):
+        # Imported here: main.py reads style.qss from the working directory
+        from main import CodeEditor
+
+        editor = CodeEditor()
+        try:
+            for language, (extension, lines) in LANGUAGES.items():
+                for size in self.sizes:
+                    file_name = os.path.join(directory, f'bench_{size}{extension}')
+                    with open(file_name, 'w') as file:
+                        file.write(generateText(lines, size))
+                    self.benchmarkLoad(editor, file_name, f'load.{language}.{size}')
+                    self.benchmarkSave(editor, file_name, f'save.{language}.{size}')
+                    self.closeFile(editor, file_name)
+                    os.remove(file_name)
+        finally:
+            editor.close()
+
+    def benchmarkLoad(self, editor, file_name, name):
+        def measure():
+            self.closeFile(editor, file_name)
+            started = time.perf_counter()
+            editor.loadFile(file_name)
+            widget = editor.findTab(file_name)
+            # Interactive once the text is in and the tab accepts edits
+            waitUntil(lambda: not widget.isLoading())
+            return time.perf_counter() - started
+
+        seconds = self.best(measure)
+        self.record(name, seconds * 1000, 'ms', 'lower', seconds)
+
+    def benchmarkSave(self, editor, file_name, name):
+        tab = editor.findTab(file_name)
+        if isinstance(tab, LargeFileViewer):
+            return  # Opened read-only
+
+        def measure():
+            started = time.perf_counter()
+            editor.writeFile(tab, file_name)
+            waitUntil(lambda: not tab.isSaving())
+            return time.perf_counter() - started
+
+        seconds = self.best(measure)
+        self.record(name, seconds * 1000, 'ms', 'lower', seconds)
+
+    def closeFile(self, editor, file_name):
+        widget = editor.findTab(file_name)
+        if widget is not None:
+            editor.closeTab(editor.tabWidget.indexOf(widget))
+
+    def benchmarkInteraction(self):
+        """Typing and scrolling latency in a highlighted editor tab, which should not grow with the file."""
+        from document_tab import DocumentTab
+
+        app = QApplication.instance()
+        for size in self.sizes:
+            text = generateText(PYTHON_LINES, size)
+            tab = DocumentTab('bench.py')
+            tab.resize(800, 600)
+            tab.show()
+            tab.highlighter = tab.highlighters.attach(tab.document(), tab.file_path, len(text))
+            tab.setPlainText(text)
+            tab.highlighters.start()
+            # Files too large to highlight at once are finished in background slices,
+            # which would otherwise be timed as typing and scrolling
+            waitUntil(lambda: not tab.highlighters.scheduler.isRunning())
+            tab.setTextCursor(QTextCursor(tab.document().findBlockByNumber(size // 2)))
+            tab.centerCursor()
+            app.processEvents()
+
+            def measureTyping():
+                started = time.perf_counter()
+                for _ in range(KEYSTROKES):
+                    tab.insertPlainText('x')
+                    app.processEvents()  # Repaints the line, the gutter and the minimap
+                return (time.perf_counter() - started) / KEYSTROKES
+
+            scrollBar = tab.verticalScrollBar()
+
+            def measureScrolling():
+                started = time.perf_counter()
+                for step in range(SCROLL_STEPS):
+                    scrollBar.setValue(scrollBar.maximum() * step // SCROLL_STEPS)
+                    app.processEvents()
+                return (time.perf_counter() - started) / SCROLL_STEPS
+
+            typing = self.best(measureTyping)
+            self.record(f'typing.{size}', typing * 1000, 'ms/key', 'lower', typing * KEYSTROKES)
+            scrolling = self.best(measureScrolling)
+            self.record(f'scroll.{size}', scrolling * 1000, 'ms/step', 'lower', scrolling * SCROLL_STEPS)
+            tab.highlighters.detach()
+            tab.close()
+            tab.deleteLater()
+
+    def benchmarkTerminal(self):
+        from main import TerminalWidget
+
+        terminal = TerminalWidget()
+        for size in self.sizes:
+            program = f'for i in range({size}): print("output line", i, "-" * 48)'
+            arguments = [sys.executable, '-c', program]
+            if os.name == 'nt':
+                command = subprocess.list2cmdline(arguments)
+            else:
+                command = ' '.join(shlex.quote(argument) for argument in arguments)
+
+            def measure():
+                started = time.perf_counter()
+                terminal.commandLineEdit.setText(command)
+                terminal.runCommand()
+                waitUntil(lambda: not terminal.isRunning() and not terminal.pending_output)
+                return time.perf_counter() - started
+
+            seconds = self.best(measure)
+            self.record(f'terminal.{size}', size / seconds, 'lines/s', 'higher', seconds)
+        terminal.shutdown()
+        terminal.deleteLater()
+
+
+def compareResults(results, baseline, threshold, noise_ms=DEFAULT_NOISE_MS):
+    """
+    Names and relative changes of the results worse than baseline by more
+    than threshold, leaving out those whose run time moved by less than
+    noise_ms.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None or not base['value']:
+            continue
+        if 'ms' in result and 'ms' in base and abs(result['ms'] - base['ms']) < noise_ms:
+            continue
+        change = (result['value'] - base['value']) / base['value']
+        if result['better'] == 'lower':
+            change = -change
+        if change < -threshold:
+            regressions.append((name, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', default='bench_output.json', help='file the results are written to')
+    parser.add_argument('--compare', metavar='BASELINE', help='results file to check for regressions against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression (default: 0.1)')
+    parser.add_argument('--noise-ms', type=float, default=DEFAULT_NOISE_MS,
+                        help=f'run time difference ignored as noise (default: {DEFAULT_NOISE_MS})')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='input sizes, in lines')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark; the fastest is kept')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+
+    output = os.path.abspath(args.output)  # Before changing to the editor's directory
+    app = QApplication(sys.argv[:1])
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    suite = BenchmarkSuite(args.sizes, args.repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        results = suite.run(directory)
+
+    with open(output, 'w') as file:
+        json.dump({
+            'python': platform.python_version(),
+            'qt': QT_VERSION_STR,
+            'platform': platform.platform(),
+            'results': results,
+        }, file, indent=2)
+
+    if baseline is None:
+        return 0
+
+    regressions = compareResults(results, baseline, args.threshold, args.noise_ms)
+    for name, change in regressions:
+        print(f'REGRESSION {name}: {change:+.1%} against the baseline', file=sys.stderr)
+    if not regressions:
+        print('No regressions against the baseline', file=sys.stderr)
+    app.quit()
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
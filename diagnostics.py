@@ -0,0 +1,306 @@
+import json
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtWidgets import QWidget, QPlainTextEdit, QPushButton, QCheckBox, QHBoxLayout, QVBoxLayout, QFileDialog, \
+    QMessageBox
+
+
+# Main-thread event-loop delay recorded as a stall
+STALL_THRESHOLD_MS = 100
+# Stalls and load/save timings kept; older ones are dropped
+HISTORY_SIZE = 200
+
+
+class ProfiledExpression:
+    """
+    Stands in for a QRegularExpression, timing every match() call, or for a
+    compiled re pattern, timing every search() call.
+
+    With no fixed rule, the match is counted against the rule numbered by its
+    last captured group (0 when nothing matched), for combined expressions.
+    """
+
+    def __init__(self, expression, profile, rule=None):
+        self.expression = expression
+        self.profile = profile
+        self.rule = rule
+
+    def match(self, *args):
+        started = time.perf_counter()
+        match = self.expression.match(*args)
+        elapsed = time.perf_counter() - started
+        matched = match.hasMatch()
+        if self.rule is not None:
+            rule = self.rule
+        else:
+            rule = match.lastCapturedIndex() if matched else 0
+        self.profile.add(rule, elapsed, matched)
+        return match
+
+    def search(self, *args):
+        started = time.perf_counter()
+        match = self.expression.search(*args)
+        elapsed = time.perf_counter() - started
+        matched = match is not None
+        if self.rule is not None:
+            rule = self.rule
+        else:
+            rule = (match.lastindex or 0) if matched else 0
+        self.profile.add(rule, elapsed, matched)
+        return match
+
+
+class RuleProfile:
+    """Calls, matches and time spent in each rule of one highlighter class."""
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = [0] * len(names)
+        self.matches = [0] * len(names)
+        self.seconds = [0.0] * len(names)
+
+    def add(self, rule, seconds, matched):
+        self.calls[rule] += 1
+        self.matches[rule] += matched
+        self.seconds[rule] += seconds
+
+    def rows(self):
+        """(name, calls, matches, seconds) per rule, slowest first."""
+        rows = zip(self.names, self.calls, self.matches, self.seconds)
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+class StallDetector(QObject):
+    """
+    Measures how late a main-thread timer fires to find event-loop stalls.
+
+    A watcher thread notices a heartbeat that is overdue and takes the main
+    thread's stack at that moment, so a stall is recorded with the code that
+    was running while the loop was blocked.
+    """
+
+    def __init__(self, record, threshold_ms=STALL_THRESHOLD_MS, parent=None):
+        super().__init__(parent)
+        self.record = record
+        self.threshold = threshold_ms / 1000
+        self.interval = self.threshold / 4
+        self.mainThreadId = threading.get_ident()
+        self.lock = threading.Lock()
+        self.lastBeat = time.perf_counter()
+        self.stack = None  # Taken by the watcher during the current stall
+        self.stopped = threading.Event()
+
+        self.heartbeat = QTimer(self)
+        self.heartbeat.setInterval(int(self.interval * 1000))
+        self.heartbeat.timeout.connect(self.beat)
+        self.watcher = threading.Thread(target=self.watch, name='stall-watcher', daemon=True)
+
+    def start(self):
+        self.lastBeat = time.perf_counter()
+        self.heartbeat.start()
+        self.watcher.start()
+
+    def stop(self):
+        self.heartbeat.stop()
+        self.stopped.set()
+
+    def beat(self):
+        now = time.perf_counter()
+        with self.lock:
+            delay = now - self.lastBeat - self.interval
+            stack, self.stack = self.stack, None
+            self.lastBeat = now
+        if delay >= self.threshold:
+            self.record(delay, stack)
+
+    def watch(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                if self.stack is not None or time.perf_counter() - self.lastBeat < self.threshold:
+                    continue
+                frame = sys._current_frames().get(self.mainThreadId)
+                self.stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+
+
+class Diagnostics:
+    """
+    Optional performance instrumentation: event-loop stalls, per-rule
+    highlighter timings and load/save durations.
+
+    Disabled by default; every hook returns at once while it is off, and
+    highlighters only swap in profiled expressions while it is on.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stallDetector = None
+        self.stalls = deque(maxlen=HISTORY_SIZE)
+        self.operations = deque(maxlen=HISTORY_SIZE)
+        self.ruleProfiles = {}  # Highlighter class name -> RuleProfile
+        self.highlighters = weakref.WeakSet()
+
+    def setEnabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        if enabled:
+            self.stallDetector = StallDetector(self.recordStall)
+            self.stallDetector.start()
+        else:
+            self.stallDetector.stop()
+            self.stallDetector.deleteLater()
+            self.stallDetector = None
+        for highlighter in self.highlighters:
+            self.profileHighlighter(highlighter)
+
+    def clear(self):
+        self.stalls.clear()
+        self.operations.clear()
+        self.ruleProfiles.clear()
+        for highlighter in self.highlighters:
+            self.profileHighlighter(highlighter)
+
+    def recordStall(self, seconds, stack):
+        self.stalls.append({'time': time.time(), 'ms': seconds * 1000, 'stack': stack or ''})
+
+    def watchHighlighter(self, highlighter):
+        """Keep the highlighter's rule profiling in step with the enabled state."""
+        self.highlighters.add(highlighter)
+        self.profileHighlighter(highlighter)
+
+    def profileHighlighter(self, highlighter):
+        if not self.enabled:
+            highlighter.setRuleProfile(None)
+            return
+        name = type(highlighter).__name__
+        profile = self.ruleProfiles.get(name)
+        if profile is None:
+            profile = self.ruleProfiles[name] = RuleProfile(highlighter.RULE_NAMES)
+        highlighter.setRuleProfile(profile)
+
+    def begin(self, kind, label):
+        """Start timing an operation; pass the result to end(). Returns None while disabled."""
+        if not self.enabled:
+            return None
+        return kind, label, time.perf_counter()
+
+    def end(self, operation, ok=True):
+        if operation is None:
+            return
+        kind, label, started = operation
+        self.operations.append({'time': time.time(), 'kind': kind, 'label': label,
+                                'ms': (time.perf_counter() - started) * 1000, 'ok': ok})
+
+    def snapshot(self):
+        """Everything recorded so far, as plain data."""
+        return {
+            'stalls': list(self.stalls),
+            'operations': list(self.operations),
+            'highlighters': {
+                name: [{'rule': rule, 'calls': calls, 'matches': matches, 'ms': seconds * 1000}
+                       for rule, calls, matches, seconds in profile.rows()]
+                for name, profile in self.ruleProfiles.items()
+            },
+        }
+
+    def dump(self, file_name):
+        with open(file_name, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    def report(self):
+        """A readable summary for the diagnostics panel."""
+        lines = [f'Stalls over {STALL_THRESHOLD_MS} ms: {len(self.stalls)}']
+        for stall in list(self.stalls)[-5:]:
+            lines.append(f'  {stall["ms"]:8.1f} ms')
+            lines += ['      ' + line for line in stall['stack'].rstrip().splitlines()[-6:]]
+
+        lines.append('')
+        lines.append('Loads and saves:')
+        for operation in list(self.operations)[-20:]:
+            status = '' if operation['ok'] else ' (failed)'
+            lines.append(f'  {operation["kind"]:<5} {operation["ms"]:8.1f} ms  {operation["label"]}{status}')
+
+        for name, profile in self.ruleProfiles.items():
+            lines.append('')
+            lines.append(f'{name}:')
+            for rule, calls, matches, seconds in profile.rows():
+                lines.append(f'  {rule:<24} {seconds * 1000:8.1f} ms {calls:9} calls {matches:9} matches')
+        return '\n'.join(lines)
+
+
+# Shared by the editor, the loaders, the savers and the highlighters
+diagnostics = Diagnostics()
+
+
+class DiagnosticsPanel(QWidget):
+    """Shows what the instrumentation has recorded, refreshed while visible."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.enabledCheckBox = QCheckBox('Record', self)
+        self.enabledCheckBox.setChecked(diagnostics.enabled)
+        self.enabledCheckBox.toggled.connect(self.setRecording)
+
+        self.clearButton = QPushButton('Clear', self)
+        self.clearButton.clicked.connect(self.clear)
+
+        self.dumpButton = QPushButton('Dump...', self)
+        self.dumpButton.clicked.connect(self.dump)
+
+        self.reportView = QPlainTextEdit(self)
+        self.reportView.setReadOnly(True)
+        self.reportView.setLineWrapMode(QPlainTextEdit.NoWrap)
+
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setInterval(1000)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+        buttonLayout = QHBoxLayout()
+        buttonLayout.addWidget(self.enabledCheckBox)
+        buttonLayout.addStretch()
+        buttonLayout.addWidget(self.clearButton)
+        buttonLayout.addWidget(self.dumpButton)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(buttonLayout)
+        layout.addWidget(self.reportView)
+
+    def setRecording(self, enabled):
+        diagnostics.setEnabled(enabled)
+        self.refresh()
+
+    def showEvent(self, event):
+        self.enabledCheckBox.setChecked(diagnostics.enabled)
+        self.refresh()
+        self.refreshTimer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refreshTimer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        scroll = self.reportView.verticalScrollBar().value()
+        self.reportView.setPlainText(diagnostics.report())
+        self.reportView.verticalScrollBar().setValue(scroll)
+
+    def clear(self):
+        diagnostics.clear()
+        self.refresh()
+
+    def dump(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, "Dump Diagnostics", "diagnostics.json",
+                                                   "JSON Files (*.json);;All Files (*)")
+        if not file_name:
+            return
+        try:
+            diagnostics.dump(file_name)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to write the diagnostics: {e}")
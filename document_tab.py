@@ -0,0 +1,145 @@
+from collections import OrderedDict
+
+from PyQt5.QtCore import QEvent
+from PyQt5.QtGui import QTextDocumentFragment
+from PyQt5.QtWidgets import QPlainTextEdit
+
+from editor_margins import LineNumberGutter, Minimap
+from languages import HighlighterManager
+
+
+# Text kept in memory by background tabs before the least recently used are unloaded
+DOCUMENT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+
+class DocumentTab(QPlainTextEdit):
+    """
+    An editor tab: one document, its highlighter and the file it came from.
+
+    Lines are not wrapped, so every block is one line of the same height and
+    only the blocks scrolled into view are ever laid out. Pasted content is
+    inserted as plain text.
+
+    A clean tab can be unloaded to free its text; the cursor and scroll
+    position are kept so the tab looks the same once it is loaded again.
+    """
+
+    def __init__(self, file_path=None, parent=None):
+        super().__init__(parent)
+        self.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.file_path = file_path
+        self.highlighters = HighlighterManager(self)
+        self.highlighter = None  # Highlighter attached to the document, if any
+        self.documentLoader = None  # DocumentLoader filling the document, if any
+        self.fileSaver = None  # FileSaver writing the document, if a save is in progress
+        self.pendingSave = None  # File name to save again once the running save is done
+        self.journal = None  # EditJournal recording edits since the last save, once loaded
+        self.fileReloader = None  # FileReloader diffing the file after it changed on disk, if any
+        self.diskStat = None  # fileStat() of the file when it was last loaded, saved or reloaded
+        self.unloaded = False
+        self.savedPosition = (0, 0)  # Cursor position and scroll value while unloaded
+        self.pendingLine = None  # Line (1-based) to show once loading finishes
+        self.editCount = 0  # Changes to the text; unlike revision(), highlighting leaves it alone
+
+        self.document().contentsChange.connect(self.onContentsChange)
+
+        self.minimap = Minimap(self)
+        self.gutter = LineNumberGutter(self)
+        self.gutter.updateWidth()  # Sets the viewport margins
+
+    def updateMargins(self):
+        """Make room for the gutter and the minimap beside the viewport."""
+        self.setViewportMargins(self.gutter.gutterWidth, 0, self.minimap.width(), 0)
+        self.layoutMargins()
+
+    def layoutMargins(self):
+        viewport = self.viewport().geometry()
+        self.gutter.setGeometry(viewport.left() - self.gutter.gutterWidth, viewport.top(),
+                                self.gutter.gutterWidth, viewport.height())
+        self.minimap.setGeometry(viewport.right() + 1, viewport.top(), self.minimap.width(), viewport.height())
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.layoutMargins()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.FontChange:
+            self.gutter.updateWidth(force=True)
+
+    def onContentsChange(self, position, removed, added):
+        if removed or added:
+            self.editCount += 1
+
+    def canInsertFromMimeData(self, source):
+        return source.hasText() or source.hasHtml()
+
+    def insertFromMimeData(self, source):
+        # Markup copied from a browser or a word processor is reduced to its text
+        if source.hasText():
+            text = source.text()
+        else:
+            text = QTextDocumentFragment.fromHtml(source.html()).toPlainText()
+        self.textCursor().insertText(text.replace('\r\n', '\n').replace('\r', '\n'))
+        self.ensureCursorVisible()
+
+    def isLoading(self):
+        return self.documentLoader is not None
+
+    def isSaving(self):
+        return self.fileSaver is not None
+
+    def memoryCost(self):
+        # Qt stores the text as UTF-16
+        return 0 if self.unloaded else self.document().characterCount() * 2
+
+    def canUnload(self):
+        return (self.file_path is not None and not self.unloaded and not self.isLoading()
+                and not self.isSaving() and not self.document().isModified())
+
+    def discardJournal(self):
+        if self.journal is not None:
+            self.journal.discard()
+            self.journal = None
+
+    def unload(self):
+        self.discardJournal()
+        self.savedPosition = (self.textCursor().position(), self.verticalScrollBar().value())
+        self.highlighters.detach()
+        self.highlighter = None
+        self.clear()
+        self.document().setModified(False)
+        self.unloaded = True
+
+
+class DocumentCache:
+    """
+    Least-recently-used order of the open tabs.
+
+    enforce() unloads clean background tabs, oldest first, until the text
+    kept in memory fits the budget.
+    """
+
+    def __init__(self, budget=DOCUMENT_MEMORY_BUDGET):
+        self.budget = budget
+        self.tabs = OrderedDict()
+
+    def touch(self, tab):
+        self.tabs[tab] = None
+        self.tabs.move_to_end(tab)
+
+    def remove(self, tab):
+        self.tabs.pop(tab, None)
+
+    def enforce(self, current):
+        """Unload tabs until the budget is met; returns the tabs that were unloaded."""
+        unloaded = []
+        used = sum(tab.memoryCost() for tab in self.tabs)
+        for tab in list(self.tabs):
+            if used <= self.budget:
+                break
+            if tab is not current and tab.canUnload():
+                used -= tab.memoryCost()
+                tab.unload()
+                unloaded.append(tab)
+        return unloaded
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import queue
+import weakref
+
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QTextCursor
+
+from file_saver import writeFileAtomically
+
+
+# Bump when the on-disk format changes; older journals are ignored
+JOURNAL_VERSION = 1
+# Edits are handed to the writer thread at most this often
+FLUSH_INTERVAL_MS = 1000
+# A journal is compacted into a snapshot of the document once it is larger
+# than this and than twice the document (or its last snapshot, if larger)
+COMPACT_MIN_BYTES = 1024 * 1024
+
+# Journals with edits not yet handed to the writer, flushed by flushJournals()
+openJournals = weakref.WeakSet()
+
+
+def journalPath(file_path):
+    """Where the journal of the document opened from file_path is kept."""
+    state_home = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    digest = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(state_home, 'knoblauch_editor', 'journal', f'{digest}.journal')
+
+
+def journalHeader(file_path):
+    """Identifies the file on disk that the journalled edits apply to."""
+    stat = os.stat(file_path)
+    return {'version': JOURNAL_VERSION, 'path': os.path.abspath(file_path),
+            'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def encodedSize(lines):
+    """Bytes that journal lines take on disk."""
+    return sum(len(line.encode('utf-8')) for line in lines)
+
+
+def readJournal(file_path):
+    """
+    The edits journalled for file_path as [position, removed, inserted]
+    records, or None if there are none that still apply to the file on disk.
+
+    A record with removed == -1 is a snapshot that replaces the whole
+    document. Reading stops at the first damaged line, which is where a
+    crash interrupted a write.
+    """
+    try:
+        with open(journalPath(file_path), 'r') as file:
+            header = json.loads(file.readline())
+            records = []
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+    except (OSError, ValueError):
+        return None
+
+    if not records or header.get('version') != JOURNAL_VERSION:
+        return None
+    if records[0][1] != -1:
+        # Plain edits only make sense on the exact file they were made to
+        try:
+            if journalHeader(file_path) != header:
+                return None
+        except OSError:
+            return None
+    return records
+
+
+def replayJournal(document, records):
+    """Apply journalled edits to document as one undoable step."""
+    cursor = QTextCursor(document)
+    cursor.beginEditBlock()
+    for position, removed, inserted in records:
+        end = document.characterCount() - 1
+        if removed == -1:
+            position, removed = 0, end
+        position = min(position, end)
+        cursor.setPosition(position)
+        cursor.setPosition(min(position + removed, end), QTextCursor.KeepAnchor)
+        cursor.insertText(inserted)
+    cursor.endEditBlock()
+
+
+class JournalWriter(QThread):
+    """
+    Writes journal batches on a worker thread, one queued operation at a
+    time, so a journal's appends, rewrites and removal land in order.
+    """
+
+    writeFailed = pyqtSignal(str)  # Error message
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.operations = queue.Queue()
+
+    def append(self, path, header, lines):
+        self.operations.put((self.writeAppend, path, header, lines))
+
+    def rewrite(self, path, header, lines):
+        self.operations.put((self.writeRewrite, path, header, lines))
+
+    def remove(self, path):
+        self.operations.put((self.writeRemove, path))
+
+    def shutdown(self):
+        """Finish the queued writes, then stop."""
+        self.operations.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            operation = self.operations.get()
+            if operation is None:
+                return
+            write, *args = operation
+            try:
+                write(*args)
+            except OSError as e:
+                self.writeFailed.emit(str(e))
+
+    @staticmethod
+    def writeAppend(path, header, lines):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as file:
+            if file.tell() == 0:
+                file.write(json.dumps(header) + '\n')
+            file.write(''.join(lines))
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def writeRewrite(path, header, lines):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        writeFileAtomically(path, json.dumps(header) + '\n' + ''.join(lines))
+
+    @staticmethod
+    def writeRemove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class EditJournal(QObject):
+    """
+    Records every edit to a document opened from a file, so unsaved work can
+    be replayed onto the file after a crash.
+
+    Each change is kept as (position, removed length, inserted text), which
+    costs the same whatever the size of the document; consecutive typing is
+    merged into one record. Records are batched and appended to the journal
+    by the JournalWriter. Once the journal outgrows the document it is
+    rewritten as a single snapshot, so that copy is paid for by the edits
+    that made the journal grow.
+    """
+
+    def __init__(self, document, file_path, writer, parent=None):
+        super().__init__(parent)
+        self.document = document
+        self.writer = writer
+        self.path = journalPath(file_path)
+        self.header = journalHeader(file_path)
+        self.pending = []  # Records not yet handed to the writer
+        self.pendingEnd = None  # Document position just after the last pending record's text
+        self.written = 0  # Bytes in the journal file
+        self.snapshotSize = 0  # Bytes of the snapshot the journal was last compacted to
+        self.sinceSave = None  # Records made after the snapshot of a running save
+
+        self.flushTimer = QTimer(self)
+        self.flushTimer.setSingleShot(True)
+        self.flushTimer.setInterval(FLUSH_INTERVAL_MS)
+        self.flushTimer.timeout.connect(self.flush)
+
+        document.contentsChange.connect(self.onContentsChange)
+        openJournals.add(self)
+
+    def resume(self, records):
+        """Continue a recovered journal, whose records are already on disk."""
+        lines = [json.dumps(record) + '\n' for record in records]
+        self.written = encodedSize(lines)
+        self.snapshotSize = encodedSize(lines[:1]) if records[0][1] == -1 else 0
+
+    def onContentsChange(self, position, removed, added):
+        if removed == 0 and added == 0:
+            return
+        inserted = ''
+        if added:
+            cursor = QTextCursor(self.document)
+            cursor.setPosition(position)
+            # Qt can report a change running past the end of the document
+            cursor.setPosition(min(position + added, self.document.characterCount() - 1), QTextCursor.KeepAnchor)
+            inserted = cursor.selectedText().replace('\u2029', '\n')  # Qt's paragraph separator
+        record = [position, removed, inserted]
+        if self.sinceSave is not None:
+            self.sinceSave.append(record)
+
+        if self.pending and removed == 0 and position == self.pendingEnd:
+            self.pending[-1][2] += inserted
+        else:
+            self.pending.append(list(record))
+        self.pendingEnd = position + added
+        if not self.flushTimer.isActive():
+            self.flushTimer.start()
+
+    def flush(self):
+        self.flushTimer.stop()
+        if not self.pending:
+            return
+        # Compared with the last snapshot too, as JSON escapes make a snapshot of
+        # non-ASCII text larger than twice its character count
+        if self.written > COMPACT_MIN_BYTES and self.written > 2 * max(self.snapshotSize,
+                                                                        self.document.characterCount()):
+            self.compact()
+            return
+        lines = [json.dumps(record) + '\n' for record in self.pending]
+        self.pending = []
+        self.written += encodedSize(lines)
+        self.writer.append(self.path, self.header, lines)
+
+    def compact(self):
+        """Replace the journal with one snapshot of the document."""
+        line = json.dumps([0, -1, self.document.toPlainText()]) + '\n'
+        self.pending = []
+        self.written = self.snapshotSize = encodedSize([line])
+        self.writer.rewrite(self.path, self.header, [line])
+
+    def beginSave(self):
+        """The document is being saved as it is now; keep the edits made from here on."""
+        self.flush()
+        self.sinceSave = []
+
+    def saveFinished(self, file_path, ok):
+        """
+        After a successful save, start the journal over from the saved file
+        with only the edits made while it was written.
+        """
+        records, self.sinceSave = self.sinceSave, None
+        if ok and records is not None:
+            self.restart(file_path, records)
+
+    def restart(self, file_path, records=()):
+        """Start the journal over from file_path as it is on disk now, followed by records."""
+        old_path = self.path
+        self.path = journalPath(file_path)
+        if old_path != self.path:
+            self.writer.remove(old_path)
+        try:
+            self.header = journalHeader(file_path)
+        except OSError:
+            return
+        self.pending = []
+        lines = [json.dumps(record) + '\n' for record in records]
+        self.written = encodedSize(lines)
+        self.snapshotSize = 0
+        if lines:
+            self.writer.rewrite(self.path, self.header, lines)
+        else:
+            self.writer.remove(self.path)
+
+    def discard(self):
+        """Stop recording and delete the journal, once the edits are saved or thrown away."""
+        self.document.contentsChange.disconnect(self.onContentsChange)
+        openJournals.discard(self)
+        self.flushTimer.stop()
+        self.pending = []
+        self.sinceSave = None
+        self.writer.remove(self.path)
+
+
+def flushJournals():
+    """Hand every journal's pending edits to its writer, such as before a crash."""
+    for journal in list(openJournals):
+        journal.flush()
@@ -0,0 +1,205 @@
+import re
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QPainter, QImage, QColor, QPalette
+from PyQt5.QtWidgets import QWidget
+
+
+# Space around the line numbers, in pixels
+GUTTER_PADDING = 8
+# Digits the gutter always has room for, so it does not resize in small files
+MIN_GUTTER_DIGITS = 3
+
+# Minimap scale: pixels per line, and columns drawn (one pixel each)
+MINIMAP_LINE_PX = 2
+MINIMAP_COLUMNS = 100
+# Lines rendered into each cached minimap tile
+TILE_LINES = 256
+# Tiles kept; the least recently painted are dropped first
+MAX_CACHED_TILES = 32
+# Spaces per tab in the minimap
+MINIMAP_TAB_WIDTH = 4
+
+WORD_EXPRESSION = re.compile(r'\S+')
+
+
+class LineNumberGutter(QWidget):
+    """
+    Line numbers to the left of an editor's viewport.
+
+    Only the blocks inside the repainted rectangle are drawn. The width
+    depends on the number of digits alone, so it is measured again only
+    when the line count gains or loses a digit or the font changes.
+    """
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        self.digits = 0
+        self.gutterWidth = 0
+        self.currentLine = -1  # Block number drawn as the cursor's line
+
+        editor.blockCountChanged.connect(lambda: self.updateWidth())  # Not passing the count as force
+        editor.updateRequest.connect(self.onUpdateRequest)
+        editor.cursorPositionChanged.connect(self.onCursorPositionChanged)
+
+    def updateWidth(self, force=False):
+        digits = max(MIN_GUTTER_DIGITS, len(str(self.editor.blockCount())))
+        if digits == self.digits and not force:
+            return
+        self.digits = digits
+        self.gutterWidth = 2 * GUTTER_PADDING + self.editor.fontMetrics().width('9') * digits
+        self.editor.updateMargins()
+
+    def onUpdateRequest(self, rect, dy):
+        if dy:
+            self.scroll(0, dy)
+        else:
+            self.update(0, rect.y(), self.width(), rect.height())
+
+    def onCursorPositionChanged(self):
+        line = self.editor.textCursor().blockNumber()
+        if line != self.currentLine:
+            self.currentLine = line
+            self.update()
+
+    def paintEvent(self, event):
+        editor = self.editor
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), self.palette().color(QPalette.Window))
+        painter.setFont(editor.font())
+
+        text = self.palette().color(QPalette.WindowText)
+        dimmed = QColor(text)
+        dimmed.setAlpha(110)
+        width = self.width() - GUTTER_PADDING
+        height = editor.fontMetrics().height()
+
+        block = editor.firstVisibleBlock()
+        top = round(editor.blockBoundingGeometry(block).translated(editor.contentOffset()).top())
+        while block.isValid() and top <= event.rect().bottom():
+            bottom = top + round(editor.blockBoundingRect(block).height())
+            if block.isVisible() and bottom >= event.rect().top():
+                number = block.blockNumber()
+                painter.setPen(text if number == self.currentLine else dimmed)
+                painter.drawText(0, top, width, height, Qt.AlignRight, str(number + 1))
+            block = block.next()
+            top = bottom
+
+
+class Minimap(QWidget):
+    """
+    Overview of the whole document to the right of an editor's viewport.
+
+    Lines are drawn as bars for their words into tiles of TILE_LINES lines,
+    which are cached. An edit drops only the tiles of the blocks it touched,
+    or every tile after it when lines were added or removed; tiles are
+    rendered again when they are next painted, so only visible ones are
+    ever drawn. Clicking or dragging scrolls the editor.
+    """
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        self.tiles = OrderedDict()  # Tile number -> QImage
+        self.lineCount = editor.blockCount()
+        self.setFixedWidth(MINIMAP_COLUMNS)
+        self.setCursor(Qt.PointingHandCursor)
+
+        # Repaint at most once per frame while scrolling or typing
+        self.updateTimer = QTimer(self)
+        self.updateTimer.setSingleShot(True)
+        self.updateTimer.setInterval(16)
+        self.updateTimer.timeout.connect(self.update)
+
+        editor.document().contentsChange.connect(self.onContentsChange)
+        editor.verticalScrollBar().valueChanged.connect(self.scheduleUpdate)
+
+    def scheduleUpdate(self):
+        if not self.updateTimer.isActive():
+            self.updateTimer.start()
+
+    def onContentsChange(self, position, removed, added):
+        document = self.editor.document()
+        first = document.findBlock(position).blockNumber() // TILE_LINES
+        if document.blockCount() != self.lineCount:
+            # Lines moved up or down: every tile from the edit on is out of date
+            self.lineCount = document.blockCount()
+            stale = [tile for tile in self.tiles if tile >= first]
+        else:
+            end = min(position + added, document.characterCount() - 1)
+            last = document.findBlock(end).blockNumber() // TILE_LINES
+            stale = [tile for tile in self.tiles if first <= tile <= last]
+        for tile in stale:
+            del self.tiles[tile]
+        self.scheduleUpdate()
+
+    def visibleLines(self):
+        """Lines the editor's viewport shows."""
+        return max(1, self.editor.viewport().height() // max(1, self.editor.fontMetrics().height()))
+
+    def firstLine(self):
+        """Line at the top of the minimap, which moves with the editor when the document does not fit."""
+        total = self.editor.blockCount()
+        shown = self.height() // MINIMAP_LINE_PX
+        if total <= shown:
+            return 0
+        first = self.editor.firstVisibleBlock().blockNumber()
+        scrollable = max(1, total - self.visibleLines())
+        return round(min(1.0, first / scrollable) * (total - shown))
+
+    def tile(self, number):
+        image = self.tiles.get(number)
+        if image is None:
+            image = self.renderTile(number)
+            self.tiles[number] = image
+            if len(self.tiles) > MAX_CACHED_TILES:
+                self.tiles.popitem(last=False)
+        else:
+            self.tiles.move_to_end(number)
+        return image
+
+    def renderTile(self, number):
+        image = QImage(MINIMAP_COLUMNS, TILE_LINES * MINIMAP_LINE_PX, QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        color = self.palette().color(QPalette.WindowText)
+        color.setAlpha(140)
+
+        painter = QPainter(image)
+        block = self.editor.document().findBlockByNumber(number * TILE_LINES)
+        y = 0
+        while block.isValid() and y < image.height():
+            # Only the columns that fit are looked at, however long the line
+            text = block.text()[:MINIMAP_COLUMNS].expandtabs(MINIMAP_TAB_WIDTH)[:MINIMAP_COLUMNS]
+            for word in WORD_EXPRESSION.finditer(text):
+                painter.fillRect(word.start(), y, word.end() - word.start(), MINIMAP_LINE_PX - 1, color)
+            block = block.next()
+            y += MINIMAP_LINE_PX
+        painter.end()
+        return image
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), self.palette().color(QPalette.Window))
+
+        first = self.firstLine()
+        last = min(self.editor.blockCount(), first + self.height() // MINIMAP_LINE_PX + 1)
+        for number in range(first // TILE_LINES, (last - 1) // TILE_LINES + 1):
+            painter.drawImage(0, (number * TILE_LINES - first) * MINIMAP_LINE_PX, self.tile(number))
+
+        # The part of the document in the editor's viewport
+        top = (self.editor.firstVisibleBlock().blockNumber() - first) * MINIMAP_LINE_PX
+        painter.fillRect(0, top, self.width(), self.visibleLines() * MINIMAP_LINE_PX, QColor(128, 128, 128, 60))
+
+    def mousePressEvent(self, event):
+        self.scrollTo(event.pos().y())
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self.scrollTo(event.pos().y())
+
+    def scrollTo(self, y):
+        """Center the editor on the line at y."""
+        line = self.firstLine() + y // MINIMAP_LINE_PX
+        self.editor.verticalScrollBar().setValue(line - self.visibleLines() // 2)
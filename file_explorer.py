@@ -0,0 +1,448 @@
+import os
+import re
+from bisect import bisect_left
+
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex, QFileSystemWatcher, QTimer
+from PyQt5.QtWidgets import QFileIconProvider
+
+from trigram_index import EXCLUDED_DIRECTORIES
+
+
+# Patterns (in .gitignore syntax) hidden from the explorer in every project
+DEFAULT_EXCLUDES = sorted(name + '/' for name in EXCLUDED_DIRECTORIES)
+# Rows added to the view per fetchMore(), so a huge directory fills in as it is scrolled
+FETCH_BATCH = 500
+# Expanded directories watched for changes; others refresh when expanded again
+MAX_WATCHED_DIRECTORIES = 256
+# Delay before changed directories are listed again, so a burst of events is handled once
+CHANGE_DELAY_MS = 300
+
+
+def translatePattern(pattern):
+    """Regular expression for a gitignore glob, matched against a '/'-separated relative path."""
+    result = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            result += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            result += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            result += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            result += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            result += '[' + body.replace('\\', '\\\\') + ']'
+            i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            result += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            result += re.escape(pattern[i])
+            i += 1
+    return re.compile(result + r'\Z')
+
+
+def parseIgnorePatterns(lines):
+    """(regex, negated, directories_only, anchored) for each pattern in gitignore lines."""
+    patterns = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line.endswith('\\ '):
+            line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        elif line.startswith('\\'):
+            line = line[1:]  # An escaped leading '#' or '!'
+        directories_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        # A slash anywhere but at the end ties the pattern to the .gitignore's directory
+        anchored = '/' in line
+        patterns.append((translatePattern(line.lstrip('/')), negated, directories_only, anchored))
+    return patterns
+
+
+class IgnoreRules:
+    """
+    Decides which entries the explorer hides: anything matching the exclude
+    list by name, then every .gitignore from the root down to the entry's
+    directory, the last matching pattern winning. A .gitignore is read the
+    first time its directory is listed.
+    """
+
+    def __init__(self, root, excludes=DEFAULT_EXCLUDES):
+        self.root = os.path.abspath(root)
+        self.excludes = parseIgnorePatterns(excludes)
+        self.directories = {}  # Directory -> patterns of its .gitignore
+
+    def patternsFor(self, directory):
+        patterns = self.directories.get(directory)
+        if patterns is None:
+            try:
+                with open(os.path.join(directory, '.gitignore'), 'r', errors='replace') as file:
+                    patterns = parseIgnorePatterns(file)
+            except OSError:
+                patterns = []
+            self.directories[directory] = patterns
+        return patterns
+
+    def forget(self, directory):
+        """Drop the cached .gitignore of directory and of everything under it."""
+        prefix = directory + os.sep
+        for cached in [cached for cached in self.directories if cached == directory or cached.startswith(prefix)]:
+            del self.directories[cached]
+
+    def chainFor(self, directory):
+        """(directory, patterns) of every .gitignore that applies to the entries of directory."""
+        relative = os.path.relpath(directory, self.root)
+        if relative.startswith(os.pardir):
+            return []
+        chain = []
+        current = self.root
+        for part in ([] if relative == os.curdir else relative.split(os.sep)) + [None]:
+            patterns = self.patternsFor(current)
+            if patterns:
+                chain.append((current, patterns))
+            if part is not None:
+                current = os.path.join(current, part)
+        return chain
+
+    def isIgnored(self, path, is_dir, chain=None):
+        """Whether path is hidden; pass chainFor() of its directory when checking many entries."""
+        if chain is None:
+            chain = self.chainFor(os.path.dirname(path))
+        if self.matches(self.excludes, os.path.basename(path), is_dir, False):
+            return True
+        ignored = False
+        for directory, patterns in chain:
+            relative = path[len(directory) + 1:].replace(os.sep, '/')
+            result = self.matches(patterns, relative, is_dir, None)
+            if result is not None:
+                ignored = result
+        return ignored
+
+    @staticmethod
+    def matches(patterns, relative, is_dir, default):
+        """Whether the last pattern matching relative ignores it, or default if none matches."""
+        name = relative.rsplit('/', 1)[-1]
+        result = default
+        for regex, negated, directories_only, anchored in patterns:
+            if directories_only and not is_dir:
+                continue
+            if regex.match(relative if anchored else name):
+                result = not negated
+        return result
+
+
+class ExplorerNode:
+    __slots__ = ('name', 'path', 'is_dir', 'parent', 'row', 'children', 'pending')
+
+    def __init__(self, name, path, is_dir, parent, row):
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.parent = parent
+        self.row = row
+        self.children = None  # None until the directory is listed
+        self.pending = None  # Listed entries not yet handed to the view
+
+
+def sortKey(entry):
+    name, is_dir = entry
+    return not is_dir, name.casefold()
+
+
+class FileExplorerModel(QAbstractItemModel):
+    """
+    A file tree that only lists a directory when it is expanded and forgets it
+    again when it is collapsed.
+
+    Entries hidden by IgnoreRules are never listed, so ignored trees are not
+    scanned or watched. Children reach the view in batches through fetchMore(),
+    and only expanded directories are watched, up to MAX_WATCHED_DIRECTORIES.
+    """
+
+    def __init__(self, excludes=DEFAULT_EXCLUDES, parent=None):
+        super().__init__(parent)
+        self.excludes = excludes
+        self.root = None
+        self.rules = None
+        self.listed = {}  # Path -> node of every listed directory
+        self.changed = set()
+        self.iconProvider = QFileIconProvider()
+        self.folderIcon = self.iconProvider.icon(QFileIconProvider.Folder)
+        self.fileIcon = self.iconProvider.icon(QFileIconProvider.File)
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.onDirectoryChanged)
+
+        self.changeTimer = QTimer(self)
+        self.changeTimer.setSingleShot(True)
+        self.changeTimer.setInterval(CHANGE_DELAY_MS)
+        self.changeTimer.timeout.connect(self.refreshChanged)
+
+    def setRootPath(self, root_path):
+        root_path = os.path.abspath(root_path)
+        self.beginResetModel()
+        self.unwatch(list(self.listed))
+        self.listed = {}
+        self.changed = set()
+        self.rules = IgnoreRules(root_path, self.excludes)
+        self.root = ExplorerNode(os.path.basename(root_path), root_path, True, None, 0)
+        self.endResetModel()
+
+    def rootPath(self):
+        return self.root.path if self.root is not None else ''
+
+    def nodeFor(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def filePath(self, index):
+        node = self.nodeFor(index)
+        return node.path if node is not None else ''
+
+    def isDir(self, index):
+        node = self.nodeFor(index)
+        return node is not None and node.is_dir
+
+    # QAbstractItemModel
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.nodeFor(parent)
+        if node is None or node.children is None or not 0 <= row < len(node.children) or column != 0:
+            return QModelIndex()
+        return self.createIndex(row, 0, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        node = self.nodeFor(parent)
+        if node is None or node.children is None:
+            return 0
+        return len(node.children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.nodeFor(parent)
+        if node is None or not node.is_dir:
+            return False
+        # Unlisted directories are assumed to have children, so they can be expanded
+        return node.children is None or bool(node.children) or bool(node.pending)
+
+    def canFetchMore(self, parent):
+        node = self.nodeFor(parent)
+        return node is not None and node.is_dir and (node.children is None or bool(node.pending))
+
+    def fetchMore(self, parent):
+        node = self.nodeFor(parent)
+        if node is None or not node.is_dir:
+            return
+        if node.children is None:
+            node.children = []
+            node.pending = self.listDirectory(node.path)
+            self.listed[node.path] = node
+            self.watch(node.path)
+        if not node.pending:
+            return
+
+        batch, node.pending = node.pending[:FETCH_BATCH], node.pending[FETCH_BATCH:]
+        first = len(node.children)
+        self.beginInsertRows(parent, first, first + len(batch) - 1)
+        for row, (name, is_dir) in enumerate(batch, first):
+            node.children.append(ExplorerNode(name, os.path.join(node.path, name), is_dir, node, row))
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return node.name
+        if role == Qt.DecorationRole:
+            return self.folderIcon if node.is_dir else self.fileIcon
+        if role == Qt.ToolTipRole:
+            return node.path
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section == 0:
+            return 'Name'
+        return None
+
+    # Listing
+
+    def listDirectory(self, directory):
+        """(name, is_dir) of the entries of directory that are not ignored, folders first."""
+        entries = []
+        chain = self.rules.chainFor(directory)
+        try:
+            with os.scandir(directory) as iterator:
+                for entry in iterator:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not self.rules.isIgnored(entry.path, is_dir, chain):
+                        entries.append((entry.name, is_dir))
+        except OSError:
+            pass
+        entries.sort(key=sortKey)
+        return entries
+
+    def unload(self, index):
+        """Forget the children of a collapsed directory."""
+        node = self.nodeFor(index)
+        if node is None or node is self.root or node.children is None:
+            return
+        if node.children:
+            self.beginRemoveRows(index, 0, len(node.children) - 1)
+            self.forgetChildren(node)
+            node.children = []
+            self.endRemoveRows()
+        node.children = None
+        node.pending = None
+        self.unwatch([node.path])
+        self.listed.pop(node.path, None)
+        self.rules.forget(node.path)
+
+    def forgetChildren(self, node):
+        for child in node.children:
+            if child.children is not None:
+                self.forgetChildren(child)
+                self.unwatch([child.path])
+                self.listed.pop(child.path, None)
+                self.rules.forget(child.path)
+
+    def remove(self, index):
+        """Delete the file at index, if it still exists, and drop its row."""
+        node = self.nodeFor(index)
+        if node is None or node is self.root or node.is_dir:
+            return False
+        try:
+            os.remove(node.path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+        self.removeChild(node.parent, node.row)
+        return True
+
+    def removeChild(self, node, row):
+        self.removeChildren(node, row, row)
+
+    def removeChildren(self, node, first, last):
+        """Drop the rows first to last (inclusive) of node in one removal."""
+        self.beginRemoveRows(self.indexFor(node), first, last)
+        for child in node.children[first:last + 1]:
+            if child.children is not None:
+                self.forgetChildren(child)
+                self.unwatch([child.path])
+                self.listed.pop(child.path, None)
+        del node.children[first:last + 1]
+        for row, later in enumerate(node.children[first:], first):
+            later.row = row
+        self.endRemoveRows()
+
+    def insertChildren(self, node, row, entries):
+        """Insert rows for (name, is_dir) entries at row of node in one insertion."""
+        self.beginInsertRows(self.indexFor(node), row, row + len(entries) - 1)
+        node.children[row:row] = [ExplorerNode(name, os.path.join(node.path, name), is_dir, node, row)
+                                  for name, is_dir in entries]
+        for row, child in enumerate(node.children[row:], row):
+            child.row = row
+        self.endInsertRows()
+
+    def indexFor(self, node):
+        if node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    # Watching
+
+    def watch(self, path):
+        if len(self.watcher.directories()) < MAX_WATCHED_DIRECTORIES:
+            self.watcher.addPath(path)
+
+    def unwatch(self, paths):
+        watched = set(self.watcher.directories())
+        paths = [path for path in paths if path in watched]
+        if paths:
+            self.watcher.removePaths(paths)
+
+    def onDirectoryChanged(self, directory):
+        self.changed.add(directory)
+        self.changeTimer.start()
+
+    def refreshChanged(self):
+        changed, self.changed = self.changed, set()
+        for directory in sorted(changed):
+            node = self.listed.get(directory)
+            if node is not None:
+                self.refreshDirectory(node)
+
+    def refreshDirectory(self, node):
+        """List a directory again and apply the difference to its rows."""
+        if not os.path.isdir(node.path):
+            if node.parent is not None and node.parent.children is not None:
+                self.removeChild(node.parent, node.row)
+            return
+
+        self.rules.forget(node.path)
+        entries = self.listDirectory(node.path)
+        present = set(entries)
+
+        # Drop the rows that are gone, a contiguous run at a time, from the end
+        row = len(node.children)
+        while row > 0:
+            row -= 1
+            if (node.children[row].name, node.children[row].is_dir) in present:
+                continue
+            last = row
+            while row > 0 and (node.children[row - 1].name, node.children[row - 1].is_dir) not in present:
+                row -= 1
+            self.removeChildren(node, row, last)
+
+        shown = {(child.name, child.is_dir) for child in node.children}
+        added = [entry for entry in entries if entry not in shown]
+        keys = [sortKey((child.name, child.is_dir)) for child in node.children]
+        if keys:
+            # Entries past the last loaded row wait for fetchMore()
+            loaded = [entry for entry in added if sortKey(entry) < keys[-1]]
+            node.pending = added[len(loaded):]
+        else:
+            loaded, node.pending = added[:FETCH_BATCH], added[FETCH_BATCH:]
+
+        # Entries landing between the same two rows go in as one run; added is
+        # sorted, so the runs come in row order
+        runs = []
+        for entry in loaded:
+            row = bisect_left(keys, sortKey(entry))
+            if runs and runs[-1][0] == row:
+                runs[-1][1].append(entry)
+            else:
+                runs.append((row, [entry]))
+        inserted = 0
+        for row, run in runs:
+            self.insertChildren(node, row + inserted, run)
+            inserted += len(run)
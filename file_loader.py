@@ -0,0 +1,136 @@
+import os
+from collections import deque
+
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QTextCursor
+
+from diagnostics import diagnostics
+
+
+# Characters decoded and handed to the GUI thread at a time
+CHUNK_SIZE = 64 * 1024
+
+
+class FileLoader(QThread):
+    """
+    Reads and decodes a text file on a worker thread.
+
+    The text arrives through chunkLoaded in order, followed by QThread.finished.
+    Call requestInterruption() to stop reading early.
+    """
+
+    chunkLoaded = pyqtSignal(str)
+    progressChanged = pyqtSignal(int)  # Percent of the file read
+    loadFailed = pyqtSignal(str)
+
+    def __init__(self, file_name, chunk_size=CHUNK_SIZE, parent=None):
+        super().__init__(parent)
+        self.file_name = file_name
+        self.chunk_size = chunk_size
+
+    def run(self):
+        try:
+            size = os.path.getsize(self.file_name)
+            with open(self.file_name, 'r') as file:
+                while not self.isInterruptionRequested():
+                    chunk = file.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    self.chunkLoaded.emit(chunk)
+                    if size:
+                        self.progressChanged.emit(min(100, file.buffer.tell() * 100 // size))
+        except (OSError, UnicodeDecodeError) as e:
+            self.loadFailed.emit(str(e))
+
+
+class DocumentLoader(QObject):
+    """
+    Fills a QTextDocument from a FileLoader.
+
+    Chunks are queued as they arrive and appended one per event-loop pass, so
+    the GUI keeps repainting and handling input while a large file opens. The
+    appends are kept out of the undo history. The loader deletes itself once
+    the reader thread has stopped.
+    """
+
+    progressChanged = pyqtSignal(int)
+    loaded = pyqtSignal()
+    loadFailed = pyqtSignal(str)
+
+    def __init__(self, document, file_name, parent=None):
+        super().__init__(parent)
+        self.document = document
+        self.file_name = file_name
+        self.timing = None  # Load timing, while diagnostics are recording
+        self.chunks = deque()
+        self.readerDone = False
+        self.stopped = False
+
+        self.reader = FileLoader(file_name, parent=self)
+        self.reader.chunkLoaded.connect(self.onChunkLoaded)
+        self.reader.progressChanged.connect(self.progressChanged)
+        self.reader.loadFailed.connect(self.onLoadFailed)
+        self.reader.finished.connect(self.onReaderFinished)
+
+        self.insertTimer = QTimer(self)
+        self.insertTimer.setInterval(0)
+        self.insertTimer.timeout.connect(self.insertChunk)
+
+    def start(self):
+        self.timing = diagnostics.begin('load', self.file_name)
+        self.document.setUndoRedoEnabled(False)
+        self.reader.start()
+
+    def cancel(self):
+        if self.stopped:
+            return
+        self.reader.requestInterruption()
+        self.stop()
+
+    def wait(self):
+        self.reader.wait()
+
+    def stop(self):
+        self.stopped = True
+        self.chunks.clear()
+        self.insertTimer.stop()
+        self.document.setUndoRedoEnabled(True)
+        self.deleteWhenDone()
+
+    def deleteWhenDone(self):
+        if self.readerDone and not self.chunks:
+            self.deleteLater()
+
+    def onChunkLoaded(self, chunk):
+        if self.stopped:
+            return
+        self.chunks.append(chunk)
+        if not self.insertTimer.isActive():
+            self.insertTimer.start()
+
+    def insertChunk(self):
+        if self.chunks:
+            cursor = QTextCursor(self.document)
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(self.chunks.popleft())
+            return
+
+        self.insertTimer.stop()
+        if self.readerDone:
+            self.stop()
+            diagnostics.end(self.timing)
+            self.loaded.emit()
+
+    def onLoadFailed(self, message):
+        if self.stopped:
+            return
+        self.stop()
+        diagnostics.end(self.timing, ok=False)
+        self.loadFailed.emit(message)
+
+    def onReaderFinished(self):
+        self.readerDone = True
+        if self.stopped:
+            self.deleteWhenDone()
+        elif not self.insertTimer.isActive():
+            self.insertTimer.start()
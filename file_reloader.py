@@ -0,0 +1,120 @@
+import os
+from difflib import SequenceMatcher
+
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtGui import QTextCursor
+
+
+# Delay before changed files are reloaded, so a burst of writes is handled once
+RELOAD_DELAY_MS = 200
+# Lines left after trimming the common start and end beyond which the whole
+# middle is replaced in one hunk, as matching it line by line could take
+# quadratic time
+MAX_DIFF_LINES = 20000
+
+
+def fileStat(file_name):
+    """(size, modification time) of a file, or None if it is gone."""
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def splitLines(text):
+    """Lines of text, each with its newline, so that they join back into text exactly."""
+    lines = [line + '\n' for line in text.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def diffLines(old, new):
+    """(start, end, lines) hunks replacing old[start:end] with lines that turn old into new."""
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    old_middle = old[prefix:len(old) - suffix]
+    new_middle = new[prefix:len(new) - suffix]
+    if not old_middle and not new_middle:
+        return []
+    if len(old_middle) > MAX_DIFF_LINES or len(new_middle) > MAX_DIFF_LINES:
+        return [(prefix, len(old) - suffix, new_middle)]
+
+    matcher = SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+    return [(prefix + i1, prefix + i2, new_middle[j1:j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def utf16Length(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
+def textHunks(old_text, new_text):
+    """
+    Changes turning old_text into new_text, as (start, end, replacement)
+    hunks in document positions (UTF-16 code units), in order.
+    """
+    old = splitLines(old_text)
+    hunks = []
+    position = 0  # Document position of old[line]
+    line = 0
+    for start, end, lines in diffLines(old, splitLines(new_text)):
+        position += utf16Length(''.join(old[line:start]))
+        length = utf16Length(''.join(old[start:end]))
+        hunks.append((position, position + length, ''.join(lines)))
+        position += length
+        line = end
+    return hunks
+
+
+def applyHunks(editor, hunks):
+    """
+    Apply hunks from textHunks() to an editor's document as one undoable
+    edit. Qt moves the cursor along with the text around it, and the scroll
+    position is put back, so the view stays where it was.
+    """
+    scroll = editor.verticalScrollBar().value(), editor.horizontalScrollBar().value()
+    cursor = QTextCursor(editor.document())
+    cursor.beginEditBlock()
+    # Last first, so the positions of the hunks still to apply do not move
+    for start, end, text in reversed(hunks):
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        cursor.insertText(text)
+    cursor.endEditBlock()
+    editor.verticalScrollBar().setValue(scroll[0])
+    editor.horizontalScrollBar().setValue(scroll[1])
+
+
+class FileReloader(QThread):
+    """
+    Reads a file that changed on disk and diffs it against a snapshot of its
+    document on a worker thread, so only the changed lines need replacing.
+    """
+
+    reloaded = pyqtSignal(list, object)  # Hunks from textHunks(), fileStat() of the text read
+    reloadFailed = pyqtSignal(str)
+
+    def __init__(self, file_name, text, parent=None):
+        super().__init__(parent)
+        self.file_name = file_name
+        self.text = text
+
+    def run(self):
+        try:
+            stat = fileStat(self.file_name)
+            with open(self.file_name, 'r') as file:
+                new_text = file.read()
+        except (OSError, UnicodeDecodeError) as e:
+            self.reloadFailed.emit(str(e))
+        else:
+            self.reloaded.emit(textHunks(self.text, new_text), stat)
+        finally:
+            self.text = None
@@ -0,0 +1,76 @@
+import os
+import tempfile
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from diagnostics import diagnostics
+
+
+def readUmask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Permissions of newly created files, as open() would give them. Reading the
+# umask means briefly changing it, so it is read once, at import
+NEW_FILE_MODE = 0o666 & ~readUmask()
+
+
+def writeFileAtomically(file_name, text):
+    """
+    Write text next to file_name in a temporary file, then rename it over the
+    original, so a crash mid-write never leaves a truncated file behind.
+
+    A symlink is followed, so the file it points to is replaced rather than
+    the link.
+    """
+    file_name = os.path.realpath(file_name)
+    directory = os.path.dirname(file_name)
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(file_name) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+
+        # Keep the permissions of the file being replaced; mkstemp() creates 0600
+        try:
+            mode = os.stat(file_name).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = NEW_FILE_MODE
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, file_name)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class FileSaver(QThread):
+    """Writes a snapshot of a document on a worker thread."""
+
+    saved = pyqtSignal(str)  # File name
+    saveFailed = pyqtSignal(str, str)  # File name, error message
+
+    def __init__(self, file_name, text, parent=None):
+        super().__init__(parent)
+        self.file_name = file_name
+        self.text = text
+        self.error = None
+
+    def run(self):
+        timing = diagnostics.begin('save', self.file_name)
+        try:
+            writeFileAtomically(self.file_name, self.text)
+        except (OSError, UnicodeEncodeError) as e:
+            self.error = str(e)
+            diagnostics.end(timing, ok=False)
+            self.saveFailed.emit(self.file_name, self.error)
+        else:
+            diagnostics.end(timing)
+            self.saved.emit(self.file_name)
+        finally:
+            self.text = None
@@ -0,0 +1,339 @@
+import os
+import re
+import time
+
+from PyQt5.QtCore import Qt, QObject, QThread, QTimer, QFileSystemWatcher, pyqtSignal
+from PyQt5.QtWidgets import QWidget, QLineEdit, QCheckBox, QLabel, QTreeWidget, QTreeWidgetItem, QVBoxLayout, \
+    QHBoxLayout
+
+from trigram_index import TrigramIndex, queryTrigrams, readText, scanDirectory, walkProject
+
+
+# Directories watched for changes; deeper trees rely on the periodic refresh
+MAX_WATCHED_DIRECTORIES = 4096
+# Full stat pass that catches edits the directory notifications do not report
+REFRESH_INTERVAL_MS = 5 * 60 * 1000
+# Delay before changed directories are re-indexed, so a burst of events is handled once
+CHANGE_DELAY_MS = 500
+MAX_RESULTS = 5000
+# Results are handed to the panel in batches at most this often
+RESULT_BATCH_SECONDS = 0.05
+
+
+class IndexBuilder(QThread):
+    """
+    Brings a TrigramIndex up to date on a worker thread.
+
+    With no directories the whole project is walked; otherwise only the given
+    directories (and any new subdirectories) are rescanned.
+    """
+
+    progressChanged = pyqtSignal(int, int)  # Files indexed, files to index
+    directoriesFound = pyqtSignal(list)
+
+    def __init__(self, index, directories=None, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.directories = directories
+
+    def run(self):
+        if self.directories is None:
+            found, directories = walkProject(self.index.root)
+            changed, removed = self.index.changedFiles(found)
+        else:
+            found, changed, removed, directories = [], [], [], []
+            for directory in self.directories:
+                if not os.path.isdir(directory):
+                    removed += self.index.pathsUnder(directory)
+                    continue
+                files, subdirectories = scanDirectory(directory)
+                directory_changed, directory_removed = self.index.changedFiles(files, under=directory)
+                found += files
+                changed += directory_changed
+                removed += directory_removed
+                for subdirectory in subdirectories:
+                    if self.index.pathsUnder(subdirectory):
+                        continue
+                    # A directory that was created or moved in
+                    subdirectory_files, subdirectory_directories = walkProject(subdirectory)
+                    found += subdirectory_files
+                    changed += [path for path, _, _ in subdirectory_files]
+                    directories += subdirectory_directories
+
+        self.directoriesFound.emit(directories)
+        for path in removed:
+            self.index.remove(path)
+
+        changed = set(changed)
+        self.index.indexFiles([entry for entry in found if entry[0] in changed],
+                              progress=self.progressChanged.emit, cancelled=self.isInterruptionRequested)
+        if self.isInterruptionRequested():
+            return
+        if self.index.needsCompaction():
+            self.index.compact()
+        if changed or removed:
+            self.index.save()
+
+
+class ProjectIndexer(QObject):
+    """
+    Keeps the trigram index of a project tree current.
+
+    The index is loaded from disk, refreshed in the background and then
+    updated as the watched directories change.
+    """
+
+    progressChanged = pyqtSignal(int, int)
+    indexUpdated = pyqtSignal()
+
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.index = TrigramIndex(root)
+        self.ready = False  # True once a full refresh has completed
+        self.builder = None
+        self.dirty_directories = set()
+        self.full_refresh_pending = False
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.onDirectoryChanged)
+
+        self.changeTimer = QTimer(self)
+        self.changeTimer.setSingleShot(True)
+        self.changeTimer.setInterval(CHANGE_DELAY_MS)
+        self.changeTimer.timeout.connect(self.startBuilder)
+
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setInterval(REFRESH_INTERVAL_MS)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+    def start(self):
+        self.index = TrigramIndex.load(self.index.root)
+        self.refresh()
+        self.refreshTimer.start()
+
+    def refresh(self):
+        self.full_refresh_pending = True
+        self.startBuilder()
+
+    def onDirectoryChanged(self, directory):
+        self.dirty_directories.add(directory)
+        if not os.path.isdir(directory):
+            self.watcher.removePath(directory)
+        self.changeTimer.start()
+
+    def startBuilder(self):
+        if self.builder is not None:
+            return  # Picked up again when the running builder finishes
+        if self.full_refresh_pending:
+            directories = None
+        elif self.dirty_directories:
+            directories = sorted(self.dirty_directories)
+        else:
+            return
+        self.full_refresh_pending = False
+        self.dirty_directories = set()
+
+        self.builder = IndexBuilder(self.index, directories, parent=self)
+        self.builder.progressChanged.connect(self.progressChanged)
+        self.builder.directoriesFound.connect(self.watchDirectories)
+        self.builder.finished.connect(self.onBuilderFinished)
+        self.builder.start()
+
+    def watchDirectories(self, directories):
+        room = MAX_WATCHED_DIRECTORIES - len(self.watcher.directories())
+        if room > 0 and directories:
+            self.watcher.addPaths(directories[:room])
+
+    def onBuilderFinished(self):
+        builder = self.builder
+        self.builder = None
+        builder.deleteLater()
+        if builder.isInterruptionRequested():
+            return
+        if builder.directories is None:
+            self.ready = True
+        self.indexUpdated.emit()
+        self.startBuilder()
+
+    def shutdown(self):
+        self.refreshTimer.stop()
+        self.changeTimer.stop()
+        if self.builder is not None:
+            self.builder.requestInterruption()
+            self.builder.wait()
+
+
+class SearchWorker(QThread):
+    """
+    Finds the lines matching a query on a worker thread.
+
+    The index narrows the search to the files that can match; those are then
+    scanned and the matches sent back in batches through resultsFound.
+    """
+
+    resultsFound = pyqtSignal(list)  # (path, line number, line text) tuples
+    searchFailed = pyqtSignal(str)
+
+    def __init__(self, indexer, query, regex=False, match_case=False, parent=None):
+        super().__init__(parent)
+        self.index = indexer.index
+        self.ready = indexer.ready
+        self.query = query
+        self.regex = regex
+        self.match_case = match_case
+        self.result_count = 0
+        self.file_count = 0
+
+    def run(self):
+        try:
+            expression = re.compile(self.query if self.regex else re.escape(self.query),
+                                    0 if self.match_case else re.IGNORECASE)
+        except re.error as e:
+            self.searchFailed.emit(str(e))
+            return
+
+        if self.ready:
+            candidates = self.index.candidates(queryTrigrams(self.query, self.regex))
+        else:
+            # The index is still being built; scan everything rather than miss files
+            candidates = [path for path, _, _ in walkProject(self.index.root)[0]]
+
+        batch = []
+        last_emit = time.monotonic()
+        for path in candidates:
+            if self.isInterruptionRequested():
+                return
+            text = readText(path)
+            if text is None or not expression.search(text):
+                continue  # Trigram false positive
+            self.file_count += 1
+            for line_number, line in enumerate(text.splitlines(), 1):
+                if expression.search(line):
+                    batch.append((path, line_number, line.strip()[:200]))
+                    self.result_count += 1
+                    if self.result_count >= MAX_RESULTS:
+                        self.resultsFound.emit(batch)
+                        return
+            if batch and time.monotonic() - last_emit >= RESULT_BATCH_SECONDS:
+                self.resultsFound.emit(batch)
+                batch = []
+                last_emit = time.monotonic()
+        if batch:
+            self.resultsFound.emit(batch)
+
+
+class FindInFilesPanel(QWidget):
+    """Search box and streamed results for the project-wide search."""
+
+    resultActivated = pyqtSignal(str, int)  # Path, line number (1-based)
+
+    def __init__(self, indexer, parent=None):
+        super().__init__(parent)
+        self.indexer = indexer
+        self.search = None
+        self.file_items = {}
+
+        self.queryEdit = QLineEdit()
+        self.queryEdit.setPlaceholderText('Find in files')
+        self.queryEdit.returnPressed.connect(self.startSearch)
+        self.queryEdit.textChanged.connect(lambda: self.searchTimer.start())
+        self.regexCheckBox = QCheckBox('Regex')
+        self.regexCheckBox.toggled.connect(self.startSearch)
+        self.matchCaseCheckBox = QCheckBox('Match case')
+        self.matchCaseCheckBox.toggled.connect(self.startSearch)
+
+        self.statusLabel = QLabel()
+        self.resultTree = QTreeWidget()
+        self.resultTree.setHeaderHidden(True)
+        self.resultTree.itemActivated.connect(self.onItemActivated)
+
+        # Search as the query is typed, once typing pauses
+        self.searchTimer = QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(250)
+        self.searchTimer.timeout.connect(self.startSearch)
+
+        optionsLayout = QHBoxLayout()
+        optionsLayout.addWidget(self.queryEdit)
+        optionsLayout.addWidget(self.regexCheckBox)
+        optionsLayout.addWidget(self.matchCaseCheckBox)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(optionsLayout)
+        layout.addWidget(self.statusLabel)
+        layout.addWidget(self.resultTree)
+
+        self.indexer.progressChanged.connect(self.onIndexProgress)
+        self.indexer.indexUpdated.connect(self.onIndexUpdated)
+
+    def focusQuery(self, text=''):
+        if text:
+            self.queryEdit.setText(text)
+        self.queryEdit.setFocus()
+        self.queryEdit.selectAll()
+
+    def startSearch(self):
+        self.searchTimer.stop()
+        self.cancelSearch()
+        self.resultTree.clear()
+        self.file_items = {}
+
+        query = self.queryEdit.text()
+        if not query:
+            self.statusLabel.clear()
+            return
+
+        self.statusLabel.setText('Searching...')
+        self.search = SearchWorker(self.indexer, query, self.regexCheckBox.isChecked(),
+                                   self.matchCaseCheckBox.isChecked(), parent=self)
+        self.search.resultsFound.connect(self.addResults)
+        self.search.searchFailed.connect(self.statusLabel.setText)
+        self.search.finished.connect(lambda search=self.search: self.onSearchFinished(search))
+        self.search.start()
+
+    def cancelSearch(self):
+        if self.search is not None:
+            # The worker deletes itself once it notices; results it already sent are ignored
+            self.search.requestInterruption()
+            self.search.resultsFound.disconnect()
+            self.search.searchFailed.disconnect()
+            self.search = None
+
+    def addResults(self, results):
+        for path, line_number, text in results:
+            fileItem = self.file_items.get(path)
+            if fileItem is None:
+                fileItem = QTreeWidgetItem(self.resultTree, [os.path.relpath(path, self.indexer.index.root)])
+                fileItem.setData(0, Qt.UserRole, (path, 1))
+                fileItem.setExpanded(True)
+                self.file_items[path] = fileItem
+            lineItem = QTreeWidgetItem(fileItem, [f'{line_number}: {text}'])
+            lineItem.setData(0, Qt.UserRole, (path, line_number))
+
+    def onSearchFinished(self, search):
+        if search is self.search:
+            self.search = None
+            # Otherwise searchFailed has already put the error in the label
+            if self.statusLabel.text() == 'Searching...':
+                capped = ' (limit reached)' if search.result_count >= MAX_RESULTS else ''
+                self.statusLabel.setText(f'{search.result_count} matches in {search.file_count} files{capped}')
+        search.deleteLater()
+
+    def onItemActivated(self, item):
+        path, line_number = item.data(0, Qt.UserRole)
+        self.resultActivated.emit(path, line_number)
+
+    def onIndexProgress(self, done, total):
+        if self.search is None and total:
+            self.statusLabel.setText(f'Indexing {done}/{total} files...')
+
+    def onIndexUpdated(self):
+        if self.search is None and self.statusLabel.text().startswith('Indexing'):
+            self.statusLabel.setText(f'{len(self.indexer.index)} files indexed')
+
+    def shutdown(self):
+        self.searchTimer.stop()
+        if self.search is not None:
+            search = self.search
+            self.cancelSearch()
+            search.wait()
@@ -0,0 +1,428 @@
+import re
+from array import array
+from bisect import bisect_left
+
+from PyQt5.QtCore import Qt, QEvent, QThread, QTimer, QRegularExpression
+from PyQt5.QtGui import QColor, QTextCursor, QTextCharFormat
+from PyQt5.QtWidgets import QWidget, QLineEdit, QCheckBox, QPushButton, QLabel, QGridLayout, QTextEdit
+
+from background_highlighter import visibleBlockRange
+
+
+# Find Next/Previous searches the document in runs of blocks of about this many characters,
+# so the cost depends on the distance to the match rather than the document size
+SEARCH_CHUNK_CHARS = 64 * 1024
+# Replacement escapes understood in regex mode: \0-\9, \n, \t and \\
+REPLACEMENT_ESCAPE = re.compile(r'\\(\d|n|t|\\)')
+
+
+def searchExpression(pattern, regex=False, match_case=False, whole_word=False):
+    """QRegularExpression for the find options; isValid() is False for a bad pattern."""
+    if not regex:
+        pattern = QRegularExpression.escape(pattern)
+    if whole_word:
+        pattern = r'\b(?:%s)\b' % pattern
+    options = QRegularExpression.MultilineOption
+    if not match_case:
+        options |= QRegularExpression.CaseInsensitiveOption
+    return QRegularExpression(pattern, options)
+
+
+def matches(expression, text, offset=0):
+    """
+    Non-empty matches of expression in text, starting at offset.
+
+    Offsets are in UTF-16 code units, the same units as QTextDocument positions.
+    """
+    iterator = expression.globalMatch(text, offset)
+    while iterator.hasNext():
+        match = iterator.next()
+        if match.capturedLength():
+            yield match
+
+
+def blockChunk(block, limit=SEARCH_CHUNK_CHARS, backward=False):
+    """
+    Text of whole blocks from block onwards (or backwards), joined by newlines,
+    until about limit characters are collected. Returns the text and the block
+    at the other end of the chunk.
+    """
+    lines = []
+    size = 0
+    while True:
+        lines.append(block.text())
+        size += block.length()
+        following = block.previous() if backward else block.next()
+        if size >= limit or not following.isValid():
+            break
+        block = following
+    if backward:
+        lines.reverse()
+    return '\n'.join(lines), block
+
+
+class MatchCounter(QThread):
+    """Collects the start offsets of every match in a text snapshot on a worker thread."""
+
+    def __init__(self, expression, text, parent=None):
+        super().__init__(parent)
+        self.expression = QRegularExpression(expression)
+        self.text = text
+        self.starts = None  # array of offsets, set once the count completes
+
+    def run(self):
+        starts = array('Q')
+        for count, match in enumerate(matches(self.expression, self.text)):
+            if count % 4096 == 0 and self.isInterruptionRequested():
+                return
+            starts.append(match.capturedStart())
+        self.starts = starts
+        self.text = None
+
+
+class FindReplaceBar(QWidget):
+    """
+    Find and replace for the current editor.
+
+    Matches are highlighted in the visible blocks only, and counted in the
+    background over a snapshot of the document. Replace All is one edit block,
+    so a single undo reverts it.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.editor = None
+        self.viewport = None  # The editor's viewport, watched for resizes
+        self.expression = None
+        self.counter = None
+        self.match_starts = None  # Sorted match offsets from the last completed count
+        self.snapshot = None  # Text of the editor's document, until it changes
+
+        self.matchFormat = QTextCharFormat()
+        self.matchFormat.setBackground(QColor(255, 200, 0, 110))
+
+        self.findEdit = QLineEdit()
+        self.findEdit.setPlaceholderText('Find')
+        self.findEdit.textChanged.connect(self.updateSearch)
+        self.findEdit.returnPressed.connect(self.findNext)
+        self.findEdit.installEventFilter(self)
+        self.replaceEdit = QLineEdit()
+        self.replaceEdit.setPlaceholderText('Replace')
+        self.replaceEdit.returnPressed.connect(self.replaceCurrent)
+
+        self.regexCheckBox = QCheckBox('Regex')
+        self.matchCaseCheckBox = QCheckBox('Match case')
+        self.wholeWordCheckBox = QCheckBox('Whole word')
+        for checkBox in (self.regexCheckBox, self.matchCaseCheckBox, self.wholeWordCheckBox):
+            checkBox.toggled.connect(self.updateSearch)
+
+        previousButton = QPushButton('Previous')
+        previousButton.clicked.connect(self.findPrevious)
+        nextButton = QPushButton('Next')
+        nextButton.clicked.connect(self.findNext)
+        closeButton = QPushButton('Close')
+        closeButton.clicked.connect(self.closeBar)
+        self.replaceButton = QPushButton('Replace')
+        self.replaceButton.clicked.connect(self.replaceCurrent)
+        self.replaceAllButton = QPushButton('Replace All')
+        self.replaceAllButton.clicked.connect(self.replaceAll)
+        self.countLabel = QLabel()
+
+        layout = QGridLayout(self)
+        layout.setContentsMargins(4, 2, 4, 2)
+        layout.addWidget(self.findEdit, 0, 0)
+        layout.addWidget(self.regexCheckBox, 0, 1)
+        layout.addWidget(self.matchCaseCheckBox, 0, 2)
+        layout.addWidget(self.wholeWordCheckBox, 0, 3)
+        layout.addWidget(previousButton, 0, 4)
+        layout.addWidget(nextButton, 0, 5)
+        layout.addWidget(self.countLabel, 0, 6)
+        layout.addWidget(closeButton, 0, 7)
+        layout.addWidget(self.replaceEdit, 1, 0)
+        layout.addWidget(self.replaceButton, 1, 4)
+        layout.addWidget(self.replaceAllButton, 1, 5)
+
+        # Repaint the highlights at most once per frame while scrolling or typing
+        self.highlightTimer = QTimer(self)
+        self.highlightTimer.setSingleShot(True)
+        self.highlightTimer.setInterval(16)
+        self.highlightTimer.timeout.connect(self.highlightVisibleMatches)
+
+        self.countTimer = QTimer(self)
+        self.countTimer.setSingleShot(True)
+        self.countTimer.setInterval(150)
+        self.countTimer.timeout.connect(self.startCount)
+
+        self.hide()
+
+    def setEditor(self, editor):
+        if editor is self.editor:
+            return
+        if self.editor is not None:
+            self.editor.setExtraSelections([])
+            self.editor.verticalScrollBar().valueChanged.disconnect(self.scheduleHighlight)
+            self.editor.document().contentsChange.disconnect(self.onDocumentChanged)
+            self.viewport.removeEventFilter(self)
+        self.editor = editor
+        self.viewport = editor.viewport() if editor is not None else None
+        if editor is not None:
+            editor.verticalScrollBar().valueChanged.connect(self.scheduleHighlight)
+            # Unlike contentsChanged, contentsChange is not emitted for highlighting
+            editor.document().contentsChange.connect(self.onDocumentChanged)
+            editor.viewport().installEventFilter(self)
+        self.onDocumentChanged()
+
+    def showBar(self, replace=False):
+        for widget in (self.replaceEdit, self.replaceButton, self.replaceAllButton):
+            widget.setVisible(replace)
+        self.show()
+
+        # Search for the selection if it is on one line
+        if self.editor is not None:
+            selected = self.editor.textCursor().selectedText()
+            if selected and '\u2029' not in selected:
+                self.findEdit.setText(selected)
+        self.findEdit.setFocus()
+        self.findEdit.selectAll()
+        self.updateSearch()
+
+    def closeBar(self):
+        self.cancelCount()
+        self.hide()
+        if self.editor is not None:
+            self.editor.setExtraSelections([])
+            self.editor.setFocus()
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Escape:
+            self.closeBar()
+        else:
+            super().keyPressEvent(event)
+
+    def eventFilter(self, obj, event):
+        if obj is self.findEdit and event.type() == QEvent.KeyPress:
+            if event.key() in (Qt.Key_Return, Qt.Key_Enter) and event.modifiers() & Qt.ShiftModifier:
+                self.findPrevious()
+                return True
+        elif obj is self.viewport and event.type() == QEvent.Resize:
+            self.scheduleHighlight()
+        return super().eventFilter(obj, event)
+
+    def updateSearch(self):
+        pattern = self.findEdit.text()
+        self.expression = None
+        if pattern:
+            expression = searchExpression(pattern, self.regexCheckBox.isChecked(),
+                                          self.matchCaseCheckBox.isChecked(), self.wholeWordCheckBox.isChecked())
+            if expression.isValid():
+                self.expression = expression
+            else:
+                self.countLabel.setText(f'Invalid pattern: {expression.errorString()}')
+
+        if self.expression is not None:
+            # Find as you type, starting from the current selection
+            self.find(from_selection_start=True)
+        elif not pattern:
+            self.countLabel.clear()
+        self.restartMatching()
+
+    def onDocumentChanged(self):
+        self.snapshot = None
+        self.restartMatching()
+
+    def restartMatching(self):
+        self.match_starts = None
+        self.scheduleHighlight()
+        if self.isVisible() and self.expression is not None and self.editor is not None:
+            self.countTimer.start()
+        else:
+            self.cancelCount()
+
+    def scheduleHighlight(self):
+        if self.isVisible():
+            self.highlightTimer.start()
+
+    def snapshotText(self):
+        if self.snapshot is None:
+            self.snapshot = self.editor.document().toPlainText()
+        return self.snapshot
+
+    def highlightVisibleMatches(self):
+        if self.editor is None:
+            return
+        if self.expression is None or not self.isVisible():
+            self.editor.setExtraSelections([])
+            return
+
+        first, last = visibleBlockRange(self.editor)
+        lines = []
+        block = first
+        while block.isValid() and block.blockNumber() <= last.blockNumber():
+            lines.append(block.text())
+            block = block.next()
+
+        selections = []
+        document = self.editor.document()
+        for match in matches(self.expression, '\n'.join(lines)):
+            selection = QTextEdit.ExtraSelection()
+            selection.format = self.matchFormat
+            selection.cursor = QTextCursor(document)
+            selection.cursor.setPosition(first.position() + match.capturedStart())
+            selection.cursor.setPosition(first.position() + match.capturedEnd(), QTextCursor.KeepAnchor)
+            selections.append(selection)
+        self.editor.setExtraSelections(selections)
+
+    def startCount(self):
+        self.cancelCount()
+        if self.expression is None or self.editor is None:
+            return
+        counter = MatchCounter(self.expression, self.snapshotText(), parent=self)
+        counter.finished.connect(lambda counter=counter: self.onCountFinished(counter))
+        self.counter = counter
+        counter.start()
+
+    def cancelCount(self):
+        self.countTimer.stop()
+        if self.counter is not None:
+            self.counter.requestInterruption()
+            self.counter = None
+
+    def onCountFinished(self, counter):
+        counter.deleteLater()
+        if counter is self.counter:
+            self.counter = None
+            self.match_starts = counter.starts
+            self.updateCountLabel()
+
+    def updateCountLabel(self):
+        if self.match_starts is None:
+            return
+        total = len(self.match_starts)
+        if not total:
+            self.countLabel.setText('No matches')
+            return
+        position = self.editor.textCursor().selectionStart()
+        index = bisect_left(self.match_starts, position)
+        if index < total and self.match_starts[index] == position and self.editor.textCursor().hasSelection():
+            self.countLabel.setText(f'{index + 1} of {total}')
+        else:
+            self.countLabel.setText(f'{total} matches')
+
+    def nextMatch(self, position):
+        """(start, end) of the first match at or after position, wrapping around the end."""
+        document = self.editor.document()
+        origin = document.findBlock(position)
+        block, offset, wrapped = origin, position, False
+        while True:
+            text, last = blockChunk(block)
+            for match in matches(self.expression, text, max(0, offset - block.position())):
+                return block.position() + match.capturedStart(), block.position() + match.capturedEnd()
+            block, offset = last.next(), 0
+            if not block.isValid():
+                if wrapped:
+                    return None
+                block, wrapped = document.firstBlock(), True
+            if wrapped and block.blockNumber() > origin.blockNumber():
+                return None
+
+    def previousMatch(self, position):
+        """(start, end) of the last match ending at or before position, wrapping around the start."""
+        document = self.editor.document()
+        origin = document.findBlock(position)
+        block, limit, wrapped = origin, position, False
+        while True:
+            text, first = blockChunk(block, backward=True)
+            found = None
+            for match in matches(self.expression, text):
+                if first.position() + match.capturedEnd() > limit:
+                    break
+                found = match
+            if found is not None:
+                return first.position() + found.capturedStart(), first.position() + found.capturedEnd()
+            block, limit = first.previous(), document.characterCount()
+            if not block.isValid():
+                if wrapped:
+                    return None
+                block, wrapped = document.lastBlock(), True
+            if wrapped and block.blockNumber() < origin.blockNumber():
+                return None
+
+    def find(self, backward=False, from_selection_start=False):
+        if self.expression is None or self.editor is None:
+            return False
+        cursor = self.editor.textCursor()
+        if backward:
+            found = self.previousMatch(cursor.selectionStart())
+        else:
+            found = self.nextMatch(cursor.selectionStart() if from_selection_start else cursor.selectionEnd())
+
+        if found is None:
+            self.countLabel.setText('No matches')
+            return False
+        cursor.setPosition(found[0])
+        cursor.setPosition(found[1], QTextCursor.KeepAnchor)
+        self.editor.setTextCursor(cursor)
+        self.updateCountLabel()
+        return True
+
+    def findNext(self):
+        return self.find()
+
+    def findPrevious(self):
+        return self.find(backward=True)
+
+    def replacementFor(self, match):
+        template = self.replaceEdit.text()
+        if not self.regexCheckBox.isChecked():
+            return template
+        escapes = {'n': '\n', 't': '\t', '\\': '\\'}
+        return REPLACEMENT_ESCAPE.sub(
+            lambda escape: escapes.get(escape.group(1)) or match.captured(int(escape.group(1))), template)
+
+    def canReplace(self):
+        if self.expression is None or self.editor is None:
+            return False
+        if self.editor.isReadOnly():
+            self.countLabel.setText('The document is read-only')
+            return False
+        return True
+
+    def replaceCurrent(self):
+        if not self.canReplace():
+            return
+        cursor = self.editor.textCursor()
+        if cursor.hasSelection():
+            # Only replace the selection if it is exactly a match
+            block = self.editor.document().findBlock(cursor.selectionStart())
+            text, _ = blockChunk(block, cursor.selectionEnd() - block.position())
+            match = self.expression.match(text, cursor.selectionStart() - block.position(),
+                                          QRegularExpression.NormalMatch,
+                                          QRegularExpression.AnchoredMatchOption)
+            if match.hasMatch() and block.position() + match.capturedEnd() == cursor.selectionEnd():
+                cursor.insertText(self.replacementFor(match))
+        self.findNext()
+
+    def replaceAll(self):
+        if not self.canReplace():
+            return
+        replacements = [(match.capturedStart(), match.capturedEnd(), self.replacementFor(match))
+                        for match in matches(self.expression, self.snapshotText())]
+        if not replacements:
+            self.countLabel.setText('No matches')
+            return
+
+        # Back to front, so earlier offsets stay valid; one edit block is one undo step
+        cursor = QTextCursor(self.editor.document())
+        cursor.beginEditBlock()
+        for start, end, replacement in reversed(replacements):
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            cursor.insertText(replacement)
+        cursor.endEditBlock()
+        self.countLabel.setText(f'Replaced {len(replacements)}')
+
+    def shutdown(self):
+        counter = self.counter
+        self.cancelCount()
+        if counter is not None:
+            counter.wait()
@@ -1,45 +1,409 @@
-from PyQt5.QtCore import Qt, QRegularExpression
+import re
 
-from PyQt5.QtGui import QTextCharFormat, QSyntaxHighlighter, QFont
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QTextCharFormat, QFont
 
+from background_highlighter import DeferrableHighlighter
+from diagnostics import ProfiledExpression
+
+
+# Lexer modes; the mode at the end of a block is kept in its state, so comments,
+# tags, attribute values, scripts and style sheets carry on across blocks
+(TEXT, COMMENT, TAG, DOUBLE_VALUE, SINGLE_VALUE, SCRIPT, SCRIPT_COMMENT, SCRIPT_TEMPLATE,
+ STYLE, STYLE_COMMENT) = range(10)
+MODE_NAMES = ['text', 'comment', 'tag', 'double-quoted value', 'single-quoted value', 'script',
+              'script comment', 'script template', 'style', 'style comment']
+
+# Block state layout: the mode, then what a tag switches to once it closes,
+# then the brace depth of a style sheet (capped, it only tells selectors from properties)
+MODE_MASK = 0b1111
+TAG_SHIFT = 4
+OTHER_TAG, SCRIPT_TAG, STYLE_TAG = range(3)
+DEPTH_SHIFT = 6
+MAX_DEPTH = 3
+
+# Characters lexed per block; the rest of a longer line, such as a minified
+# page, is left plain so highlighting it takes bounded time
+MAX_LEXED_CHARS = 64 * 1024
+
+# Every expression below is an alternation of simple tokens without nested
+# quantifiers, so each search is linear in the text it scans. Group numbers
+# are token kinds (see re.Match.lastindex). Python's re is used rather than
+# QRegularExpression so a long line is not converted to a QString per token,
+# and searches stop at MAX_LEXED_CHARS through their endpos argument.
+
+# Stands in for </script or </style outside HTML, keeping the group numbers
+NEVER = r'(?!)'
+
+TEXT_EXPRESSION = re.compile(
+    r'(<!--)'                                            # 1: comment
+    r'|(</?[A-Za-z][\w:.-]*|<![A-Za-z]+|<\?[A-Za-z]+)'  # 2: start of a tag
+    r'|(&#?[A-Za-z0-9]+;)'                               # 3: entity
+)
+COMMENT_END_EXPRESSION = re.compile(r'-->')
+TAG_EXPRESSION = re.compile(
+    r'(/?>)'                        # 1: end of the tag
+    r'|("[^"]*"|\'[^\']*\')'        # 2: quoted value
+    r'|("[^"]*$|\'[^\']*$)'         # 3: value continued on the next line
+    r'|([^\s"\'<>/=]+)'             # 4: attribute name
+    r'|=\s*([^\s"\'<>=`]+)'         # 5: unquoted value
+)
+DOUBLE_VALUE_END_EXPRESSION = re.compile(r'"')
+SINGLE_VALUE_END_EXPRESSION = re.compile(r"'")
+
+JS_KEYWORDS = [
+    'async', 'await', 'break', 'case', 'catch', 'class', 'const', 'continue', 'default', 'delete', 'do',
+    'else', 'export', 'extends', 'false', 'finally', 'for', 'from', 'function', 'if', 'import', 'in',
+    'instanceof', 'let', 'new', 'null', 'of', 'return', 'static', 'super', 'switch', 'this', 'throw',
+    'true', 'try', 'typeof', 'undefined', 'var', 'void', 'while', 'yield',
+]
+# Inside <script>, '</script' ends the script wherever it appears
+SCRIPT_CLOSE = r'</(?i:script)\b'
+NOT_SCRIPT_CLOSE = r'(?!/(?i:script)\b)'
+
+
+def scriptExpression(embedded):
+    stop = SCRIPT_CLOSE if embedded else NEVER
+    return re.compile(
+        r'(' + stop + r')'                                                   # 1: end of the script
+        r'|(//(?:[^<]|<' + NOT_SCRIPT_CLOSE + r')*)'                         # 2: line comment
+        r'|(/\*)'                                                            # 3: block comment
+        r'|("(?:[^"\\<]|\\.|<' + NOT_SCRIPT_CLOSE + r')*"?'
+        r'|\'(?:[^\'\\<]|\\.|<' + NOT_SCRIPT_CLOSE + r')*\'?)'               # 4: string
+        r'|(`)'                                                              # 5: template literal
+        r'|\b(' + '|'.join(JS_KEYWORDS) + r')\b'                             # 6: keyword
+        r'|\b(0[xX][0-9a-fA-F]+|\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)\b'           # 7: number
+    )
+
+
+def scriptCommentEndExpression(embedded):
+    return re.compile(r'(\*/)|(' + (SCRIPT_CLOSE if embedded else NEVER) + r')')
+
+
+def scriptTemplateEndExpression(embedded):
+    # Escapes are tokens of their own, so an escaped backtick is skipped
+    return re.compile(r'(`)|(' + (SCRIPT_CLOSE if embedded else NEVER) + r')|(\\.)')
+
+
+STYLE_CLOSE = r'</(?i:style)\b'
+
+
+def styleExpression(embedded):
+    # Every run of word characters and dashes is consumed by some group, so
+    # the property lookahead is tried once per run, not at each of its characters
+    return re.compile(
+        r'(' + (STYLE_CLOSE if embedded else NEVER) + r')'      # 1: end of the style sheet
+        r'|(/\*)'                                                # 2: comment
+        r'|("[^"]*"?|\'[^\']*\'?)'                               # 3: string
+        r'|(@[\w-]+)'                                            # 4: at-rule
+        r'|(\{)'                                                 # 5: opens a block
+        r'|(\})'                                                 # 6: closes a block
+        r'|([\w-]+(?=\s*:(?!:)))'                                # 7: property (inside a block)
+        r'|(#[0-9a-fA-F]{3,8}\b|-?\.?\d[\d.]*(?:[a-zA-Z]+|%)?)'  # 8: colour or number
+        r'|([.#]?[A-Za-z_][\w-]*)'                               # 9: selector (outside a block)
+        r'|([\w-]+)'                                             # 10: any other word, such as a run of dashes
+    )
+
+
+def styleCommentEndExpression(embedded):
+    return re.compile(r'(\*/)|(' + (STYLE_CLOSE if embedded else NEVER) + r')')
+
+
+def modeOf(state):
+    return state & MODE_MASK
+
+
+def tagOf(state):
+    return (state >> TAG_SHIFT) & 0b11
+
+
+def depthOf(state):
+    return (state >> DEPTH_SHIFT) & 0b11
+
+
+def makeState(mode, tag=OTHER_TAG, depth=0):
+    return mode | tag << TAG_SHIFT | min(depth, MAX_DEPTH) << DEPTH_SHIFT
+
+
+class HtmlHighlighter(DeferrableHighlighter):
+    """
+    State-machine lexer for HTML, handing <script> and <style> contents to the
+    JavaScript and CSS lexers.
+
+    Each mode searches for its next token with one linear expression; the
+    mode reached at the end of a block is its state, so constructs spanning
+    lines are lexed correctly and Qt only rehighlights the blocks whose state
+    an edit changes.
+    """
+
+    # Lexer mode at the start of the document, and whether </script> and
+    # </style> return to HTML (False for stand-alone .js and .css files)
+    START_MODE = TEXT
+    EMBEDDED = True
+
+    RULE_NAMES = MODE_NAMES
+
+    # Shared by every instance, built on first use
+    formats = None
+    # Expressions by mode for each value of EMBEDDED, compiled on first use
+    compiled = {}
 
-class HtmlHighlighter(QSyntaxHighlighter):
     def __init__(self, parent):
         super().__init__(parent)
 
-        redFormat = QTextCharFormat()
-        redFormat.setForeground(Qt.red)
-        redFormat.setFontWeight(QFont.Bold)
+        if HtmlHighlighter.formats is None:
+            HtmlHighlighter.formats = self.createFormats()
+        if self.EMBEDDED not in HtmlHighlighter.compiled:
+            HtmlHighlighter.compiled[self.EMBEDDED] = self.compileExpressions(self.EMBEDDED)
+        self.lexers = {
+            TEXT: self.lexText,
+            COMMENT: self.lexComment,
+            TAG: self.lexTag,
+            DOUBLE_VALUE: self.lexValue,
+            SINGLE_VALUE: self.lexValue,
+            SCRIPT: self.lexScript,
+            SCRIPT_COMMENT: self.lexScriptComment,
+            SCRIPT_TEMPLATE: self.lexScriptTemplate,
+            STYLE: self.lexStyle,
+            STYLE_COMMENT: self.lexStyleComment,
+        }
+        self.setRuleProfile(None)
 
-        magentaFormat = QTextCharFormat()
-        magentaFormat.setForeground(Qt.magenta)
-        magentaFormat.setFontWeight(QFont.Bold)
+    @staticmethod
+    def compileExpressions(embedded):
+        return {
+            TEXT: TEXT_EXPRESSION,
+            COMMENT: COMMENT_END_EXPRESSION,
+            TAG: TAG_EXPRESSION,
+            DOUBLE_VALUE: DOUBLE_VALUE_END_EXPRESSION,
+            SINGLE_VALUE: SINGLE_VALUE_END_EXPRESSION,
+            SCRIPT: scriptExpression(embedded),
+            SCRIPT_COMMENT: scriptCommentEndExpression(embedded),
+            SCRIPT_TEMPLATE: scriptTemplateEndExpression(embedded),
+            STYLE: styleExpression(embedded),
+            STYLE_COMMENT: styleCommentEndExpression(embedded),
+        }
 
-        self.highlightingRules = [
-            (QRegularExpression(r'&[a-zA-Z0-9]+;'), redFormat),  # HTML entities
-            (QRegularExpression(r'<\s*\b[a-zA-Z0-9_]+\b(?:[^>"]*"[^"]*")*[^>]*\s*>'), magentaFormat),  # Opening tags
-            (QRegularExpression(r'</\s*\b[a-zA-Z0-9_]+\b\s*>'), magentaFormat),  # Closing tags
-        ]
+    def setRuleProfile(self, profile):
+        expressions = HtmlHighlighter.compiled[self.EMBEDDED]
+        if profile is None:
+            self.expressions = expressions
+        else:
+            self.expressions = {mode: ProfiledExpression(expression, profile, mode)
+                                for mode, expression in expressions.items()}
 
-        attributeFormat = QTextCharFormat()
-        attributeFormat.setForeground(Qt.darkCyan)
-        self.highlightingRules.append((QRegularExpression(r'\b[a-zA-Z0-9_]+\s*='), attributeFormat))
+    @staticmethod
+    def createFormats():
+        def colored(color, bold=False):
+            format = QTextCharFormat()
+            format.setForeground(color)
+            if bold:
+                format.setFontWeight(QFont.Bold)
+            return format
 
-        valueFormat = QTextCharFormat()
-        valueFormat.setForeground(Qt.darkGreen)
-        self.highlightingRules.append((QRegularExpression(r'".*?"'), valueFormat))
-        self.highlightingRules.append((QRegularExpression(r"'.*?'"), valueFormat))
-
-        commentFormat = QTextCharFormat()
-        commentFormat.setForeground(Qt.gray)
-        self.highlightingRules.append((QRegularExpression(r'<!--.*?-->'), commentFormat))
+        return {
+            'entity': colored(Qt.red, bold=True),
+            'tag': colored(Qt.magenta, bold=True),
+            'attribute': colored(Qt.darkCyan),
+            'value': colored(Qt.darkGreen),
+            'comment': colored(Qt.gray),
+            'keyword': colored(Qt.darkYellow, bold=True),
+            'string': colored(Qt.darkGreen),
+            'number': colored(Qt.darkRed),
+            'selector': colored(Qt.magenta),
+            'property': colored(Qt.darkCyan),
+            'at-rule': colored(Qt.darkYellow, bold=True),
+        }
 
     def highlightBlock(self, text):
-        for pattern, format in self.highlightingRules:
-            expression = QRegularExpression(pattern)
-            match = expression.match(text)
-            while match.hasMatch():
-                start = match.capturedStart()
-                length = match.capturedLength()
-                self.setFormat(start, length, format)
-                match = expression.match(text, start + length)
+        if self.isDeferred():
+            return
+
+        # Lexing works on str indices; Qt offsets are UTF-16 code units, which
+        # differ only after characters outside the Basic Multilingual Plane
+        limit = min(len(text), MAX_LEXED_CHARS)
+        self.offsets = None
+        if len(text.encode('utf-16-le')) // 2 != len(text):
+            self.offsets = [0]
+            for character in text[:limit]:
+                self.offsets.append(self.offsets[-1] + (2 if ord(character) > 0xFFFF else 1))
+        state = self.previousBlockState()
+        if state < 0:
+            state = makeState(self.START_MODE)
+
+        position = 0
+        while position < limit:
+            position, state = self.lexers[modeOf(state)](text, position, limit, state)
+
+        self.setCurrentBlockState(state)
+
+    def format(self, start, end, name):
+        if self.offsets is not None:
+            start, end = self.offsets[start], self.offsets[end]
+        self.setFormat(start, end - start, self.formats[name])
+
+    def search(self, mode, text, position, limit):
+        """The next token of mode in text[position:limit], or None."""
+        return self.expressions[mode].search(text, position, limit)
+
+    def lexUntil(self, mode, text, position, limit, state, format, next_state):
+        """Format up to and including the end expression of mode, then switch to next_state."""
+        match = self.search(mode, text, position, limit)
+        if match is None:
+            self.format(position, limit, format)
+            return limit, state
+        self.format(position, match.end(), format)
+        return match.end(), next_state
+
+    # HTML
+
+    def lexText(self, text, position, limit, state):
+        match = self.search(TEXT, text, position, limit)
+        if match is None:
+            return limit, state
+
+        kind = match.lastindex
+        start, end = match.start(kind), match.end(kind)
+        if kind == 1:
+            self.format(start, end, 'comment')
+            return end, makeState(COMMENT)
+        if kind == 2:
+            self.format(start, end, 'tag')
+            token = match.group(kind)
+            name = token.lstrip('<!?').lower()
+            tag = OTHER_TAG
+            if name == 'script':
+                tag = SCRIPT_TAG
+            elif name == 'style':
+                tag = STYLE_TAG
+            return end, makeState(TAG, tag)
+        self.format(start, end, 'entity')
+        return end, state
+
+    def lexComment(self, text, position, limit, state):
+        return self.lexUntil(COMMENT, text, position, limit, state, 'comment', makeState(TEXT))
+
+    def lexTag(self, text, position, limit, state):
+        match = self.search(TAG, text, position, limit)
+        if match is None:
+            return limit, state
+
+        kind = match.lastindex
+        start, end = match.start(kind), match.end(kind)
+        tag = tagOf(state)
+        if kind == 1:
+            self.format(start, end, 'tag')
+            if match.group(kind) == '>' and tag == SCRIPT_TAG:
+                return end, makeState(SCRIPT)
+            if match.group(kind) == '>' and tag == STYLE_TAG:
+                return end, makeState(STYLE)
+            return end, makeState(TEXT)
+        if kind == 2:
+            self.format(start, end, 'value')
+            return end, state
+        if kind == 3:
+            self.format(start, end, 'value')
+            mode = DOUBLE_VALUE if match.group(kind).startswith('"') else SINGLE_VALUE
+            return end, makeState(mode, tag)
+
+        self.format(start, end, 'attribute' if kind == 4 else 'value')
+        return end, state
+
+    def lexValue(self, text, position, limit, state):
+        return self.lexUntil(modeOf(state), text, position, limit, state, 'value', makeState(TAG, tagOf(state)))
+
+    def closeTag(self, match, kind):
+        """Format the closing </script or </style that ended an embedded mode."""
+        start, end = match.start(kind), match.end(kind)
+        self.format(start, end, 'tag')
+        return end, makeState(TAG)
+
+    # JavaScript
+
+    def lexScript(self, text, position, limit, state):
+        match = self.search(SCRIPT, text, position, limit)
+        if match is None:
+            return limit, state
+
+        kind = match.lastindex
+        start, end = match.start(kind), match.end(kind)
+        if kind == 1:
+            return self.closeTag(match, kind)
+        if kind == 3:
+            self.format(start, end, 'comment')
+            return end, makeState(SCRIPT_COMMENT)
+        if kind == 5:
+            self.format(start, end, 'string')
+            return end, makeState(SCRIPT_TEMPLATE)
+        self.format(start, end, {2: 'comment', 4: 'string', 6: 'keyword', 7: 'number'}[kind])
+        return end, state
+
+    def lexScriptComment(self, text, position, limit, state):
+        return self.lexEmbedded(SCRIPT_COMMENT, text, position, limit, state, 'comment', makeState(SCRIPT))
+
+    def lexScriptTemplate(self, text, position, limit, state):
+        return self.lexEmbedded(SCRIPT_TEMPLATE, text, position, limit, state, 'string', makeState(SCRIPT))
+
+    def lexEmbedded(self, mode, text, position, limit, state, format, next_state):
+        """
+        Like lexUntil(), for end expressions whose second group is a closing
+        </script or </style and whose optional third group is an escape.
+        """
+        match = self.search(mode, text, position, limit)
+        while match is not None and match.lastindex == 3:
+            match = self.search(mode, text, match.end(), limit)
+        if match is None:
+            self.format(position, limit, format)
+            return limit, state
+        kind = match.lastindex
+        if kind == 2:
+            self.format(position, match.start(kind), format)
+            return self.closeTag(match, kind)
+        self.format(position, match.end(), format)
+        return match.end(), next_state
+
+    # CSS
+
+    def lexStyle(self, text, position, limit, state):
+        match = self.search(STYLE, text, position, limit)
+        if match is None:
+            return limit, state
+
+        kind = match.lastindex
+        start, end = match.start(kind), match.end(kind)
+        depth = depthOf(state)
+        if kind == 1:
+            return self.closeTag(match, kind)
+        if kind == 2:
+            self.format(start, end, 'comment')
+            return end, makeState(STYLE_COMMENT, depth=depth)
+        if kind == 5:
+            return end, makeState(STYLE, depth=depth + 1)
+        if kind == 6:
+            return end, makeState(STYLE, depth=max(0, depth - 1))
+
+        if depth == 0 and kind in (7, 8, 9):
+            format = 'selector'  # Outside a block, 'a:hover' or '#header' are selectors
+        else:
+            format = {3: 'string', 4: 'at-rule', 7: 'property', 8: 'number', 9: None, 10: None}[kind]
+        if format is not None:
+            self.format(start, end, format)
+        return end, state
+
+    def lexStyleComment(self, text, position, limit, state):
+        return self.lexEmbedded(STYLE_COMMENT, text, position, limit, state, 'comment',
+                                makeState(STYLE, depth=depthOf(state)))
+
+
+class CssHighlighter(HtmlHighlighter):
+    """Stand-alone style sheets, lexed by the CSS mode of HtmlHighlighter."""
+
+    START_MODE = STYLE
+    EMBEDDED = False
+
+
+class JavaScriptHighlighter(HtmlHighlighter):
+    """Stand-alone scripts, lexed by the JavaScript mode of HtmlHighlighter."""
+
+    START_MODE = SCRIPT
+    EMBEDDED = False
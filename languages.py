@@ -0,0 +1,79 @@
+import importlib
+import os
+
+from background_highlighter import BackgroundHighlightScheduler
+from diagnostics import diagnostics
+
+
+# Highlighter (module, class name) for each supported file extension; a module
+# is only imported the first time a file of its language is opened
+LANGUAGES = {
+    '.py': ('python_highlighter', 'PythonHighlighter'),
+    '.pyw': ('python_highlighter', 'PythonHighlighter'),
+    '.html': ('html_highlighter', 'HtmlHighlighter'),
+    '.css': ('html_highlighter', 'CssHighlighter'),
+    '.js': ('html_highlighter', 'JavaScriptHighlighter'),
+    '.htm': ('html_highlighter', 'HtmlHighlighter'),
+}
+
+# Files larger than this are highlighted viewport-first in the background
+BACKGROUND_HIGHLIGHT_BYTES = 256 * 1024
+# Files larger than this are not highlighted at all
+MAX_HIGHLIGHT_BYTES = 8 * 1024 * 1024
+
+
+def highlighterClassFor(file_name):
+    if not file_name:
+        return None
+    _, file_extension = os.path.splitext(file_name)
+    language = LANGUAGES.get(file_extension.lower())
+    if language is None:
+        return None
+    module_name, class_name = language
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class HighlighterManager:
+    """
+    Keeps at most one highlighter attached to a document.
+
+    One highlighter instance is created per language and reused, so switching
+    files only moves it between documents instead of building a new one.
+    Large files are handed to a BackgroundHighlightScheduler; attach() must be
+    called while the document is still empty, and start() once the text is in.
+    """
+
+    def __init__(self, textEdit, background_bytes=BACKGROUND_HIGHLIGHT_BYTES, max_bytes=MAX_HIGHLIGHT_BYTES):
+        self.instances = {}
+        self.active = None
+        self.background_bytes = background_bytes
+        self.max_bytes = max_bytes
+        self.scheduler = BackgroundHighlightScheduler(textEdit)
+
+    def detach(self):
+        self.scheduler.stop()
+        if self.active is not None:
+            self.active.setDocument(None)
+            self.active = None
+
+    def attach(self, document, file_name, size=0):
+        self.detach()
+
+        highlighter_class = highlighterClassFor(file_name)
+        if highlighter_class is None or size > self.max_bytes:
+            return None
+
+        highlighter = self.instances.get(highlighter_class)
+        if highlighter is None:
+            highlighter = highlighter_class(None)
+            self.instances[highlighter_class] = highlighter
+            diagnostics.watchHighlighter(highlighter)
+
+        if size > self.background_bytes:
+            self.scheduler.defer(highlighter)
+        highlighter.setDocument(document)
+        self.active = highlighter
+        return highlighter
+
+    def start(self):
+        self.scheduler.start()
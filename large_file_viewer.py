@@ -0,0 +1,253 @@
+import mmap
+import os
+import re
+from array import array
+
+from PyQt5.QtCore import Qt, QEvent, QThread, pyqtSignal
+from PyQt5.QtWidgets import QWidget, QPlainTextEdit, QScrollBar, QHBoxLayout
+
+
+# Files larger than this open in the read-only LargeFileViewer
+LARGE_FILE_BYTES = 32 * 1024 * 1024
+
+# One offset is kept for every LINE_STRIDE lines; the rest are found by scanning
+LINE_STRIDE = 64
+# Longer lines are cut when shown, so a huge single-line file stays cheap to page through
+MAX_LINE_BYTES = 16 * 1024
+# Bytes scanned for line breaks between progress reports and interruption checks
+INDEX_CHUNK_BYTES = 4 * 1024 * 1024
+
+STRIDE_EXPRESSION = re.compile(rb'(?:[^\n]*\n){%d}' % LINE_STRIDE)
+
+
+class LineIndex:
+    """
+    Line lookup for a memory-mapped file.
+
+    Only the start of every LINE_STRIDE-th line is stored, in an array of
+    unsigned 64-bit offsets, so the index is a small fraction of the file.
+    The offsets are found by scan(), which reads the whole file; LineIndexer
+    runs it on a worker thread.
+    """
+
+    def __init__(self, file_name):
+        self.file = open(file_name, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = b''
+        self.checkpoints = array('Q', [0])
+        self.line_count = 1
+
+    def scan(self, progress=None, interrupted=None):
+        """
+        Find the checkpoints, INDEX_CHUNK_BYTES at a time, reporting the
+        percent scanned to progress. Returns False if interrupted() stopped it.
+        """
+        start = 0  # Offset of the last checkpoint
+        tail = 0  # Line breaks between start and end
+        end = 0
+        while end < self.size:
+            if interrupted is not None and interrupted():
+                return False
+            chunk_end = min(self.size, end + INDEX_CHUNK_BYTES)
+            tail += self.map[end:chunk_end].count(b'\n')
+            end = chunk_end
+            # Only look for checkpoints once there is one to find, so the bytes
+            # after the last one are not matched again for every chunk
+            if tail >= LINE_STRIDE:
+                match = STRIDE_EXPRESSION.match(self.map, start, end)
+                while match:
+                    start = match.end()
+                    self.checkpoints.append(start)
+                    match = STRIDE_EXPRESSION.match(self.map, start, end)
+                tail %= LINE_STRIDE
+            if progress is not None:
+                progress(end * 100 // self.size)
+        self.line_count = (len(self.checkpoints) - 1) * LINE_STRIDE + tail + 1
+        return True
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def lineOffset(self, line):
+        offset = self.checkpoints[line // LINE_STRIDE]
+        for _ in range(line % LINE_STRIDE):
+            offset = self.map.find(b'\n', offset) + 1
+        return offset
+
+    def lines(self, first, count):
+        """Return up to `count` lines starting at line `first` (0-based), without line endings."""
+        result = []
+        start = self.lineOffset(first)
+        for _ in range(min(count, self.line_count - first)):
+            end = self.map.find(b'\n', start)
+            if end == -1:
+                end = self.size
+            line = self.map[start:min(end, start + MAX_LINE_BYTES)].decode('utf-8', errors='replace')
+            if end - start > MAX_LINE_BYTES:
+                line += ' …'
+            result.append(line.rstrip('\r'))
+            start = end + 1
+        return result
+
+
+class LineIndexer(QThread):
+    """
+    Builds a LineIndex on a worker thread. Call requestInterruption() to stop
+    early, in which case indexed is not emitted.
+    """
+
+    progressChanged = pyqtSignal(int)  # Percent of the file scanned
+    indexed = pyqtSignal(object)  # LineIndex
+    indexFailed = pyqtSignal(str)
+
+    def __init__(self, file_name, parent=None):
+        super().__init__(parent)
+        self.file_name = file_name
+
+    def run(self):
+        try:
+            index = LineIndex(self.file_name)
+        except (OSError, ValueError) as e:
+            self.indexFailed.emit(str(e))
+            return
+        if index.scan(self.progressChanged.emit, self.isInterruptionRequested):
+            self.indexed.emit(index)
+        else:
+            index.close()
+
+
+class LargeFileViewer(QWidget):
+    """
+    Read-only view of a file that is too large to load into a document.
+
+    Only the lines that fit the viewport are decoded and shown; the scroll bar
+    spans every line of the file. The file is indexed in the background, and
+    its lines are shown once opened is emitted.
+    """
+
+    progressChanged = pyqtSignal(int)
+    opened = pyqtSignal()
+    openFailed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.index = None
+        self.indexer = None  # LineIndexer scanning the file, while it is being opened
+        self.file_path = None
+        self.pendingLine = None  # Line (1-based) to show once the file is indexed
+
+        self.textView = QPlainTextEdit(self)
+        self.textView.setReadOnly(True)
+        self.textView.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.textView.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.textView.viewport().installEventFilter(self)
+        self.textView.installEventFilter(self)
+
+        self.scrollBar = QScrollBar(Qt.Vertical, self)
+        self.scrollBar.valueChanged.connect(self.showLines)
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(self.textView)
+        layout.addWidget(self.scrollBar)
+
+    def openFile(self, file_name):
+        self.closeFile()
+        self.file_path = file_name
+        indexer = LineIndexer(file_name, parent=self)
+        indexer.progressChanged.connect(self.progressChanged)
+        indexer.indexed.connect(lambda index, indexer=indexer: self.onIndexed(indexer, index))
+        indexer.indexFailed.connect(lambda message, indexer=indexer: self.onIndexFailed(indexer, message))
+        indexer.finished.connect(indexer.deleteLater)
+        self.indexer = indexer
+        indexer.start()
+
+    def onIndexed(self, indexer, index):
+        if indexer is not self.indexer:
+            index.close()  # The file was closed while it was indexed
+            return
+        self.indexer = None
+        self.index = index
+        self.updateScrollRange()
+        self.scrollBar.setValue(0)
+        self.showLines(0)
+        if self.pendingLine is not None:
+            self.goToLine(self.pendingLine)
+            self.pendingLine = None
+        self.opened.emit()
+
+    def onIndexFailed(self, indexer, message):
+        if indexer is not self.indexer:
+            return
+        self.indexer = None
+        self.file_path = None
+        self.openFailed.emit(message)
+
+    def isLoading(self):
+        return self.indexer is not None
+
+    def closeFile(self):
+        if self.indexer is not None:
+            self.indexer.requestInterruption()
+            self.indexer.wait()
+            self.indexer = None
+        self.pendingLine = None
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+            self.textView.clear()
+        self.file_path = None
+
+    def lineCount(self):
+        return self.index.line_count if self.index is not None else 0
+
+    def visibleLineCount(self):
+        return max(1, self.textView.viewport().height() // self.textView.fontMetrics().lineSpacing())
+
+    def updateScrollRange(self):
+        page = self.visibleLineCount()
+        self.scrollBar.setPageStep(page)
+        self.scrollBar.setRange(0, max(0, self.lineCount() - page))
+
+    def showLines(self, first):
+        if self.index is None:
+            return
+        self.textView.setPlainText('\n'.join(self.index.lines(first, self.visibleLineCount())))
+
+    def goToLine(self, line):
+        """Scroll so that `line` (1-based) is the first visible line."""
+        if self.isLoading():
+            self.pendingLine = line
+            return
+        self.scrollBar.setValue(line - 1)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.updateScrollRange()
+        self.showLines(self.scrollBar.value())
+
+    def eventFilter(self, obj, event):
+        # The text view only holds one screen of lines; scrolling moves the window instead
+        if event.type() == QEvent.Wheel:
+            steps = event.angleDelta().y() // 120
+            self.scrollBar.setValue(self.scrollBar.value() - steps * 3)
+            return True
+        if obj == self.textView and event.type() == QEvent.KeyPress:
+            actions = {
+                Qt.Key_PageUp: QScrollBar.SliderPageStepSub,
+                Qt.Key_PageDown: QScrollBar.SliderPageStepAdd,
+                Qt.Key_Up: QScrollBar.SliderSingleStepSub,
+                Qt.Key_Down: QScrollBar.SliderSingleStepAdd,
+                Qt.Key_Home: QScrollBar.SliderToMinimum,
+                Qt.Key_End: QScrollBar.SliderToMaximum,
+            }
+            if event.key() in actions:
+                self.scrollBar.triggerAction(actions[event.key()])
+                return True
+        return super().eventFilter(obj, event)
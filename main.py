@@ -1,28 +1,51 @@
-import subprocess
+import time
+startup_started = time.perf_counter()  # Taken before the other imports, for --profile-startup
+
+import argparse
+import codecs
+import locale
 import sys
 import os
-from python_highlighter import PythonHighlighter
-from html_highlighter import HtmlHighlighter  # Adjust the import based on the actual filename
-from PyQt5.QtGui import QFont
-from PyQt5.QtWidgets import QApplication, QMainWindow, QTextEdit, QAction, QFileDialog, QFileSystemModel, QTreeView, \
+from large_file_viewer import LargeFileViewer, LARGE_FILE_BYTES
+from file_loader import DocumentLoader
+from file_saver import FileSaver
+from file_reloader import FileReloader, applyHunks, fileStat, RELOAD_DELAY_MS
+from edit_journal import JournalWriter, EditJournal, readJournal, replayJournal, journalPath, flushJournals
+from document_tab import DocumentTab, DocumentCache
+from find_in_files import ProjectIndexer, FindInFilesPanel
+from find_replace import FindReplaceBar
+from startup_profile import StartupProfile
+from diagnostics import diagnostics, DiagnosticsPanel
+from file_explorer import FileExplorerModel, DEFAULT_EXCLUDES
+from quick_open import PathIndexer, QuickOpenDialog
+from outline import OutlinePanel, hasOutline
+from PyQt5.QtGui import QFont, QTextCursor
+from PyQt5.QtWidgets import QApplication, QMainWindow, QAction, QFileDialog, QTreeView, \
     QVBoxLayout, QWidget, QDockWidget, QMessageBox, QMenu, QInputDialog, QLineEdit, QSplashScreen, QDialog, QTabWidget, \
-    QLabel, QPlainTextEdit, QPushButton
-from PyQt5.QtCore import Qt, QEvent
+    QLabel, QPlainTextEdit, QPushButton, QProgressBar, QHBoxLayout
+from PyQt5.QtCore import Qt, QEvent, QProcess, QTimer, QFileSystemWatcher
 from PyQt5.QtCore import QModelIndex
 from PyQt5.QtGui import QKeySequence
 
 class TerminalWidget(QWidget):
-    def __init__(self):
+    def __init__(self, scrollback_lines=10000, scrollback_bytes=1024 * 1024):
         super().__init__()
 
         self.command_history = []  # Maintain a history of entered commands
         self.command_index = 0  # Index to navigate through command history
 
+        self.scrollback_lines = scrollback_lines  # Older lines are dropped from the view
+        self.scrollback_bytes = scrollback_bytes  # Most characters kept in the view, however long the lines
+        self.process = None
+        self.pending_output = []  # Decoded output waiting for the next flush
+        self.pending_size = 0
+
         self.initUI()
 
     def initUI(self):
-        self.terminalTextEdit = QTextEdit(self)
+        self.terminalTextEdit = QPlainTextEdit(self)
         self.terminalTextEdit.setReadOnly(True)
+        self.terminalTextEdit.setMaximumBlockCount(self.scrollback_lines)
 
         self.commandLineEdit = QLineEdit(self)
         self.commandLineEdit.installEventFilter(self)  # Install event filter for command line
@@ -30,34 +53,147 @@ class TerminalWidget(QWidget):
         self.runButton = QPushButton('Run', self)
         self.runButton.clicked.connect(self.runCommand)
 
+        self.stopButton = QPushButton('Stop', self)
+        self.stopButton.clicked.connect(self.stopCommand)
+        self.stopButton.setEnabled(False)
+
+        # Output is appended at most once per frame, however fast the process writes
+        self.flushTimer = QTimer(self)
+        self.flushTimer.setInterval(16)
+        self.flushTimer.timeout.connect(self.flushOutput)
+
+        # Kill the process if it ignores the terminate request
+        self.killTimer = QTimer(self)
+        self.killTimer.setSingleShot(True)
+        self.killTimer.setInterval(2000)
+        self.killTimer.timeout.connect(self.killCommand)
+
+        buttonLayout = QHBoxLayout()
+        buttonLayout.addWidget(self.runButton)
+        buttonLayout.addWidget(self.stopButton)
+
         layout = QVBoxLayout(self)
         layout.addWidget(self.terminalTextEdit)
         layout.addWidget(self.commandLineEdit)
-        layout.addWidget(self.runButton)
+        layout.addLayout(buttonLayout)
+
+    def isRunning(self):
+        return self.process is not None
 
     def runCommand(self):
+        if self.isRunning():
+            self.appendOutput("A command is already running; stop it first.\n")
+            return
+
         command = self.commandLineEdit.text()
         self.command_history.append(command)  # Add command to history
         self.command_index = len(self.command_history)  # Set index to the latest command
 
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        self.appendOutput(f"> {command}\n")
 
-        output, error = process.communicate()
+        self.decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace')
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.MergedChannels)
+        self.process.readyReadStandardOutput.connect(self.readOutput)
+        self.process.finished.connect(self.onCommandFinished)
+        self.process.errorOccurred.connect(self.onCommandError)
+        if os.name == 'nt':
+            self.process.start('cmd', ['/c', command])
+        else:
+            self.process.start('/bin/sh', ['-c', command])
 
-        self.terminalTextEdit.insertPlainText(f"> {command}\n")
-        self.terminalTextEdit.insertPlainText(output)
-        self.terminalTextEdit.insertPlainText(error)
-        self.terminalTextEdit.insertPlainText("\n")
+        self.stopButton.setEnabled(True)
+        self.flushTimer.start()
 
         # Clear the command line after running the command
         self.commandLineEdit.clear()
 
+    def stopCommand(self):
+        if self.isRunning():
+            self.process.terminate()
+            self.killTimer.start()
+
+    def killCommand(self):
+        if self.isRunning():
+            self.process.kill()
+
+    def readOutput(self):
+        self.appendOutput(self.decoder.decode(bytes(self.process.readAllStandardOutput())))
+
+    def appendOutput(self, text):
+        if not text:
+            return
+        self.pending_output.append(text)
+        self.pending_size += len(text)
+
+        # Between two flushes keep only the newest output that fits the scrollback
+        if self.pending_size > self.scrollback_bytes:
+            text = ''.join(self.pending_output)[-self.scrollback_bytes:]
+            self.pending_output = [text]
+            self.pending_size = len(text)
+
+        if not self.flushTimer.isActive():
+            self.flushTimer.start()
+
+    def flushOutput(self):
+        if not self.pending_output:
+            if not self.isRunning():
+                self.flushTimer.stop()
+            return
+
+        scrollBar = self.terminalTextEdit.verticalScrollBar()
+        at_bottom = scrollBar.value() == scrollBar.maximum()
+
+        text = ''.join(self.pending_output)
+        if text.count('\n') > self.scrollback_lines:
+            # Lines that would be dropped from the scrollback right away are never inserted
+            text = text.split('\n', text.count('\n') - self.scrollback_lines)[-1]
+
+        cursor = QTextCursor(self.terminalTextEdit.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        self.pending_output = []
+        self.pending_size = 0
+
+        # The block count limit does not bound output without newlines, such as
+        # progress bars, so the oldest characters are dropped past the byte limit
+        document = self.terminalTextEdit.document()
+        excess = document.characterCount() - 1 - self.scrollback_bytes
+        if excess > 0:
+            cursor.setPosition(0)
+            cursor.setPosition(excess, QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+
+        if at_bottom:
+            scrollBar.setValue(scrollBar.maximum())
+
+    def onCommandFinished(self, exit_code, exit_status):
+        self.readOutput()
+        self.appendOutput(self.decoder.decode(b'', final=True))
+        if exit_status == QProcess.CrashExit:
+            self.appendOutput("[process stopped]\n")
+        elif exit_code:
+            self.appendOutput(f"[exit code {exit_code}]\n")
+        self.appendOutput("\n")
+        self.finishCommand()
+
+    def onCommandError(self, error):
+        if error == QProcess.FailedToStart:
+            self.appendOutput(f"{self.process.errorString()}\n\n")
+            self.finishCommand()
+
+    def shutdown(self):
+        """Kill a running command; called when the editor closes."""
+        if self.isRunning():
+            self.process.kill()
+            self.process.waitForFinished(1000)
+
+    def finishCommand(self):
+        self.killTimer.stop()
+        self.stopButton.setEnabled(False)
+        self.process.deleteLater()
+        self.process = None
+
     def eventFilter(self, obj, event):
         # Handle key events for command line
         if obj == self.commandLineEdit and event.type() == QEvent.KeyPress:
@@ -83,12 +219,16 @@ class TerminalWidget(QWidget):
         return super().eventFilter(obj, event)
 
 class CodeEditor(QMainWindow):
-    def __init__(self):
+    def __init__(self, profile=None, excludes=DEFAULT_EXCLUDES):
         super().__init__()
-        self.initUI()
-        self.current_file_path = None
-        self.highlighter = None  # Placeholder for the highlighter
-        self.textEdit.setTabStopWidth(4 * self.textEdit.fontMetrics().width(' '))
+        self.profile = profile or StartupProfile(startup_started, enabled=False)
+        self.excludes = excludes  # Hidden from the file explorer, in .gitignore syntax
+        self.large_file_bytes = LARGE_FILE_BYTES  # Larger files open in the read-only viewer
+        self.documentCache = DocumentCache()  # Unloads clean background tabs over its memory budget
+        self.journalWriter = JournalWriter(self)  # Writes the tabs' edit journals in the background
+        self.journalWriter.writeFailed.connect(self.onJournalWriteFailed)
+        self.journalWriter.start()
+        self.initFileWatcher()
 
         # Set a custom font with antialiasing
         font = QFont()
@@ -96,18 +236,38 @@ class CodeEditor(QMainWindow):
         font.setFamily("Courier")
         font.setPointSize(12)
         font.setStyleStrategy(QFont.PreferAntialias)  # Enable antialiasing
-        self.textEdit.setFont(font)
+        self.editorFont = font
 
+        splash = self.initUI()
         self.initTerminal()
+        self.initFindInFiles()
+        self.initQuickOpen()
+        self.initDiagnostics()
+        self.initOutline()
+        self.profile.mark('widgets')
+
+        # Shown once every dock is in place, so the terminal's tab starts out hidden
+        self.profile.watchFirstPaint(self)
+        self.show()
+        # finish() waits for the window to be exposed, so it must come after show()
+        splash.finish(self)
+
+    @property
+    def textEdit(self):
+        """Editor of the current tab, or None when the tab shows a large file."""
+        widget = self.tabWidget.currentWidget()
+        return widget if isinstance(widget, DocumentTab) else None
+
+    @property
+    def current_file_path(self):
+        widget = self.tabWidget.currentWidget()
+        return widget.file_path if widget is not None else None
 
     def showSplashScreen(self):
+        # Styled by the application-wide style sheet
         splash = QSplashScreen()
         splash.setWindowFlags(Qt.WindowStaysOnTopHint | Qt.FramelessWindowHint)
 
-        # Apply style from style.qss to the splash screen
-        with open('style.qss', 'r') as file:
-            splash.setStyleSheet(file.read())
-
         # Set a custom font with larger size
         font = QFont()
         font.setPointSize(24)
@@ -115,23 +275,38 @@ class CodeEditor(QMainWindow):
 
         splash.showMessage("KB Editor", Qt.AlignCenter | Qt.AlignCenter, Qt.white)
         splash.show()
-
-        splash.finish(self)
+        return splash
 
     def initUI(self):
-        self.showSplashScreen()
-        # Load the style sheet
+        # Load the style sheet once, for the application, so the splash screen and
+        # the window share it instead of each parsing their own copy
+        self.profile.mark('application')
         with open('style.qss', 'r') as file:
-            self.setStyleSheet(file.read())
-
-        self.textEdit = QTextEdit()
-        self.setCentralWidget(self.textEdit)
-
-        font = self.textEdit.font()
-        font.setStyleHint(QFont.TypeWriter)
-        font.setFamily("Courier")
-        font.setPointSize(12)
-        self.textEdit.setFont(font)
+            QApplication.instance().setStyleSheet(file.read())
+        self.profile.mark('stylesheet')
+
+        splash = self.showSplashScreen()  # Closed by __init__ once the window is shown
+
+        # One DocumentTab (or LargeFileViewer) per open file
+        self.tabWidget = QTabWidget()
+        self.tabWidget.setTabsClosable(True)
+        self.tabWidget.setMovable(True)
+        self.tabWidget.setDocumentMode(True)
+        self.tabWidget.tabCloseRequested.connect(self.closeTab)
+        self.tabWidget.currentChanged.connect(self.onCurrentTabChanged)
+
+        # Find/replace bar below the tabs, following the current editor
+        self.findBar = FindReplaceBar()
+        # Outline of the current editor, docked by initOutline(); Python files are parsed in a worker process
+        self.outlinePanel = OutlinePanel()
+        centralLayout = QVBoxLayout()
+        centralLayout.setContentsMargins(0, 0, 0, 0)
+        centralLayout.setSpacing(0)
+        centralLayout.addWidget(self.tabWidget)
+        centralLayout.addWidget(self.findBar)
+        centralWidget = QWidget()
+        centralWidget.setLayout(centralLayout)
+        self.setCentralWidget(centralWidget)
 
         newAction = QAction('New', self)
         newAction.triggered.connect(self.newFile)
@@ -145,24 +320,81 @@ class CodeEditor(QMainWindow):
         saveAsAction = QAction('Save As', self)
         saveAsAction.triggered.connect(self.saveFileAs)
 
+        closeTabAction = QAction('Close Tab', self)
+        closeTabAction.triggered.connect(lambda: self.closeTab(self.tabWidget.currentIndex()))
+
         undoAction = QAction('Undo', self)
-        undoAction.triggered.connect(self.textEdit.undo)
+        undoAction.triggered.connect(self.undo)
 
         redoAction = QAction('Redo', self)
-        redoAction.triggered.connect(self.textEdit.redo)
+        redoAction.triggered.connect(self.redo)
+
+        goToLineAction = QAction('Go to Line', self)
+        goToLineAction.triggered.connect(self.goToLine)
+
+        findAction = QAction('Find', self)
+        findAction.triggered.connect(lambda: self.showFindBar(replace=False))
+
+        replaceAction = QAction('Replace', self)
+        replaceAction.triggered.connect(lambda: self.showFindBar(replace=True))
 
+        findNextAction = QAction('Find Next', self)
+        findNextAction.triggered.connect(self.findBar.findNext)
+
+        findPreviousAction = QAction('Find Previous', self)
+        findPreviousAction.triggered.connect(self.findBar.findPrevious)
+
+        findInFilesAction = QAction('Find in Files', self)
+        findInFilesAction.triggered.connect(self.showFindInFiles)
+
+        quickOpenAction = QAction('Quick Open', self)
+        quickOpenAction.triggered.connect(self.showQuickOpen)
+
+        terminalAction = QAction('Terminal', self)
+        terminalAction.triggered.connect(self.showTerminal)
+
+        diagnosticsAction = QAction('Diagnostics', self)
+        diagnosticsAction.triggered.connect(self.showDiagnostics)
+
+        outlineAction = QAction('Outline', self)
+        outlineAction.triggered.connect(self.showOutline)
+
+        goToDefinitionAction = QAction('Go to Definition', self)
+        goToDefinitionAction.triggered.connect(self.goToDefinition)
 
 
         self.statusBar()
 
+        # Shown while a file is being read in the background
+        self.loadProgressBar = QProgressBar()
+        self.loadProgressBar.setMaximumWidth(150)
+        self.loadProgressBar.hide()
+        self.cancelLoadButton = QPushButton('Cancel')
+        self.cancelLoadButton.clicked.connect(self.cancelLoading)
+        self.cancelLoadButton.hide()
+        self.statusBar().addPermanentWidget(self.loadProgressBar)
+        self.statusBar().addPermanentWidget(self.cancelLoadButton)
+
         menubar = self.menuBar()
         fileMenu = menubar.addMenu('File')
         fileMenu.addAction(newAction)
         fileMenu.addAction(openAction)
+        fileMenu.addAction(quickOpenAction)
         fileMenu.addAction(saveAction)
         fileMenu.addAction(saveAsAction)
+        fileMenu.addAction(closeTabAction)
         fileMenu.addAction(undoAction)
         fileMenu.addAction(redoAction)
+        fileMenu.addAction(goToLineAction)
+        fileMenu.addAction(goToDefinitionAction)
+        fileMenu.addAction(outlineAction)
+        fileMenu.addAction(findAction)
+        fileMenu.addAction(replaceAction)
+        fileMenu.addAction(findNextAction)
+        fileMenu.addAction(findPreviousAction)
+        fileMenu.addAction(findInFilesAction)
+        fileMenu.addAction(terminalAction)
+        fileMenu.addAction(diagnosticsAction)
 
         # Add "About" menu
         aboutMenu = menubar.addMenu('About')
@@ -185,10 +417,21 @@ class CodeEditor(QMainWindow):
         # Create actions for keyboard shortcuts
         newAction.setShortcut(newShortcut)
         openAction.setShortcut(openShortcut)
+        quickOpenAction.setShortcut(QKeySequence('Ctrl+P'))
         saveAction.setShortcut(saveShortcut)
         saveAsAction.setShortcut(saveAsShortcut)
+        closeTabAction.setShortcut(QKeySequence.Close)
         undoAction.setShortcut(undoShortcut)
         redoAction.setShortcut(redoShortcut)
+        goToLineAction.setShortcut(QKeySequence('Ctrl+G'))
+        goToDefinitionAction.setShortcut(QKeySequence('F12'))
+        outlineAction.setShortcut(QKeySequence('Ctrl+Shift+O'))
+        findAction.setShortcut(QKeySequence.Find)
+        replaceAction.setShortcut(QKeySequence('Ctrl+H'))
+        findNextAction.setShortcut(QKeySequence.FindNext)
+        findPreviousAction.setShortcut(QKeySequence.FindPrevious)
+        findInFilesAction.setShortcut(QKeySequence('Ctrl+Shift+F'))
+        terminalAction.setShortcut(QKeySequence('Ctrl+`'))
 
 
         self.setupFileExplorer()
@@ -200,9 +443,11 @@ class CodeEditor(QMainWindow):
 
         self.renaming_item = None
 
+        self.createTab()
+
         self.setGeometry(100, 100, 800, 600)
-        self.setWindowTitle('Simple Code Editor')
-        self.show()
+        self.setWindowTitle('Simple Code Editor[*]')
+        return splash
 
     def importCustomStylesheet(self):
         options = QFileDialog.Options()
@@ -214,15 +459,188 @@ class CodeEditor(QMainWindow):
         if stylesheet_path:
             with open(stylesheet_path, 'r') as file:
                 stylesheet = file.read()
-                self.setStyleSheet(stylesheet)
+                QApplication.instance().setStyleSheet(stylesheet)
+
+    def initFileWatcher(self):
+        # Open files are reloaded when they change on disk, a burst of changes at a time
+        self.fileWatcher = QFileSystemWatcher(self)
+        self.fileWatcher.fileChanged.connect(self.onFileChanged)
+        self.changedFiles = set()
+        self.reloadTimer = QTimer(self)
+        self.reloadTimer.setSingleShot(True)
+        self.reloadTimer.setInterval(RELOAD_DELAY_MS)
+        self.reloadTimer.timeout.connect(self.reloadChangedFiles)
+
+    def watchFile(self, tab):
+        tab.diskStat = fileStat(tab.file_path)
+        if tab.file_path not in self.fileWatcher.files():
+            self.fileWatcher.addPath(tab.file_path)
+
+    def unwatchFile(self, file_path):
+        if file_path in self.fileWatcher.files():
+            self.fileWatcher.removePath(file_path)
+
+    def onFileChanged(self, file_path):
+        self.changedFiles.add(file_path)
+        self.reloadTimer.start()
+
+    def reloadChangedFiles(self):
+        changed, self.changedFiles = self.changedFiles, set()
+        for file_path in changed:
+            if os.path.exists(file_path) and file_path not in self.fileWatcher.files():
+                self.fileWatcher.addPath(file_path)  # Replacing a file by renaming ends its watch
+            tab = self.findTab(file_path)
+            if isinstance(tab, DocumentTab):
+                self.reloadTab(tab)
+
+    def reloadTab(self, tab):
+        """Bring the tab up to date with its file, replacing only the lines that changed."""
+        if tab.unloaded or tab.isLoading():
+            return  # The text is read from the file anyway once it is shown
+        if tab.isSaving() or tab.fileReloader is not None:
+            self.onFileChanged(tab.file_path)  # Look again once that is done
+            return
+
+        stat = fileStat(tab.file_path)
+        if stat is None:
+            self.statusBar().showMessage(f"{os.path.basename(tab.file_path)} was deleted or moved on disk")
+            return
+        if stat == tab.diskStat:
+            return  # Written by this editor
+        if tab.document().isModified():
+            reply = QMessageBox.question(self, 'File Changed',
+                                         f'{os.path.basename(tab.file_path)} changed on disk. Reload it and '
+                                         f'lose your unsaved changes?',
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                tab.diskStat = stat  # Keep the edits; saving will overwrite the file
+                return
+
+        edit_count = tab.editCount
+        reloader = FileReloader(tab.file_path, tab.toPlainText(), parent=tab)
+        tab.fileReloader = reloader
+        reloader.reloaded.connect(lambda hunks, stat, tab=tab, edit_count=edit_count:
+                                  self.onFileReloaded(tab, hunks, stat, edit_count))
+        reloader.reloadFailed.connect(lambda message: self.statusBar().showMessage(f"Failed to reload: {message}"))
+        reloader.finished.connect(lambda tab=tab: setattr(tab, 'fileReloader', None))
+        reloader.finished.connect(reloader.deleteLater)
+        reloader.start()
+
+    def onFileReloaded(self, tab, hunks, stat, edit_count):
+        if self.tabWidget.indexOf(tab) == -1:
+            return  # Closed while the file was diffed
+        if tab.editCount != edit_count:
+            # Edited while the file was diffed; diff again against the current text
+            self.onFileChanged(tab.file_path)
+            return
+        applyHunks(tab, hunks)
+        tab.document().setModified(False)
+        tab.diskStat = stat
+        if tab.journal is not None:
+            tab.journal.restart(tab.file_path)
+        self.statusBar().showMessage(f"Reloaded {os.path.basename(tab.file_path)} "
+                                     f"({len(hunks)} changed {'region' if len(hunks) == 1 else 'regions'})", 3000)
 
     def initTerminal(self):
-        self.terminalWidget = TerminalWidget()
-
-        terminalDock = QDockWidget("Terminal", self)
-        terminalDock.setWidget(self.terminalWidget)
-
-        self.addDockWidget(Qt.BottomDockWidgetArea, terminalDock)
+        # The terminal itself is built the first time its dock is shown
+        self.terminalWidget = None
+        self.terminalDock = QDockWidget("Terminal", self)
+        self.terminalDock.visibilityChanged.connect(self.onTerminalVisibilityChanged)
+
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.terminalDock)
+
+    def onTerminalVisibilityChanged(self, visible):
+        if visible and self.terminalWidget is None:
+            self.terminalWidget = TerminalWidget()
+            self.terminalDock.setWidget(self.terminalWidget)
+
+    def showTerminal(self):
+        self.terminalDock.show()
+        self.terminalDock.raise_()
+        self.onTerminalVisibilityChanged(True)
+        self.terminalWidget.commandLineEdit.setFocus()
+
+    def initFindInFiles(self):
+        # The index of the explorer's tree is loaded and refreshed once the window is up
+        self.projectIndexer = ProjectIndexer(os.getcwd(), self)
+        self.findInFilesPanel = FindInFilesPanel(self.projectIndexer)
+        self.findInFilesPanel.resultActivated.connect(self.openFileAtLine)
+
+        self.findInFilesDock = QDockWidget("Find in Files", self)
+        self.findInFilesDock.setWidget(self.findInFilesPanel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.findInFilesDock)
+        self.tabifyDockWidget(self.terminalDock, self.findInFilesDock)
+        self.findInFilesDock.raise_()
+
+        QTimer.singleShot(0, self.projectIndexer.start)
+
+    def initQuickOpen(self):
+        # Follows the directories the find-in-files index watches; built once the window is up
+        self.pathIndexer = PathIndexer(os.getcwd(), self.projectIndexer.watcher, self.excludes, self)
+        self.quickOpenDialog = QuickOpenDialog(self.pathIndexer, self)
+        self.quickOpenDialog.fileChosen.connect(self.loadFile)
+
+        QTimer.singleShot(0, self.pathIndexer.start)
+
+    def showQuickOpen(self):
+        self.quickOpenDialog.popup()
+
+    def initDiagnostics(self):
+        # Hidden until asked for; nothing is recorded unless diagnostics are enabled
+        self.diagnosticsPanel = DiagnosticsPanel()
+        self.diagnosticsDock = QDockWidget("Diagnostics", self)
+        self.diagnosticsDock.setWidget(self.diagnosticsPanel)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.diagnosticsDock)
+        self.diagnosticsDock.hide()
+
+    def showDiagnostics(self):
+        diagnostics.setEnabled(True)
+        self.diagnosticsDock.show()
+        self.diagnosticsDock.raise_()
+
+    def initOutline(self):
+        self.outlinePanel.symbolActivated.connect(self.goToSymbol)
+        self.outlineDock = QDockWidget("Outline", self)
+        self.outlineDock.setWidget(self.outlinePanel)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.outlineDock)
+        self.outlineDock.hide()
+
+    def showOutline(self):
+        self.outlineDock.show()
+        self.outlineDock.raise_()
+
+    def goToSymbol(self, line):
+        if self.textEdit is not None:
+            self.moveToLine(self.textEdit, line)
+            self.textEdit.setFocus()
+
+    def goToDefinition(self):
+        """Jump to the definition, in the current file, of the name under the cursor."""
+        tab = self.textEdit
+        if tab is None or not hasOutline(tab.file_path):
+            self.statusBar().showMessage("Go to Definition is available in Python files")
+            return
+        cursor = tab.textCursor()
+        cursor.select(QTextCursor.WordUnderCursor)
+        name = cursor.selectedText()
+        line = self.outlinePanel.definitionLine(name, tab.textCursor().blockNumber() + 1) if name else None
+        if line is None:
+            self.statusBar().showMessage(f"No definition of {name} found in this file" if name else
+                                         "No name under the cursor", 3000)
+            return
+        self.moveToLine(tab, line)
+
+    def showFindBar(self, replace):
+        if self.textEdit is None:
+            self.statusBar().showMessage("Find is not available in the large file viewer")
+            return
+        self.findBar.showBar(replace)
+
+    def showFindInFiles(self):
+        self.findInFilesDock.show()
+        self.findInFilesDock.raise_()
+        selected = self.textEdit.textCursor().selectedText() if self.textEdit is not None else ''
+        self.findInFilesPanel.focusQuery(selected if '\u2029' not in selected else '')
 
     def showAboutDialog(self):
         aboutDialog = QDialog(self)
@@ -237,16 +655,14 @@ class CodeEditor(QMainWindow):
         aboutDialog.exec_()
 
     def setupFileExplorer(self):
-        fileModel = QFileSystemModel()
-        root_path = os.getcwd()
-        fileModel.setRootPath(root_path)
+        # Ignored entries are never listed, and directories are listed only while expanded
+        fileModel = FileExplorerModel(self.excludes)
 
         fileTreeView = QTreeView()
         fileTreeView.setModel(fileModel)
-        fileTreeView.setRootIndex(fileModel.index(root_path))
-
-        for column in range(1, 4):
-            fileTreeView.header().setSectionHidden(column, True)
+        fileTreeView.setUniformRowHeights(True)
+        fileTreeView.header().hide()
+        fileTreeView.collapsed.connect(fileModel.unload)
 
         fileExplorerLayout = QVBoxLayout()
         fileExplorerLayout.addWidget(fileTreeView)
@@ -264,6 +680,12 @@ class CodeEditor(QMainWindow):
         self.fileModel = fileModel
         self.fileTreeView = fileTreeView
 
+        # Reading the directory starts once the window has been painted
+        QTimer.singleShot(0, lambda: self.populateFileExplorer(os.getcwd()))
+
+    def populateFileExplorer(self, root_path):
+        self.fileModel.setRootPath(root_path)
+
     def newFile(self):
         new_file_name, ok = QInputDialog.getText(self, "New File", "Enter the name of the new file (with extension):",
                                                  QLineEdit.Normal, "")
@@ -273,8 +695,13 @@ class CodeEditor(QMainWindow):
             with open(new_file_path, 'w') as file:
                 file.write("")
 
-            self.current_file_path = new_file_path
-            self.textEdit.clear()
+            tab = self.reusableTab() or self.createTab()
+            tab.file_path = new_file_path
+            tab.highlighter = tab.highlighters.attach(tab.document(), new_file_path)
+            self.openJournal(tab, recover=False)
+            self.watchFile(tab)
+            self.updateTabTitle(tab)
+            self.outlinePanel.refresh()
 
     def openFile(self):
         options = QFileDialog.Options()
@@ -286,54 +713,449 @@ class CodeEditor(QMainWindow):
         if file_name:
             self.loadFile(file_name)
 
+    def createTab(self, file_path=None):
+        tab = DocumentTab(file_path)
+        tab.setFont(self.editorFont)
+        tab.setTabStopWidth(4 * tab.fontMetrics().width(' '))
+        tab.document().modificationChanged.connect(lambda modified, tab=tab: self.updateTabTitle(tab))
+
+        self.tabWidget.addTab(tab, self.tabTitle(tab))
+        self.tabWidget.setCurrentWidget(tab)
+        return tab
+
+    def reusableTab(self):
+        """The current tab if it is an untouched, untitled document."""
+        tab = self.textEdit
+        if (tab is not None and tab.file_path is None and not tab.isLoading()
+                and not tab.document().isModified() and tab.document().isEmpty()):
+            return tab
+        return None
+
+    def findTab(self, file_path):
+        for index in range(self.tabWidget.count()):
+            widget = self.tabWidget.widget(index)
+            if widget.file_path and os.path.abspath(widget.file_path) == os.path.abspath(file_path):
+                return widget
+        return None
+
+    def tabTitle(self, widget):
+        title = os.path.basename(widget.file_path) if widget.file_path else 'Untitled'
+        if isinstance(widget, DocumentTab) and widget.document().isModified():
+            title += ' *'
+        return title
+
+    def updateTabTitle(self, widget):
+        index = self.tabWidget.indexOf(widget)
+        if index == -1:
+            return
+        self.tabWidget.setTabText(index, self.tabTitle(widget))
+        self.tabWidget.setTabToolTip(index, widget.file_path or '')
+        if widget is self.tabWidget.currentWidget():
+            self.setWindowModified(isinstance(widget, DocumentTab) and widget.document().isModified())
+
+    def onCurrentTabChanged(self, index):
+        widget = self.tabWidget.widget(index)
+        if widget is None:
+            self.findBar.setEditor(None)
+            self.outlinePanel.setEditor(None)
+            return
+
+        if isinstance(widget, DocumentTab):
+            self.documentCache.touch(widget)
+            if widget.unloaded and not widget.isLoading():
+                self.startLoading(widget)
+            self.enforceMemoryBudget()
+
+        self.findBar.setEditor(self.textEdit)
+        self.outlinePanel.setEditor(self.textEdit)
+        self.updateTabTitle(widget)
+        self.updateLoadIndicator()
+
+    def closeTab(self, index):
+        widget = self.tabWidget.widget(index)
+        if widget is None:
+            return
+
+        if isinstance(widget, DocumentTab):
+            if widget.document().isModified():
+                reply = QMessageBox.question(self, 'Unsaved Changes',
+                                             f'Save changes to {self.tabTitle(widget).rstrip(" *")} before closing?',
+                                             QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel,
+                                             QMessageBox.Save)
+                if reply == QMessageBox.Cancel:
+                    return
+                if reply == QMessageBox.Save and not self.saveTab(widget):
+                    return
+
+            if widget.isLoading():
+                loader = widget.documentLoader
+                widget.documentLoader = None
+                loader.cancel()
+                loader.wait()
+            if not self.waitForSaves(widget):
+                return  # The save failed; keep the tab so the work is not lost
+
+            if widget.fileReloader is not None:
+                widget.fileReloader.wait()
+            if widget.file_path:
+                self.unwatchFile(widget.file_path)
+            widget.discardJournal()
+            widget.highlighters.detach()
+            self.documentCache.remove(widget)
+        else:
+            widget.closeFile()
+
+        self.tabWidget.removeTab(index)
+        widget.deleteLater()
+
+        if self.tabWidget.count() == 0:
+            self.createTab()
+
+    def undo(self):
+        if self.textEdit is not None:
+            self.textEdit.undo()
+
+    def redo(self):
+        if self.textEdit is not None:
+            self.textEdit.redo()
+
+    def isViewingLargeFile(self):
+        return isinstance(self.tabWidget.currentWidget(), LargeFileViewer)
+
+    def openLargeFile(self, file_name):
+        viewer = LargeFileViewer()
+        viewer.textView.setFont(self.editorFont)
+        # Its lines are indexed on a worker thread; the tab shows them once that is done
+        timing = diagnostics.begin('open', file_name)
+        viewer.progressChanged.connect(lambda value, viewer=viewer: self.onLoadProgress(viewer, value))
+        viewer.opened.connect(lambda viewer=viewer, timing=timing: self.onLargeFileOpened(viewer, timing))
+        viewer.openFailed.connect(lambda message, viewer=viewer, timing=timing:
+                                  self.onLargeFileFailed(viewer, message, timing))
+        viewer.openFile(file_name)
+
+        self.tabWidget.addTab(viewer, self.tabTitle(viewer))
+        self.tabWidget.setCurrentWidget(viewer)
+        self.loadProgressBar.setValue(0)
+        self.updateLoadIndicator()
+        self.statusBar().showMessage(f"Indexing {os.path.basename(file_name)}...")
+
+    def onLargeFileOpened(self, viewer, timing):
+        diagnostics.end(timing)
+        self.updateLoadIndicator()
+        if viewer is self.tabWidget.currentWidget():
+            self.statusBar().showMessage(f"Large file opened read-only ({viewer.lineCount()} lines)")
+
+    def onLargeFileFailed(self, viewer, message, timing):
+        diagnostics.end(timing, ok=False)
+        index = self.tabWidget.indexOf(viewer)
+        if index != -1:
+            self.tabWidget.removeTab(index)
+            viewer.deleteLater()
+            if self.tabWidget.count() == 0:
+                self.createTab()
+        self.updateLoadIndicator()
+        QMessageBox.critical(self, "Error", f"Failed to open the file: {message}")
+
+    def goToLine(self):
+        viewer = self.tabWidget.currentWidget()
+        if self.isViewingLargeFile():
+            if viewer.isLoading():
+                self.statusBar().showMessage("The file is still being indexed")
+                return
+            line_count = viewer.lineCount()
+        else:
+            line_count = self.textEdit.document().blockCount()
+
+        line, ok = QInputDialog.getInt(self, "Go to Line", f"Line number (1-{line_count}):", 1, 1, line_count)
+        if not ok:
+            return
+
+        if self.isViewingLargeFile():
+            viewer.goToLine(line)
+        else:
+            self.moveToLine(self.textEdit, line)
+
+    def moveToLine(self, tab, line):
+        cursor = QTextCursor(tab.document().findBlockByNumber(line - 1))
+        tab.setTextCursor(cursor)
+        tab.centerCursor()
+
+    def openFileAtLine(self, file_name, line):
+        self.loadFile(file_name)
+        widget = self.findTab(file_name)
+        if isinstance(widget, LargeFileViewer):
+            widget.goToLine(line)
+        elif widget is not None:
+            if widget.isLoading():
+                widget.pendingLine = line  # Applied once the text is in
+            else:
+                self.moveToLine(widget, line)
+            widget.setFocus()
+
     def loadFile(self, file_name):
-        with open(file_name, 'r') as file:
-            self.textEdit.setPlainText(file.read())
-            self.current_file_path = file_name
-
-        _, file_extension = os.path.splitext(file_name)
-        if file_extension == '.py':
-            self.highlighter = PythonHighlighter(self.textEdit.document())
-        elif file_extension == '.html':
-            self.highlighter = HtmlHighlighter(self.textEdit.document())
+        existing = self.findTab(file_name)
+        if existing is not None:
+            self.tabWidget.setCurrentWidget(existing)  # Reloads it if it was unloaded
+            return
+
+        try:
+            size = os.path.getsize(file_name)
+        except OSError as e:  # Such as a stale quick-open or search result
+            QMessageBox.critical(self, "Error", f"Failed to open the file: {e}")
+            return
+        if size > self.large_file_bytes:
+            self.openLargeFile(file_name)
+            return
+
+        tab = self.reusableTab() or self.createTab()
+        tab.file_path = file_name
+        self.updateTabTitle(tab)
+        self.startLoading(tab)
+
+    def startLoading(self, tab):
+        # Attach to the emptied document so the text is highlighted once, by the right
+        # language, and large files are left to the background pass
+        try:
+            size = os.path.getsize(tab.file_path)
+        except OSError as e:  # Deleted or moved while the tab was unloaded
+            self.onLoadFailed(tab, str(e))
+            return
+        tab.highlighters.detach()
+        tab.clear()
+        tab.highlighter = tab.highlighters.attach(tab.document(), tab.file_path, size)
+
+        # Read on a worker thread; the tab stays read-only until every chunk is in
+        tab.setReadOnly(True)
+        tab.documentLoader = DocumentLoader(tab.document(), tab.file_path, parent=tab)
+        tab.documentLoader.progressChanged.connect(lambda value, tab=tab: self.onLoadProgress(tab, value))
+        tab.documentLoader.loaded.connect(lambda tab=tab: self.onLoadFinished(tab))
+        tab.documentLoader.loadFailed.connect(lambda message, tab=tab: self.onLoadFailed(tab, message))
+
+        self.loadProgressBar.setValue(0)
+        self.updateLoadIndicator()
+        self.statusBar().showMessage(f"Loading {os.path.basename(tab.file_path)}...")
+        tab.documentLoader.start()
+
+    def onLoadProgress(self, tab, value):
+        if tab is self.tabWidget.currentWidget():
+            self.loadProgressBar.setValue(value)
+
+    def onLoadFailed(self, tab, message):
+        tab.documentLoader = None
+        tab.pendingLine = None
+        tab.setReadOnly(False)
+        tab.highlighters.detach()
+        tab.clear()
+        tab.document().setModified(False)
+        tab.file_path = None
+        tab.unloaded = False
+        self.updateTabTitle(tab)
+        self.updateLoadIndicator()
+        QMessageBox.critical(self, "Error", f"Failed to open the file: {message}")
+
+    def onLoadFinished(self, tab):
+        tab.documentLoader = None
+        tab.setReadOnly(False)
+        reloaded = tab.unloaded  # Its journal was discarded along with the text, which was saved
+        if tab.unloaded:
+            # Put the cursor and scroll position back where they were before unloading
+            position, scroll = tab.savedPosition
+            cursor = tab.textCursor()
+            cursor.setPosition(min(position, tab.document().characterCount() - 1))
+            tab.setTextCursor(cursor)
+            tab.verticalScrollBar().setValue(scroll)
+            tab.unloaded = False
+        else:
+            tab.moveCursor(QTextCursor.Start)
+        if tab.pendingLine is not None:
+            self.moveToLine(tab, tab.pendingLine)
+            tab.pendingLine = None
+        tab.document().setModified(False)
+        self.openJournal(tab, recover=not reloaded)
+        self.watchFile(tab)
+        tab.highlighters.start()
+
+        self.updateLoadIndicator()
+        if tab is self.textEdit:
+            self.statusBar().clearMessage()
+        self.enforceMemoryBudget()
+
+    def openJournal(self, tab, recover=True):
+        """
+        Start journalling the tab's edits. With recover, edits journalled for
+        its file by a session that crashed are offered back first.
+        """
+        records = readJournal(tab.file_path) if recover else None
+        if records:
+            reply = QMessageBox.question(self, 'Recover Unsaved Changes',
+                                         f'{os.path.basename(tab.file_path)} has unsaved changes from a session '
+                                         f'that did not close properly. Recover them?',
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply != QMessageBox.Yes:
+                records = None
+        if records:
+            replayJournal(tab.document(), records)
         else:
-            self.highlighter = None
+            self.journalWriter.remove(journalPath(tab.file_path))
+
+        try:
+            tab.journal = EditJournal(tab.document(), tab.file_path, self.journalWriter, parent=tab)
+        except OSError:
+            return  # The file is gone, so there is no base for the edits to apply to
+        if records:
+            tab.journal.resume(records)
+
+    def enforceMemoryBudget(self):
+        for tab in self.documentCache.enforce(self.tabWidget.currentWidget()):
+            self.updateTabTitle(tab)
+
+    def updateLoadIndicator(self):
+        widget = self.tabWidget.currentWidget()
+        loading = widget is not None and widget.isLoading()
+        self.loadProgressBar.setVisible(loading)
+        self.cancelLoadButton.setVisible(loading)
+
+    def cancelLoading(self):
+        widget = self.tabWidget.currentWidget()
+        if isinstance(widget, LargeFileViewer) and widget.isLoading():
+            self.closeTab(self.tabWidget.indexOf(widget))
+            self.statusBar().showMessage("Loading cancelled")
+            return
+        tab = self.textEdit
+        if tab is None or not tab.isLoading():
+            return
+        tab.documentLoader.cancel()
+        tab.documentLoader = None
+        tab.pendingLine = None
+        tab.setReadOnly(False)
+        tab.highlighters.detach()
+        tab.clear()
+        tab.document().setModified(False)
+        if not tab.unloaded:
+            tab.file_path = None  # An unloaded tab keeps its file and loads again when shown
+        self.updateTabTitle(tab)
+        self.updateLoadIndicator()
+        self.statusBar().showMessage("Loading cancelled")
+
+    def isLoading(self):
+        return self.textEdit is not None and self.textEdit.isLoading()
 
     def saveFile(self):
-        if self.current_file_path:
-            with open(self.current_file_path, 'w') as file:
-                file.write(self.textEdit.toPlainText())
+        if self.isViewingLargeFile():
+            self.statusBar().showMessage("Large files are opened read-only")
         else:
-            self.saveFileAs()
+            self.saveTab(self.textEdit)
 
     def saveFileAs(self):
+        if self.isViewingLargeFile():
+            self.statusBar().showMessage("Large files are opened read-only")
+        else:
+            self.saveTabAs(self.textEdit)
+
+    def saveTab(self, tab):
+        """Start saving tab to its file, asking for a name if it has none; returns False if not saved."""
+        if tab.isLoading():
+            self.statusBar().showMessage("The file is still loading")
+            return False
+        if tab.file_path:
+            self.writeFile(tab, tab.file_path)
+            return True
+        return self.saveTabAs(tab)
+
+    def saveTabAs(self, tab):
+        if tab.isLoading():
+            self.statusBar().showMessage("The file is still loading")
+            return False
+
         options = QFileDialog.Options()
         options |= QFileDialog.ReadOnly
         file_name, _ = QFileDialog.getSaveFileName(self, "Save File", "",
                                                    "Python Files (*.py);;HTML Files (*.html);;Text Files (*.txt);;All Files (*)",
                                                    options=options)
 
-        if file_name:
-            with open(file_name, 'w') as file:
-                file.write(self.textEdit.toPlainText())
-            self.current_file_path = file_name
+        if not file_name:
+            return False
+        if tab.file_path:
+            self.unwatchFile(tab.file_path)  # Watched again under the new name once saved
+        tab.file_path = file_name
+        self.updateTabTitle(tab)
+        if tab is self.textEdit:
+            self.outlinePanel.refresh()  # The outline depends on the file's type
+        self.writeFile(tab, file_name)
+        return True
+
+    def writeFile(self, tab, file_name):
+        """Save the tab's document to file_name on a worker thread; returns the FileSaver, or None if queued."""
+        if tab.fileSaver is not None:
+            # One save at a time, so an older snapshot can never land after a newer one
+            tab.pendingSave = file_name
+            return None
+
+        # The document counts as clean from the snapshot on; edits made while it is
+        # written mark it modified again, and a failed save restores the flag
+        if tab.journal is not None:
+            tab.journal.beginSave()
+        saver = FileSaver(file_name, tab.toPlainText(), parent=tab)
+        tab.fileSaver = saver
+        tab.document().setModified(False)
+        saver.saved.connect(lambda file_name, tab=tab: self.onFileSaved(tab, file_name))
+        saver.saveFailed.connect(lambda file_name, message, tab=tab: self.onSaveFailed(tab, message))
+        saver.finished.connect(lambda tab=tab, saver=saver: self.onSaveFinished(tab, saver))
+        saver.finished.connect(saver.deleteLater)
+        self.statusBar().showMessage(f"Saving {os.path.basename(file_name)}...")
+        saver.start()
+        return saver
+
+    def onFileSaved(self, tab, file_name):
+        self.statusBar().showMessage(f"Saved {os.path.basename(file_name)}", 3000)
+        if self.tabWidget.indexOf(tab) == -1:
+            return  # Closed while saving; its journal is gone
+        self.watchFile(tab)
+        if tab.journal is not None:
+            tab.journal.saveFinished(file_name, True)
+        else:
+            self.openJournal(tab, recover=False)  # First save of an untitled document
+
+    def onJournalWriteFailed(self, message):
+        self.statusBar().showMessage(f"Failed to write the edit journal, so unsaved changes may not be "
+                                     f"recoverable after a crash: {message}")
+
+    def onSaveFailed(self, tab, message):
+        if tab.journal is not None:
+            tab.journal.saveFinished(None, False)
+        tab.document().setModified(True)
+        QMessageBox.critical(self, "Error", f"Failed to save the file: {message}")
+
+    def onSaveFinished(self, tab, saver):
+        if tab.fileSaver is not saver:
+            return  # Already collected by waitForSaves()
+        tab.fileSaver = None
+        if tab.pendingSave is not None:
+            file_name, tab.pendingSave = tab.pendingSave, None
+            self.writeFile(tab, file_name)
+
+    def waitForSaves(self, tab):
+        """Finish the tab's running and queued saves; returns False if one failed."""
+        while tab.fileSaver is not None:
+            saver = tab.fileSaver
+            saver.wait()
+            if saver.error is not None:
+                tab.document().setModified(True)
+                return False
+            tab.fileSaver = None
+            if tab.pendingSave is not None:
+                file_name, tab.pendingSave = tab.pendingSave, None
+                self.writeFile(tab, file_name)
+        return True
+
+    def documentTabs(self):
+        return [self.tabWidget.widget(index) for index in range(self.tabWidget.count())
+                if isinstance(self.tabWidget.widget(index), DocumentTab)]
 
     def openFileFromExplorer(self, index: QModelIndex):
-        self.current_file_path = self.fileModel.filePath(index)
-        if os.path.isfile(self.current_file_path):
-            _, file_extension = os.path.splitext(self.current_file_path)
-            if file_extension == '.py':
-                with open(self.current_file_path, 'r') as file:
-                    self.textEdit.setPlainText(file.read())
-                self.highlighter = PythonHighlighter(self.textEdit.document())
-            elif file_extension == '.html':
-                with open(self.current_file_path, 'r') as file:
-                    self.textEdit.setPlainText(file.read())
-                self.highlighter = HtmlHighlighter(self.textEdit.document())
-            else:
-                self.highlighter = None
-                with open(self.current_file_path, 'r') as file:
-                    self.textEdit.setPlainText(file.read())
+        file_path = self.fileModel.filePath(index)
+        if os.path.isfile(file_path):
+            self.loadFile(file_path)
 
     def showContextMenu(self, pos):
         index = self.fileTreeView.indexAt(pos)
@@ -401,30 +1223,67 @@ class CodeEditor(QMainWindow):
                 file.write("")
 
     def closeEvent(self, event):
-        if self.current_file_path:
-            with open(self.current_file_path, 'r') as file:
-                file_content = file.read()
-
-            if self.textEdit.toPlainText() != file_content:
-                reply = QMessageBox.question(self, 'Unsaved Changes',
-                                             'You have unsaved changes. Do you want to save before exiting?',
-                                             QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel,
-                                             QMessageBox.Save)
-
-                if reply == QMessageBox.Save:
-                    self.saveFile()
-                elif reply == QMessageBox.Cancel:
-                    event.ignore()  # The application will not be closed
-                    return
-                # If the user chooses Discard, the application will close without saving.
-
+        tabs = self.documentTabs()
+        for tab in tabs:
+            if tab.isLoading():
+                # Nothing has been edited yet; stop the reader before the window goes away
+                loader = tab.documentLoader
+                tab.documentLoader = None
+                loader.cancel()
+                loader.wait()
+            if not self.waitForSaves(tab):
+                event.ignore()  # A save failed; keep the window open so the work is not lost
+                return
+
+        unsaved = [tab for tab in tabs if tab.file_path and tab.document().isModified()]
+        if unsaved:
+            reply = QMessageBox.question(self, 'Unsaved Changes',
+                                         'You have unsaved changes. Do you want to save before exiting?',
+                                         QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel,
+                                         QMessageBox.Save)
+
+            if reply == QMessageBox.Save:
+                for tab in unsaved:
+                    self.writeFile(tab, tab.file_path)
+                    if not self.waitForSaves(tab):
+                        event.ignore()
+                        return
+            elif reply == QMessageBox.Cancel:
+                event.ignore()  # The application will not be closed
+                return
+            # If the user chooses Discard, the application will close without saving.
+
+        # Everything was saved or deliberately discarded
+        self.reloadTimer.stop()
+        for tab in tabs:
+            if tab.fileReloader is not None:
+                tab.fileReloader.wait()
+            tab.discardJournal()
+        self.journalWriter.shutdown()
+
+        for index in range(self.tabWidget.count()):
+            widget = self.tabWidget.widget(index)
+            if isinstance(widget, LargeFileViewer):
+                widget.closeFile()  # Stops its indexer
+        if self.terminalWidget is not None:
+            self.terminalWidget.shutdown()
+        self.findBar.shutdown()
+        self.findInFilesPanel.shutdown()
+        self.projectIndexer.shutdown()
+        self.quickOpenDialog.shutdown()
+        self.pathIndexer.shutdown()
+        self.outlinePanel.shutdown()
+        diagnostics.setEnabled(False)
         event.accept()  #
 
 
 def excepthook(exc_type, exc_value, traceback):
     """
-    Global exception handler to display an error dialog.
+    Global exception handler to display an error dialog. Pending edits are
+    written to the journals first, so they can be recovered if the editor
+    does not survive.
     """
+    flushJournals()
     QMessageBox.critical(None, "Unhandled Exception",
                          f"An unhandled exception occurred:\n{exc_type.__name__}: {exc_value}")
     print(f"An unhandled exception occurred:\n{exc_type.__name__}: {exc_value}")
@@ -434,10 +1293,24 @@ def excepthook(exc_type, exc_value, traceback):
 sys.excepthook = excepthook
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description='Knoblauch Baguette Editor')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print how long each startup phase takes')
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help='hide matching entries from the file explorer (.gitignore syntax); repeatable')
+    parser.add_argument('--diagnostics', action='store_true',
+                        help='record event-loop stalls, highlighter rule timings and load/save times')
+    args, qt_args = parser.parse_known_args()
+
+    profile = StartupProfile(startup_started, enabled=args.profile_startup)
+    profile.mark('imports')
+
+    app = QApplication(sys.argv[:1] + qt_args)
 
     # Enable anti-aliasing for the entire application
     app.setAttribute(Qt.AA_EnableHighDpiScaling)
 
-    editor = CodeEditor()
+    editor = CodeEditor(profile, DEFAULT_EXCLUDES + args.exclude)
+    if args.diagnostics:
+        editor.showDiagnostics()
     sys.exit(app.exec_())
@@ -0,0 +1,234 @@
+import ast
+import hashlib
+import os
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QWidget, QLabel, QTreeWidget, QTreeWidgetItem, QVBoxLayout
+
+
+# Files with an outline
+OUTLINE_EXTENSIONS = ('.py', '.pyw')
+# Delay after the last edit before the document is parsed again
+PARSE_DELAY_MS = 500
+# Outlines kept by content hash, so returning to an unchanged file shows its outline at once
+CACHE_SIZE = 64
+
+
+def collectSymbols(node, depth, in_class, symbols):
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, ast.ClassDef):
+            symbols.append((depth, 'class', child.name, child.lineno))
+            collectSymbols(child, depth + 1, True, symbols)
+        elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append((depth, 'method' if in_class else 'function', child.name, child.lineno))
+            collectSymbols(child, depth + 1, False, symbols)
+        elif isinstance(child, (ast.stmt, ast.excepthandler)) or type(child).__name__ == 'match_case':
+            # Definitions under if, try, with and the like belong to the enclosing scope
+            collectSymbols(child, depth, in_class, symbols)
+
+
+def parseOutline(text):
+    """
+    Worker process: the classes, functions and methods defined in Python
+    source as (depth, kind, name, line) tuples, in file order, and an error
+    message, which is set (with no symbols) when the source does not parse.
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError) as e:
+        line = getattr(e, 'lineno', None)
+        return None, f'Line {line}: {e.msg}' if line else str(e)
+    symbols = []
+    collectSymbols(tree, 0, False, symbols)
+    return symbols, None
+
+
+def hasOutline(file_path):
+    return bool(file_path) and os.path.splitext(file_path)[1].lower() in OUTLINE_EXTENSIONS
+
+
+class OutlineParser(QObject):
+    """
+    Parses documents with parseOutline() in a worker process, one at a time.
+
+    A request that has not started yet is dropped when a newer one arrives.
+    Results come back through parsed, tagged with the request number.
+    """
+
+    parsed = pyqtSignal(int, object, object)  # Request, symbols or None, error message or None
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = None
+        self.future = None
+
+    def parse(self, request, text):
+        if self.pool is None:
+            self.startPool()
+        if self.future is not None:
+            self.future.cancel()
+        try:
+            self.future = self.pool.submit(parseOutline, text)
+        except RuntimeError:  # The worker process died; start another
+            self.startPool()
+            self.future = self.pool.submit(parseOutline, text)
+        self.future.add_done_callback(lambda future, request=request: self.onDone(request, future))
+
+    def startPool(self):
+        # Imported here, off the startup path; spawn rather than fork, as forking
+        # a process that runs Qt threads is unsafe
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import get_context
+        self.pool = ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn'))
+
+    def onDone(self, request, future):
+        # Called on an executor thread; the signal is queued to the GUI thread
+        if future.cancelled():
+            return
+        try:
+            symbols, error = future.result()
+        except Exception as e:  # Such as a RecursionError, or the worker process dying
+            symbols, error = None, str(e) or type(e).__name__
+        self.parsed.emit(request, symbols, error)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+class OutlinePanel(QWidget):
+    """
+    Classes, functions and methods of the current Python file.
+
+    The document is parsed in the background once typing pauses. Outlines
+    are cached by a hash of the text, and a result is dropped if the
+    document changed after the snapshot it was parsed from.
+    """
+
+    symbolActivated = pyqtSignal(int)  # Line number (1-based)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.editor = None
+        self.symbols = []  # Outline shown, as from parseOutline()
+        self.symbolsEditor = None  # Editor the outline shown belongs to
+        self.cache = OrderedDict()  # Content hash -> (symbols, error)
+        self.request = 0  # Number of the latest parse request
+        self.requestDigest = None  # Content hash of the text the latest request parses
+
+        self.parser = OutlineParser(self)
+        self.parser.parsed.connect(self.onParsed)
+
+        self.statusLabel = QLabel()
+        self.symbolTree = QTreeWidget()
+        self.symbolTree.setHeaderHidden(True)
+        self.symbolTree.itemActivated.connect(self.onItemActivated)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.statusLabel)
+        layout.addWidget(self.symbolTree)
+
+        self.parseTimer = QTimer(self)
+        self.parseTimer.setSingleShot(True)
+        self.parseTimer.setInterval(PARSE_DELAY_MS)
+        self.parseTimer.timeout.connect(self.refresh)
+
+    def setEditor(self, editor):
+        if editor is self.editor:
+            return
+        if self.editor is not None:
+            self.editor.document().contentsChange.disconnect(self.onDocumentChanged)
+        self.editor = editor
+        if editor is not None:
+            editor.document().contentsChange.connect(self.onDocumentChanged)
+        self.refresh()
+
+    def onDocumentChanged(self):
+        self.request += 1  # Whatever is being parsed is now out of date
+        self.parseTimer.start()
+
+    def refresh(self):
+        self.parseTimer.stop()
+        editor = self.editor
+        if editor is None or not hasOutline(editor.file_path):
+            self.request += 1
+            self.showSymbols([], 'No outline for this file')
+            return
+        if editor.isLoading():
+            self.parseTimer.start()
+            return
+
+        text = editor.toPlainText()
+        digest = hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+        cached = self.cache.get(digest)
+        self.request += 1
+        if cached is not None:
+            self.cache.move_to_end(digest)
+            self.showSymbols(*cached)
+            return
+
+        self.requestDigest = digest
+        self.statusLabel.setText('Parsing...')
+        self.parser.parse(self.request, text)
+
+    def onParsed(self, request, symbols, error):
+        if request != self.request:
+            return  # The document changed, or another tab was shown, since the snapshot
+        self.cache[self.requestDigest] = (symbols, error)
+        if len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last=False)
+        self.showSymbols(symbols, error)
+
+    def showSymbols(self, symbols, error=None):
+        """Fill the tree; on a syntax error the editor's last good outline stays up."""
+        if symbols is None:
+            if self.symbolsEditor is not self.editor:
+                self.showSymbols([])
+            self.statusLabel.setText(f'{error} (outline may be out of date)')
+            return
+        self.statusLabel.setText(error or f'{len(symbols)} symbols')
+        self.symbolsEditor = self.editor
+        if symbols == self.symbols and self.symbolTree.topLevelItemCount():
+            return
+        self.symbols = symbols
+
+        self.symbolTree.setUpdatesEnabled(False)
+        self.symbolTree.clear()
+        parents = []
+        for depth, kind, name, line in symbols:
+            del parents[depth:]
+            label = f'class {name}' if kind == 'class' else f'def {name}'
+            if parents:
+                item = QTreeWidgetItem(parents[-1], [label])
+            else:
+                item = QTreeWidgetItem(self.symbolTree, [label])
+            item.setData(0, Qt.UserRole, line)
+            item.setToolTip(0, f'{kind} {name}, line {line}')
+            parents.append(item)
+        self.symbolTree.expandAll()
+        self.symbolTree.setUpdatesEnabled(True)
+
+    def onItemActivated(self, item):
+        self.symbolActivated.emit(item.data(0, Qt.UserRole))
+
+    def definitionLine(self, name, line=None):
+        """
+        Line where name is defined in the current outline, or None. With
+        several definitions, the last one at or before line is preferred.
+        """
+        if self.symbolsEditor is not self.editor:
+            return None  # The current editor has not been parsed yet
+        lines = [symbol_line for _, _, symbol_name, symbol_line in self.symbols if symbol_name == name]
+        if not lines:
+            return None
+        if line is not None:
+            before = [symbol_line for symbol_line in lines if symbol_line <= line]
+            if before:
+                return before[-1]
+        return lines[0]
+
+    def shutdown(self):
+        self.parseTimer.stop()
+        self.parser.shutdown()
@@ -1,71 +1,173 @@
-from PyQt5.QtCore import Qt, QRegularExpression
-from PyQt5.QtGui import QTextCharFormat, QTextCursor, QSyntaxHighlighter, QFont
+import re
 
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QTextCharFormat, QFont
+
+from background_highlighter import DeferrableHighlighter
+from diagnostics import ProfiledExpression
+
+
+KEYWORDS = [
+    'False', 'None', 'True', 'and', 'as', 'assert', 'async', 'await', 'break',
+    'class', 'continue', 'del', 'def', 'elif', 'else', 'except', 'finally', 'for',
+    'from', 'global', 'if', 'import', 'in', 'is', 'lambda', 'nonlocal', 'not',
+    'or', 'pass', 'raise', 'return', 'try', 'while', 'with', 'yield', 'self'
+]
+
+# A string prefix (r, b, f, rb, ...) only counts at the start of a word
+PREFIX = r"""(?:(?<!\w)[rRbBuUfF]{1,2})?"""
+# Bodies of triple-quoted strings; a backslash escapes the next character, even in raw strings
+SINGLE_TRIPLE_BODY = r"""(?:[^'\\]|\\.|'(?!''))*"""
+DOUBLE_TRIPLE_BODY = r"""(?:[^"\\]|\\.|"(?!""))*"""
+
+# One alternation scanned left to right. At any position the earliest
+# alternative wins, so strings and comments swallow keywords inside them.
+# Group numbers are used as token kinds (see re.Match.lastindex). It is a
+# Python expression so each block is searched as one str: a
+# QRegularExpression converts the whole line again on every match call.
+TRIPLE_STRING, TRIPLE_OPEN, STRING, COMMENT, KEYWORD, FUNCTION = range(1, 7)
+
+TOKEN_EXPRESSION = re.compile(
+    r"""(""" + PREFIX + r"""(?:'''""" + SINGLE_TRIPLE_BODY + r"""'''|\"\"\"""" + DOUBLE_TRIPLE_BODY + r"""\"\"\"))"""
+    # 1: triple-quoted string on one line
+    r"""|(""" + PREFIX + r"""(?:'''|\"\"\"))"""                     # 2: opens a multi-line string
+    r"""|(""" + PREFIX + r"""(?:"[^"\\]*(?:\\.[^"\\]*)*(?:"|$)|'[^'\\]*(?:\\.[^'\\]*)*(?:'|$)))"""  # 3: string
+    r"""|(#.*)"""                                                   # 4: comment
+    r"""|\b(""" + '|'.join(KEYWORDS) + r""")\b"""                   # 5: keyword
+    r"""|\b(\w+)\b(?=\s*\()"""                                      # 6: function call
+)
+# Closing delimiter of a multi-line string, by the delimiter that opened it
+SINGLE_TRIPLE, DOUBLE_TRIPLE = 1, 2
+TRIPLE_END_EXPRESSIONS = {
+    SINGLE_TRIPLE: re.compile(r"""^""" + SINGLE_TRIPLE_BODY + r"""'''"""),
+    DOUBLE_TRIPLE: re.compile(r"""^""" + DOUBLE_TRIPLE_BODY + r"""\"\"\""""),
+}
+# Rule number of the TRIPLE_END_EXPRESSIONS in a RuleProfile, after the token kinds
+TRIPLE_END = 7
+
+# Block states hold the string still open at the end of the block: its
+# delimiter and prefix flags. Nothing else goes in, so an edit only changes
+# the states it really affects and Qt stops rehighlighting at the first
+# block after it whose state comes out unchanged.
+DELIMITER_MASK = 0b11
+RAW, BYTES, FORMAT = 0b100, 0b1000, 0b10000
+STRING_MASK = 0b11111
+
+
+def openString(state):
+    """Delimiter and prefix flags of the string open at the end of a block with state, or 0."""
+    return state & STRING_MASK if state >= 0 else 0
+
+
+def stringOpenedBy(token):
+    """Open-string bits for a triple-quote token with its prefix, such as rb'''."""
+    prefix = token[:-3].lower()
+    string = SINGLE_TRIPLE if token.endswith("'''") else DOUBLE_TRIPLE
+    if 'r' in prefix:
+        string |= RAW
+    if 'b' in prefix:
+        string |= BYTES
+    if 'f' in prefix:
+        string |= FORMAT
+    return string
+
+
+class PythonHighlighter(DeferrableHighlighter):
+    # Built once per process and shared by every instance, indexed by token kind
+    tokenFormats = None
+
+    RULE_NAMES = ['no match', 'triple-quoted string', 'multi-line string start', 'string', 'comment', 'keyword',
+                  'function call', 'multi-line string end']
 
-class PythonHighlighter(QSyntaxHighlighter):
     def __init__(self, parent):
         super().__init__(parent)
 
+        if PythonHighlighter.tokenFormats is None:
+            PythonHighlighter.tokenFormats = self.createFormats()
+        self.multiLineCommentFormat = self.tokenFormats[TRIPLE_OPEN]
+        self.setRuleProfile(None)
+
+    def setRuleProfile(self, profile):
+        if profile is None:
+            self.tokenExpression = TOKEN_EXPRESSION
+            self.tripleEndExpressions = TRIPLE_END_EXPRESSIONS
+        else:
+            self.tokenExpression = ProfiledExpression(TOKEN_EXPRESSION, profile)
+            self.tripleEndExpressions = {delimiter: ProfiledExpression(expression, profile, TRIPLE_END)
+                                         for delimiter, expression in TRIPLE_END_EXPRESSIONS.items()}
+
+    @staticmethod
+    def createFormats():
         keywordFormat = QTextCharFormat()
         keywordFormat.setForeground(Qt.darkYellow)
         keywordFormat.setFontWeight(QFont.Bold)
 
-        keywords = [
-            'False', 'None', 'True', 'and', 'as', 'assert', 'async', 'await', 'break',
-            'class', 'continue', 'del', 'def', 'elif', 'else', 'except', 'finally', 'for',
-            'from', 'global', 'if', 'import', 'in', 'is', 'lambda', 'nonlocal', 'not',
-            'or', 'pass', 'raise', 'return', 'try', 'while', 'with', 'yield', 'self'
-        ]
-
-        self.highlightingRules = [(QRegularExpression(r'\b' + keyword + r'\b'), keywordFormat) for keyword in keywords]
-
         quotationFormat = QTextCharFormat()
         quotationFormat.setForeground(Qt.darkGreen)
-        self.highlightingRules.append((QRegularExpression(r'".*?"'), quotationFormat))
-        self.highlightingRules.append((QRegularExpression(r"'.*?'"), quotationFormat))
 
         functionFormat = QTextCharFormat()
         functionFormat.setForeground(Qt.magenta)
-        self.highlightingRules.append((QRegularExpression(r'\b\w+\b(?=\s*\()'), functionFormat))
 
         singleLineCommentFormat = QTextCharFormat()
         singleLineCommentFormat.setForeground(Qt.gray)
-        self.highlightingRules.append((QRegularExpression(r'#.*'), singleLineCommentFormat))
 
-        self.multiLineCommentFormat = QTextCharFormat()
-        self.multiLineCommentFormat.setForeground(Qt.gray)
+        multiLineCommentFormat = QTextCharFormat()
+        multiLineCommentFormat.setForeground(Qt.gray)
 
-        self.commentStartExpression = QRegularExpression(r"'''|\"\"\"")
-        self.commentEndExpression = QRegularExpression(r"'''|\"\"\"")
+        return [
+            None,
+            multiLineCommentFormat,
+            multiLineCommentFormat,
+            quotationFormat,
+            singleLineCommentFormat,
+            keywordFormat,
+            functionFormat,
+        ]
 
     def highlightBlock(self, text):
-        for pattern, format in self.highlightingRules:
-            expression = QRegularExpression(pattern)
-            match = expression.match(text)
-            while match.hasMatch():
-                start = match.capturedStart()
-                length = match.capturedLength()
-                self.setFormat(start, length, format)
-                match = expression.match(text, start + length)
-
-        self.setCurrentBlockState(0)
-
-        if self.previousBlockState() != 1:
-            start_comment = self.commentStartExpression.match(text)
-            if start_comment.hasMatch():
-                self.setCurrentBlockState(1)
-                start = start_comment.capturedStart()
-                end = start_comment.capturedEnd()
-                self.setFormat(start, end - start, self.multiLineCommentFormat)
-                start = end
-            else:
-                start = 0
-
-            while True:
-                comment = self.commentEndExpression.match(text, start)
-                if not comment.hasMatch():
-                    break
-                end = comment.capturedStart()
-                commentLength = comment.capturedLength()
-                self.setFormat(start, end - start + commentLength, self.multiLineCommentFormat)
-                start = end + commentLength
+        if self.isDeferred():
+            return
+
+        # Lexing works on str indices; Qt offsets are UTF-16 code units, which
+        # differ only after characters outside the Basic Multilingual Plane
+        self.offsets = None
+        if len(text.encode('utf-16-le')) // 2 != len(text):
+            self.offsets = [0]
+            for character in text:
+                self.offsets.append(self.offsets[-1] + (2 if ord(character) > 0xFFFF else 1))
+        length = len(text)
+        start = 0
+
+        string = openString(self.previousBlockState())
+        if string:
+            # Still inside a multi-line string: skip to its closing delimiter
+            end = self.tripleEndExpressions[string & DELIMITER_MASK].search(text)
+            if end is None:
+                self.formatToken(0, length, self.multiLineCommentFormat)
+                self.setCurrentBlockState(string)
+                return
+            start = end.end()
+            self.formatToken(0, start, self.multiLineCommentFormat)
+            string = 0
+
+        while start < length:
+            match = self.tokenExpression.search(text, start)
+            if match is None:
+                break
+
+            kind = match.lastindex
+            tokenStart, tokenEnd = match.span(kind)
+            if kind == TRIPLE_OPEN:
+                self.formatToken(tokenStart, length, self.multiLineCommentFormat)
+                string = stringOpenedBy(match.group(kind))
+                break
+
+            self.formatToken(tokenStart, tokenEnd, self.tokenFormats[kind])
+            start = match.end()
+
+        self.setCurrentBlockState(string)
+
+    def formatToken(self, start, end, format):
+        if self.offsets is not None:
+            start, end = self.offsets[start], self.offsets[end]
+        self.setFormat(start, end - start, format)
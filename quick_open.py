@@ -0,0 +1,424 @@
+import bisect
+import os
+import re
+import threading
+
+from PyQt5.QtCore import Qt, QEvent, QObject, QThread, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QDialog, QLineEdit, QListWidget, QListWidgetItem, QVBoxLayout
+
+from file_explorer import IgnoreRules, DEFAULT_EXCLUDES
+
+
+# Paths matched against a query before the scan stops; the index is sorted
+# shortest first, so the best candidates for a broad query come early
+MAX_CANDIDATES = 1000
+MAX_RESULTS = 50
+# Delay before changed directories are rescanned, so a burst of events is handled once
+CHANGE_DELAY_MS = 500
+# Characters that start a word in a path
+SEPARATORS = '/\\_-. '
+
+
+def subsequenceExpression(query):
+    """
+    Finds the lines of a lowercase, newline-separated path list that contain
+    the characters of query in order, at most once per line. The leading
+    literal lets the regex engine skip ahead to its occurrences, and each later
+    step skips only characters that cannot be the next one, so matching from
+    one starting point never backtracks.
+    """
+    parts = [re.escape(query[0])]
+    for character in query[1:]:
+        escaped = re.escape(character)
+        parts.append(f'[^{escaped}\\n]*{escaped}')
+    return re.compile(''.join(parts) + '[^\\n]*')
+
+
+def fuzzyScore(query, path):
+    """How well path matches the lowercase query; higher is better."""
+    lower = path.lower()
+    name_start = max(lower.rfind('/'), lower.rfind('\\')) + 1
+
+    # A match inside the file name beats one spread over the directories
+    start = name_start if isSubsequence(query, lower, name_start) else 0
+    score = 100 if start else 0
+    if lower.startswith(query, name_start):
+        score += 200
+
+    position = start
+    previous = -2
+    for character in query:
+        position = lower.find(character, position)
+        if position == previous + 1:
+            score += 15  # Consecutive
+        if position == 0 or lower[position - 1] in SEPARATORS or path[position:position + 1].isupper():
+            score += 10  # Start of a word
+        previous = position
+        position += 1
+    return score - len(path) // 4
+
+
+def joinPaths(paths):
+    """The lowercase paths joined by newlines, and the offset of each in that text."""
+    lowered = [path.lower() for path in paths]
+    starts = []
+    offset = 0
+    for path in lowered:
+        starts.append(offset)
+        offset += len(path) + 1
+    return starts, '\n'.join(lowered)
+
+
+def isSubsequence(query, text, start=0):
+    for character in query:
+        start = text.find(character, start)
+        if start == -1:
+            return False
+        start += 1
+    return True
+
+
+class PathIndex:
+    """
+    Relative paths of every file under root that is not ignored, kept per
+    directory so a changed directory can be rescanned on its own.
+
+    snapshot() returns the paths sorted shortest first together with a
+    lowercase, newline-joined copy for matching. All methods are safe to call
+    from several threads.
+    """
+
+    def __init__(self, root, excludes=DEFAULT_EXCLUDES):
+        self.root = os.path.abspath(root)
+        self.rules = IgnoreRules(self.root, excludes)
+        self.lock = threading.Lock()
+        self.directories = {}  # Directory -> names of the files directly in it
+        self.version = 0
+        self.cached = None  # Snapshot of the current version
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(names) for names in self.directories.values())
+
+    def scanDirectory(self, directory):
+        """Names of the files directly in directory, and its subdirectories, minus ignored entries."""
+        files = []
+        subdirectories = []
+        chain = self.rules.chainFor(directory)
+        try:
+            with os.scandir(directory) as iterator:
+                for entry in iterator:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if self.rules.isIgnored(entry.path, is_dir, chain):
+                        continue
+                    if is_dir:
+                        subdirectories.append(entry.path)
+                    else:
+                        files.append(entry.name)
+        except OSError:
+            pass
+        return files, subdirectories
+
+    def walk(self, directory, cancelled=None):
+        """Scan directory and everything under it; returns the files found per directory."""
+        found = {}
+        pending = [directory]
+        while pending:
+            if cancelled and cancelled():
+                break
+            current = pending.pop()
+            found[current], subdirectories = self.scanDirectory(current)
+            pending += subdirectories
+        return found
+
+    def build(self, cancelled=None):
+        found = self.walk(self.root, cancelled)
+        if cancelled and cancelled():
+            return
+        with self.lock:
+            self.directories = found
+            self.version += 1
+
+    def updateDirectory(self, directory):
+        """
+        Rescan one directory after a change, walking subdirectories that are
+        new to the index. Directories the index does not hold are skipped:
+        the watcher also reports ignored ones, such as build/, and a new
+        directory is walked when its parent is rescanned.
+        """
+        with self.lock:
+            if directory not in self.directories:
+                return
+        if not os.path.isdir(directory):
+            found = {}
+        else:
+            files, subdirectories = self.scanDirectory(directory)
+            found = {directory: files}
+            with self.lock:
+                new = [subdirectory for subdirectory in subdirectories if subdirectory not in self.directories]
+            for subdirectory in new:
+                found.update(self.walk(subdirectory))
+
+        with self.lock:
+            if os.path.isdir(directory):
+                # Subdirectories removed or moved away, with everything under them
+                gone = [path for path in self.directories
+                        if os.path.dirname(path) == directory and path not in found and path != directory]
+            else:
+                gone = [directory]
+            for removed in gone:
+                prefix = os.path.join(removed, '')
+                for path in [path for path in self.directories if path == removed or path.startswith(prefix)]:
+                    del self.directories[path]
+            self.directories.update(found)
+            self.version += 1
+
+    def snapshot(self):
+        """(version, paths, starts, text): paths shortest first, text the lowercase paths joined by newlines, starts their offsets in it."""
+        with self.lock:
+            if self.cached is not None and self.cached[0] == self.version:
+                return self.cached
+            version = self.version
+            paths = [os.path.relpath(os.path.join(directory, name), self.root)
+                     for directory, names in self.directories.items() for name in names]
+
+        paths.sort(key=lambda path: (len(path), path))
+        snapshot = (version, paths, *joinPaths(paths))
+
+        with self.lock:
+            if self.version == version:
+                self.cached = snapshot
+        return snapshot
+
+
+class PathIndexBuilder(QThread):
+    """Builds the PathIndex, or rescans the given directories, on a worker thread."""
+
+    def __init__(self, index, directories=None, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.directories = directories
+
+    def run(self):
+        if self.directories is None:
+            self.index.build(cancelled=self.isInterruptionRequested)
+        else:
+            for directory in self.directories:
+                if self.isInterruptionRequested():
+                    return
+                self.index.updateDirectory(directory)
+        self.index.snapshot()  # Ready before the next query needs it
+
+
+class PathIndexer(QObject):
+    """
+    Keeps a PathIndex of a project current: built once in the background,
+    then updated as the directories reported by watcher change.
+    """
+
+    indexUpdated = pyqtSignal()
+
+    def __init__(self, root, watcher, excludes=DEFAULT_EXCLUDES, parent=None):
+        super().__init__(parent)
+        self.index = PathIndex(root, excludes)
+        self.ready = False
+        self.builder = None
+        self.dirty_directories = set()
+
+        watcher.directoryChanged.connect(self.onDirectoryChanged)
+
+        self.changeTimer = QTimer(self)
+        self.changeTimer.setSingleShot(True)
+        self.changeTimer.setInterval(CHANGE_DELAY_MS)
+        self.changeTimer.timeout.connect(self.startBuilder)
+
+    def start(self):
+        self.startBuilder(full=True)
+
+    def onDirectoryChanged(self, directory):
+        self.dirty_directories.add(directory)
+        self.changeTimer.start()
+
+    def startBuilder(self, full=False):
+        if self.builder is not None:
+            return  # Picked up again when the running builder finishes
+        if full:
+            directories = None
+        elif self.dirty_directories and self.ready:
+            directories = sorted(self.dirty_directories)
+            self.dirty_directories = set()
+        else:
+            return
+
+        self.builder = PathIndexBuilder(self.index, directories, parent=self)
+        self.builder.finished.connect(self.onBuilderFinished)
+        self.builder.start()
+
+    def onBuilderFinished(self):
+        builder = self.builder
+        self.builder = None
+        builder.deleteLater()
+        if builder.isInterruptionRequested():
+            return
+        self.ready = True
+        self.indexUpdated.emit()
+        self.startBuilder()
+
+    def shutdown(self):
+        self.changeTimer.stop()
+        if self.builder is not None:
+            self.builder.requestInterruption()
+            self.builder.wait()
+
+
+class RankWorker(QThread):
+    """
+    Ranks the indexed paths against a query on a worker thread.
+
+    A regular expression over the joined path list finds the candidates at C
+    speed; only those are scored in Python. When the query extends the previous
+    one and that search was complete, only its candidates are searched again.
+    """
+
+    resultsReady = pyqtSignal(str, list)  # Query, relative paths best first
+
+    def __init__(self, index, query, previous=None, parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.query = query
+        self.previous = previous  # (query, version, candidates, complete) of the last search
+        self.candidates = None
+        self.complete = False
+        self.version = None
+
+    def run(self):
+        query = self.query.lower()
+        version, paths, starts, text = self.index.snapshot()
+        self.version = version
+
+        previous = self.previous
+        if (previous is not None and previous[1] == version and previous[3]
+                and query.startswith(previous[0]) and previous[0]):
+            paths = previous[2]
+            starts, text = joinPaths(paths)
+
+        candidates = []
+        complete = True
+        for match in subsequenceExpression(query).finditer(text):
+            if self.isInterruptionRequested():
+                return
+            candidates.append(paths[bisect.bisect_right(starts, match.start()) - 1])
+            if len(candidates) >= MAX_CANDIDATES:
+                complete = False
+                break
+        self.candidates = candidates
+        self.complete = complete
+
+        ranked = sorted(candidates, key=lambda path: fuzzyScore(query, path), reverse=True)
+        self.resultsReady.emit(self.query, ranked[:MAX_RESULTS])
+
+
+class QuickOpenDialog(QDialog):
+    """Ctrl+P palette: type part of a path and open the best match."""
+
+    fileChosen = pyqtSignal(str)  # Absolute path
+
+    def __init__(self, indexer, parent=None):
+        super().__init__(parent, Qt.Popup)
+        self.indexer = indexer
+        self.worker = None
+        self.previous = None  # (query, version, candidates, complete) of the last finished search
+
+        self.queryEdit = QLineEdit(self)
+        self.queryEdit.setPlaceholderText('Go to file')
+        self.queryEdit.textChanged.connect(self.startRanking)
+        self.queryEdit.installEventFilter(self)
+
+        self.resultList = QListWidget(self)
+        self.resultList.itemActivated.connect(self.openItem)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addWidget(self.queryEdit)
+        layout.addWidget(self.resultList)
+
+        self.indexer.indexUpdated.connect(self.onIndexUpdated)
+
+    def popup(self):
+        window = self.parentWidget()
+        width = max(300, window.width() // 2)
+        self.resize(width, 320)
+        # Centred near the top of the window, like a command palette
+        top = window.mapToGlobal(window.rect().topLeft())
+        self.move(top.x() + (window.width() - width) // 2, top.y() + 40)
+        self.queryEdit.clear()
+        self.resultList.clear()
+        self.show()
+        self.queryEdit.setFocus()
+        if not self.indexer.ready:
+            self.resultList.addItem('Indexing files...')
+
+    def eventFilter(self, obj, event):
+        if obj is self.queryEdit and event.type() == QEvent.KeyPress:
+            if event.key() in (Qt.Key_Down, Qt.Key_Up, Qt.Key_PageDown, Qt.Key_PageUp):
+                self.resultList.keyPressEvent(event)
+                return True
+            if event.key() in (Qt.Key_Return, Qt.Key_Enter):
+                self.openItem(self.resultList.currentItem())
+                return True
+        return super().eventFilter(obj, event)
+
+    def startRanking(self):
+        self.cancelRanking()
+        query = self.queryEdit.text().strip()
+        if not query:
+            self.resultList.clear()
+            return
+        self.worker = RankWorker(self.indexer.index, query, self.previous, parent=self)
+        self.worker.resultsReady.connect(self.showResults)
+        self.worker.finished.connect(lambda worker=self.worker: self.onRankingFinished(worker))
+        self.worker.start()
+
+    def cancelRanking(self):
+        if self.worker is not None:
+            # The worker deletes itself once it notices; results it already sent are ignored
+            self.worker.requestInterruption()
+            self.worker.resultsReady.disconnect()
+            self.worker = None
+
+    def showResults(self, query, paths):
+        self.resultList.clear()
+        for path in paths:
+            item = QListWidgetItem(path)
+            item.setToolTip(path)
+            item.setData(Qt.UserRole, os.path.join(self.indexer.index.root, path))
+            self.resultList.addItem(item)
+        if paths:
+            self.resultList.setCurrentRow(0)
+
+    def onRankingFinished(self, worker):
+        if worker is self.worker:
+            self.worker = None
+            self.previous = (worker.query.lower(), worker.version, worker.candidates, worker.complete)
+        worker.deleteLater()
+
+    def onIndexUpdated(self):
+        self.previous = None
+        if self.isVisible():
+            self.startRanking()
+
+    def openItem(self, item):
+        path = item.data(Qt.UserRole) if item is not None else None
+        if not path:
+            return
+        self.hide()
+        self.fileChosen.emit(path)
+
+    def shutdown(self):
+        if self.worker is not None:
+            worker = self.worker
+            self.cancelRanking()
+            worker.wait()
@@ -0,0 +1,49 @@
+import sys
+import time
+
+from PyQt5.QtCore import QObject, QEvent
+
+
+class StartupProfile(QObject):
+    """
+    Per-phase timing of application startup, printed by --profile-startup.
+
+    mark() closes the current phase; the last phase ends with the first paint
+    of the watched widget, after which the report is printed.
+    """
+
+    def __init__(self, started, enabled=True, stream=None):
+        super().__init__()
+        self.enabled = enabled
+        self.stream = stream or sys.stderr
+        self.started = started
+        self.last = started
+        self.phases = []
+        self.painted = False
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def watchFirstPaint(self, widget):
+        if self.enabled:
+            widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and not self.painted:
+            self.painted = True
+            obj.removeEventFilter(self)
+            self.mark('first paint')
+            self.report()
+        return False
+
+    def report(self):
+        width = max(len(phase) for phase, _ in self.phases)
+        print('Startup profile:', file=self.stream)
+        for phase, seconds in self.phases:
+            print(f'  {phase:<{width}}  {seconds * 1000:8.1f} ms', file=self.stream)
+        total = self.last - self.started
+        print(f'  {"total":<{width}}  {total * 1000:8.1f} ms', file=self.stream)
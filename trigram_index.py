@@ -0,0 +1,291 @@
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+import threading
+
+try:
+    import re._parser as sre_parse
+    from re._constants import LITERAL
+except ImportError:  # Python < 3.11
+    import sre_parse
+    from sre_constants import LITERAL
+
+
+# Bump when the on-disk format changes; older index files are ignored
+INDEX_VERSION = 1
+# Larger files are not indexed or searched
+MAX_INDEXED_BYTES = 1024 * 1024
+# Directories never indexed
+EXCLUDED_DIRECTORIES = {'.git', '.hg', '.svn', 'node_modules', '__pycache__', '.venv', 'venv', '.tox',
+                        '.mypy_cache', '.pytest_cache', '.ruff_cache'}
+
+
+def indexCachePath(root):
+    """Where the index of the project at root is stored."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    digest = hashlib.sha1(os.path.abspath(root).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_home, 'knoblauch_editor', f'trigrams-{digest}.idx')
+
+
+def trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def readText(path):
+    """Decoded contents of path, or None for unreadable, binary or oversized files."""
+    try:
+        with open(path, 'rb') as file:
+            data = file.read(MAX_INDEXED_BYTES + 1)
+    except OSError:
+        return None
+    if len(data) > MAX_INDEXED_BYTES or b'\0' in data[:8192]:
+        return None
+    return data.decode('utf-8', errors='replace')
+
+
+def extractTrigrams(path):
+    """Process pool worker: the trigrams of one file, or None if it is not indexable."""
+    text = readText(path)
+    return path, (trigrams(text) if text is not None else None)
+
+
+def queryTrigrams(pattern, regex):
+    """
+    Trigrams every match of pattern must contain. An empty set means the
+    index cannot narrow the search and every file has to be scanned.
+    """
+    if not regex:
+        return trigrams(pattern)
+
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return set()
+
+    # Only runs of literals at the top level are certain to appear in a match
+    result = set()
+    run = ''
+    for op, value in list(parsed) + [(None, None)]:
+        if op == LITERAL:
+            run += chr(value)
+        else:
+            result |= trigrams(run)
+            run = ''
+    return result
+
+
+def scanDirectory(directory):
+    """(path, mtime_ns, size) of the files directly in directory, and its subdirectories."""
+    files = []
+    subdirectories = []
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return files, subdirectories
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in EXCLUDED_DIRECTORIES:
+                    subdirectories.append(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                if stat.st_size <= MAX_INDEXED_BYTES:
+                    files.append((entry.path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            continue
+    return files, subdirectories
+
+
+def walkProject(root):
+    """(path, mtime_ns, size) of every file under root that may be indexed, and the directories visited."""
+    files = []
+    directories = []
+    for directory, subdirectories, names in os.walk(root):
+        subdirectories[:] = [name for name in subdirectories if name not in EXCLUDED_DIRECTORIES]
+        directories.append(directory)
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size <= MAX_INDEXED_BYTES:
+                files.append((path, stat.st_mtime_ns, stat.st_size))
+    return files, directories
+
+
+class TrigramIndex:
+    """
+    Maps each lowercase trigram to the ids of the files that contain it.
+
+    Removed or changed files keep stale ids in the posting sets until
+    compact() runs; a file gets a fresh id whenever it is re-indexed.
+    All methods are safe to call from several threads.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.lock = threading.Lock()
+        self.files = {}  # path -> (mtime_ns, size, id)
+        self.paths = {}  # id -> path, live files only
+        self.postings = {}  # trigram -> set of ids
+        self.next_id = 0
+        self.stale_ids = 0
+
+    @classmethod
+    def load(cls, root, cache_path=None):
+        index = cls(root)
+        try:
+            with open(cache_path or indexCachePath(root), 'rb') as file:
+                data = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return index
+        if data.get('version') == INDEX_VERSION and data.get('root') == index.root:
+            index.files = data['files']
+            index.postings = data['postings']
+            index.next_id = data['next_id']
+            index.stale_ids = data['stale_ids']
+            index.paths = {file_id: path for path, (_, _, file_id) in index.files.items()}
+        return index
+
+    def save(self, cache_path=None):
+        cache_path = cache_path or indexCachePath(self.root)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with self.lock:
+            data = pickle.dumps({
+                'version': INDEX_VERSION, 'root': self.root, 'files': self.files,
+                'postings': self.postings, 'next_id': self.next_id, 'stale_ids': self.stale_ids,
+            }, protocol=pickle.HIGHEST_PROTOCOL)
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self.paths)
+
+    def changedFiles(self, found, under=None):
+        """
+        Compare the files found on disk with the index.
+
+        Returns the paths to (re)index and the indexed paths that are gone.
+        `under` limits the removed paths to one directory (non-recursive).
+        """
+        with self.lock:
+            changed = [path for path, mtime, size in found
+                       if self.files.get(path, (None, None))[:2] != (mtime, size)]
+            present = {path for path, _, _ in found}
+            if under is None:
+                removed = [path for path in self.files if path not in present]
+            else:
+                removed = [path for path in self.files
+                           if os.path.dirname(path) == under and path not in present]
+        return changed, removed
+
+    def pathsUnder(self, directory):
+        prefix = os.path.join(directory, '')
+        with self.lock:
+            return [path for path in self.files if path.startswith(prefix)]
+
+    def update(self, path, mtime, size, file_trigrams):
+        with self.lock:
+            self.removeLocked(path)
+            if file_trigrams is None:
+                return
+            file_id = self.next_id
+            self.next_id += 1
+            self.files[path] = (mtime, size, file_id)
+            self.paths[file_id] = path
+            for trigram in file_trigrams:
+                posting = self.postings.get(trigram)
+                if posting is None:
+                    self.postings[trigram] = {file_id}
+                else:
+                    posting.add(file_id)
+
+    def remove(self, path):
+        with self.lock:
+            self.removeLocked(path)
+
+    def removeLocked(self, path):
+        entry = self.files.pop(path, None)
+        if entry is not None:
+            del self.paths[entry[2]]
+            self.stale_ids += 1
+
+    def needsCompaction(self):
+        return self.stale_ids > max(1000, len(self.paths))
+
+    def compact(self):
+        with self.lock:
+            live = set(self.paths)
+            postings = {}
+            for trigram, ids in self.postings.items():
+                ids = ids & live
+                if ids:
+                    postings[trigram] = ids
+            self.postings = postings
+            self.stale_ids = 0
+
+    def candidates(self, required_trigrams):
+        """Paths of the files that contain every trigram in required_trigrams."""
+        with self.lock:
+            if not required_trigrams:
+                return sorted(self.paths.values())
+            postings = []
+            for trigram in required_trigrams:
+                posting = self.postings.get(trigram)
+                if not posting:
+                    return []
+                postings.append(posting)
+            postings.sort(key=len)
+            ids = set(postings[0])
+            for posting in postings[1:]:
+                ids &= posting
+                if not ids:
+                    return []
+            return sorted(self.paths[file_id] for file_id in ids if file_id in self.paths)
+
+    def indexFiles(self, found, workers=None, progress=None, cancelled=None):
+        """
+        Index the (path, mtime_ns, size) entries in found using a process pool.
+
+        progress(done, total) is called as files complete; cancelled() is polled
+        between results and stops the run early when it returns True.
+        """
+        if not found:
+            return
+        stats = {path: (mtime, size) for path, mtime, size in found}
+
+        if len(found) < 64:
+            # Not worth starting worker processes
+            results = map(extractTrigrams, stats)
+            for done, (path, file_trigrams) in enumerate(results, 1):
+                self.update(path, *stats[path], file_trigrams)
+                if progress:
+                    progress(done, len(found))
+            return
+
+        # Imported here, off the startup path; spawn rather than fork, as forking
+        # a process that runs Qt threads is unsafe
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import get_context
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+            results = pool.map(extractTrigrams, stats, chunksize=32)
+            for done, (path, file_trigrams) in enumerate(results, 1):
+                self.update(path, *stats[path], file_trigrams)
+                if progress:
+                    progress(done, len(found))
+                if cancelled and cancelled():
+                    pool.shutdown(cancel_futures=True)
+                    return